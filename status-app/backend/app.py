@@ -1,25 +1,385 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response, g, has_request_context, send_from_directory
 from flask_cors import CORS
 from flask_migrate import Migrate
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, get_jwt
+from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt, current_user, decode_token
 from flask_socketio import SocketIO, emit, join_room, leave_room
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
-from models import db, User, Organization, Service, Incident, IncidentUpdate, StatusChange
+from models import db, User, Organization, Service, ServiceCheck, Incident, IncidentUpdate, StatusChange, Subscriber
+from cache import SnapshotCache, VersionRegistry
+from compression import CompressedCache
+from broadcast import Broadcaster
+from passwords import hasher
+from metrics import registry, instrument_engine
+from replicas import ReplicaRouter, replica_reads
+from static_pages import StaticPages
+from sse import EventStreams, Listener
+from ratelimit import RateLimiter
+from pubsub import INTERNAL_EVENT, INTERNAL_ROOM, create_client_manager
+import notifications
+import outbound
+import prober
+import retention
+import rollups
+import serializers
+from pagination import DEFAULT_LIMIT, PaginationError, next_page, paginate, parse_limit, filter_time_range
+from sqlalchemy import event, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from collections import namedtuple
+from functools import wraps
 from datetime import datetime, timedelta
+import asyncio
+import contextvars
+import itertools
 import re
+import time
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # Initialize extensions
 db.init_app(app)
+replica_router = ReplicaRouter(app)
+# SQL statements of a request served outside Flask (asgi.py's native
+# routes), as a one-item list; Flask requests count in g.sql_queries
+native_request_queries = contextvars.ContextVar('native_request_queries', default=None)
+
+def count_request_queries(engine):
+    """Count the statements engine runs for the current request"""
+    @event.listens_for(engine, 'after_cursor_execute')
+    def count_request_query(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            g.sql_queries = g.get('sql_queries', 0) + 1
+        else:
+            counter = native_request_queries.get()
+            if counter is not None:
+                counter[0] += 1
+
+with app.app_context():
+    instrument_engine(db.engine, slow_query_ms=app.config['DB_SLOW_QUERY_MS'])
+    count_request_queries(db.engine)
+    for bind_key in replica_router.bind_keys:
+        instrument_engine(db.engines[bind_key], name=bind_key, slow_query_ms=app.config['DB_SLOW_QUERY_MS'])
+        count_request_queries(db.engines[bind_key])
+        replica_router.watch(bind_key, db.engines[bind_key])
 migrate = Migrate(app, db)
+limiter = RateLimiter(app)
 jwt = JWTManager(app)
-CORS(app, origins=["http://localhost:5173", "http://localhost:5174"])
-socketio = SocketIO(app, cors_allowed_origins=["http://localhost:5173", "http://localhost:5174"])
+CORS(app, origins=app.config['CORS_ORIGINS'], expose_headers=['X-Next-Cursor'])
+
+# With a message queue, several workers share Socket.IO rooms and exchange
+# cache invalidations over the same queue
+message_queue = app.config['SOCKETIO_MESSAGE_QUEUE']
+client_manager = None
+if message_queue:
+    client_manager = create_client_manager(
+        message_queue,
+        channel=app.config['SOCKETIO_CHANNEL'],
+        queue_folder=app.config['SOCKETIO_QUEUE_FOLDER']
+    )
+    socketio = SocketIO(app, cors_allowed_origins=app.config['CORS_ORIGINS'], client_manager=client_manager,
+                        async_mode=app.config['SOCKETIO_ASYNC_MODE'])
+else:
+    socketio = SocketIO(app, cors_allowed_origins=app.config['CORS_ORIGINS'], async_mode=app.config['SOCKETIO_ASYNC_MODE'])
+hasher.init_app(app, async_mode=socketio.async_mode)
+
+def unbuffered_event_streams(wsgi_app):
+    """eventlet.wsgi holds writes back until 4 KB are buffered, which would
+    delay events; it has to be told before Flask-SocketIO's middleware, since
+    Flask only gets a copy of the environ"""
+    def middleware(environ, start_response):
+        if environ.get('PATH_INFO', '').endswith('/events'):
+            environ['eventlet.minimum_write_chunk_size'] = 0
+        return wsgi_app(environ, start_response)
+    return middleware
+
+app.wsgi_app = unbuffered_event_streams(app.wsgi_app)
+if app.config['TRUSTED_PROXY_COUNT']:
+    # Client address and scheme from the X-Forwarded-* headers of the proxies
+    # in front, so rate limits and METRICS_ALLOWED_IPS see the real client
+    proxies = app.config['TRUSTED_PROXY_COUNT']
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+broadcaster = Broadcaster(
+    socketio,
+    window=app.config['BROADCAST_WINDOW_MS'] / 1000.0,
+    diffs=not message_queue,
+    log_size=app.config['EVENT_BUFFER_SIZE']
+)
+status_cache = SnapshotCache(
+    max_entries=app.config['PUBLIC_STATUS_CACHE_SIZE'],
+    ttl=app.config['PUBLIC_STATUS_CACHE_TTL']
+)
+org_versions = VersionRegistry()
+# Identifies each public status snapshot build (see public_status_entry)
+snapshot_stamps = itertools.count(1)
+StatusEntry = namedtuple('StatusEntry', ['stamp', 'snapshot', 'built_at'])
+fragments = serializers.FragmentCache(max_entries=app.config['SERIALIZATION_CACHE_SIZE'])
+compressed = CompressedCache(
+    max_bytes=app.config['COMPRESSION_CACHE_BYTES'],
+    min_size=app.config['COMPRESSION_MIN_BYTES'],
+    gzip_level=app.config['COMPRESSION_GZIP_LEVEL'],
+    brotli_quality=app.config['COMPRESSION_BROTLI_QUALITY'],
+    ttl=app.config['PUBLIC_STATUS_CACHE_TTL']
+)
+static_pages = StaticPages(app, socketio, build_snapshot=lambda org_slug: public_status_snapshot(org_slug))
+event_streams = EventStreams(app)
+user_cache = SnapshotCache(
+    max_entries=app.config['USER_CACHE_SIZE'],
+    ttl=app.config['USER_CACHE_TTL']
+)
+
+# Request metrics
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route', ['method', 'route']
+)
+request_count = registry.counter('http_requests_total', 'Responses by route and status', ['method', 'route', 'status'])
+request_queries = registry.histogram(
+    'http_request_sql_queries', 'SQL statements run per request, by route', ['method', 'route'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+serialization_duration = registry.histogram(
+    'serialization_duration_seconds', 'Time spent in to_dict() for lists of rows', ['entity']
+)
+registry.gauge('socketio_rooms', 'Socket.IO rooms on this worker, by kind', ['kind'],
+               callback=lambda: [((kind,), rooms) for kind, (rooms, _) in room_counts().items()])
+registry.gauge('socketio_room_members', 'Socket.IO room memberships on this worker, by kind', ['kind'],
+               callback=lambda: [((kind,), members) for kind, (_, members) in room_counts().items()])
+registry.gauge('socketio_connected_clients', 'Socket.IO clients connected to this worker',
+               callback=lambda: [((), len(socket_room_members().get(None, ())))])
+registry.gauge('sse_listeners', 'Server-sent event streams open on this worker',
+               callback=lambda: [((), event_streams.count)])
+registry.gauge('compression_cache_bytes', 'Bytes held by the compressed response cache',
+               callback=lambda: [((), compressed.size)])
+registry.gauge('compression_cache_entries', 'Entries in the compressed response cache',
+               callback=lambda: [((), len(compressed))])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    observe_request(request.method, route, response.status_code,
+                    time.perf_counter() - g.request_started, g.get('sql_queries', 0))
+    return response
+
+def observe_request(method, route, status, elapsed, queries=None):
+    request_duration.labels(method, route).observe(elapsed)
+    request_count.labels(method, route, status).inc()
+    if queries is not None:
+        request_queries.labels(method, route).observe(queries)
+
+def to_dicts(rows, entity):
+    """[row.to_dict() for row in rows], timed per entity"""
+    start = time.perf_counter()
+    result = [row.to_dict() for row in rows]
+    serialization_duration.labels(entity).observe(time.perf_counter() - start)
+    return result
+
+def socket_room_members():
+    """Room name -> members of the default namespace on this worker"""
+    return broadcaster.socketio.server.manager.rooms.get('/', {})
+
+def room_counts():
+    """Number of rooms and room memberships per kind of room (org, public)"""
+    counts = {'org': [0, 0], 'public': [0, 0]}
+    for room, members in list(socket_room_members().items()):
+        kind = room.split('_', 1)[0] if isinstance(room, str) else None
+        if kind in counts:
+            counts[kind][0] += 1
+            counts[kind][1] += len(members)
+    return counts
+
+# Identity of the authenticated caller, resolved from JWT claims
+CurrentUser = namedtuple('CurrentUser', ['id', 'organization_id', 'org_slug', 'role'])
+
+def create_user_token(user, organization):
+    """Issue an access token carrying the claims needed to serve requests"""
+    return create_access_token(identity=str(user.id), additional_claims={
+        'organization_id': organization.id,
+        'org_slug': organization.slug,
+        'role': user.role
+    })
+
+def load_user_profile(user_id):
+    """Return the cached user/organization profile, or None for unknown users"""
+    profile = user_cache.get(user_id)
+    if profile is None:
+        user = db.session.get(User, user_id)
+        if not user:
+            return None
+        profile = user_profile(user)
+        user_cache.set(user_id, profile)
+    return profile
+
+def user_profile(user):
+    return {
+        'user': user.to_dict(),
+        'organization': user.organization.to_dict(),
+        'is_active': user.is_active
+    }
+
+@jwt.user_lookup_loader
+def user_lookup_callback(jwt_header, jwt_data):
+    return identity_from_claims(jwt_data, load_user_profile(int(jwt_data['sub'])))
+
+def identity_from_claims(jwt_data, profile):
+    user_id = int(jwt_data['sub'])
+    if profile is None or not profile['is_active']:
+        return None
+    
+    if 'organization_id' in jwt_data:
+        return CurrentUser(user_id, jwt_data['organization_id'], jwt_data['org_slug'], jwt_data['role'])
+    # Tokens issued before claims were added
+    return CurrentUser(user_id, profile['organization']['id'], profile['organization']['slug'], profile['user']['role'])
+
+@event.listens_for(User, 'after_update')
+def invalidate_cached_user(mapper, connection, target):
+    apply_invalidation({'kind': 'user', 'key': target.id})
+    publish_invalidation({'kind': 'user', 'key': target.id})
+
+def mark_org_changed(org_slug):
+    """Bump the organization's version, drop its cached public snapshot and
+    regenerate its static page (only the worker that made the write does)"""
+    apply_invalidation({'kind': 'org', 'key': org_slug})
+    publish_invalidation({'kind': 'org', 'key': org_slug})
+    static_pages.mark_dirty(org_slug)
+
+def apply_invalidation(message):
+    if message['kind'] == 'org':
+        replica_router.note_write(message['key'])
+        org_versions.bump(message['key'])
+        status_cache.invalidate(message['key'])
+    elif message['kind'] == 'user':
+        user_cache.invalidate(message['key'])
+
+def publish_invalidation(message):
+    """Tell the other workers to apply an invalidation"""
+    if client_manager is not None:
+        socketio.emit(INTERNAL_EVENT, message, to=INTERNAL_ROOM)
+
+if client_manager is not None:
+    client_manager.on_internal_message = apply_invalidation
+
+def stream_room_message(message):
+    """Hand a broadcast that came through the message queue to the event
+    streams; data is the (payload, position) pair emitted by the Broadcaster"""
+    data = message.get('data')
+    room = message.get('room')
+    if isinstance(room, str) and isinstance(data, (list, tuple)) and data:
+        try:
+            event_streams.publish(room, message['event'], data[0])
+        except Exception:
+            app.logger.exception('Publishing %s to the event streams failed', message['event'])
+
+# With a message queue every broadcast, this worker's own included, arrives
+# through the queue; otherwise the streams take events straight from the
+# Broadcaster
+if client_manager is not None:
+    client_manager.on_room_message = stream_room_message
+else:
+    broadcaster.listeners.append(event_streams.publish)
+
+def listen_to_message_queue():
+    """python-socketio only starts reading the message queue when the first
+    Socket.IO client connects; a worker serving only event streams needs it
+    too"""
+    server = socketio.server
+    if client_manager is not None and not server.manager_initialized:
+        server.manager_initialized = True
+        server.manager.initialize()
+
+@limiter.key_function('user')
+def login_email():
+    """The account a login attempt is for, to slow down guessing its password"""
+    email = (request.get_json(silent=True) or {}).get('email')
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+def replica_read(view):
+    """Serve a read-only view from a replica when one is usable.
+
+    Apply below jwt_required so the organization is known; public views
+    take it from their org_slug argument.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        org_slug = kwargs.get('org_slug') or current_user.org_slug
+        g.replica_bind = replica_router.choose(db.engines, org_slug)
+        replica_reads.labels(g.replica_bind or 'primary').inc()
+        return view(*args, **kwargs)
+    return wrapper
+
+def conditional_response(version_key, build_response, weak=False, entry=None):
+    """Answer 304 when the client already has the current version.
+
+    build_response is only called on a miss, so a matching request costs no
+    queries and no serialization. Responses sent in several content encodings
+    use a weak ETag, shared by all of them. A response built from a cached
+    snapshot passes its StatusEntry, whose stamp and build time go into the
+    validators, so a rebuilt snapshot never matches an older one.
+    """
+    etag, last_modified = org_versions.etag(version_key)
+    if entry is not None:
+        etag = f'{etag}.{entry.stamp}'
+        last_modified = max(last_modified, entry.built_at)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = bool(request.if_modified_since and request.if_modified_since.replace(tzinfo=None) >= last_modified)
+    
+    response = app.response_class(status=304) if not_modified else build_response()
+    if response.status_code in (200, 304):
+        response.set_etag(etag, weak=weak)
+        response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Authorization')
+    return response
+
+def compressed_response(key, fingerprint, build_body):
+    """JSON response of a public payload in the encoding the client accepts,
+    from the compressed response cache. fingerprint identifies the payload
+    (a snapshot stamp or organization version, read before building it);
+    build_body returns the JSON bytes on a miss, or None, and the response
+    is then None too."""
+    encoding = compressed.negotiate(request.headers.get('Accept-Encoding'))
+    cached = compressed.get(key, fingerprint, encoding)
+    if cached is None:
+        body = build_body()
+        if body is None:
+            return None
+        cached = compressed.put(key, fingerprint, encoding, body)
+    body, encoding = cached
+    response = app.response_class(body, mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+def filter_incidents(query, args):
+    """Apply since/until/status/impact/service_id query parameters"""
+    query = filter_time_range(query, Incident, args)
+    if args.get('status'):
+        query = query.filter(Incident.status.in_(args['status'].split(',')))
+    if args.get('impact'):
+        query = query.filter(Incident.impact.in_(args['impact'].split(',')))
+    service_id = parse_service_id(args)
+    if service_id is not None:
+        query = query.filter(Incident.service_id == service_id)
+    return query
+
+def parse_service_id(args):
+    if not args.get('service_id'):
+        return None
+    service_id = args.get('service_id', type=int)
+    if service_id is None:
+        raise PaginationError('service_id must be an integer')
+    return service_id
 
 # Authentication Routes
 @app.route('/api/auth/register', methods=['POST'])
+@limiter.limit('register')
 def register():
     data = request.get_json()
     
@@ -59,7 +419,7 @@ def register():
     db.session.commit()
     
     # Create access token
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_user_token(user, organization)
     
     return jsonify({
         'access_token': access_token,
@@ -68,6 +428,7 @@ def register():
     }), 201
 
 @app.route('/api/auth/login', methods=['POST'])
+@limiter.limit('login')
 def login():
     data = request.get_json()
     
@@ -77,7 +438,11 @@ def login():
     user = User.query.filter_by(email=data['email']).first()
     
     if user and user.check_password(data['password']) and user.is_active:
-        access_token = create_access_token(identity=str(user.id))
+        # Upgrade hashes made with a previous BCRYPT_LOG_ROUNDS
+        if user.password_needs_rehash():
+            user.set_password(data['password'])
+            db.session.commit()
+        access_token = create_user_token(user, user.organization)
         return jsonify({
             'access_token': access_token,
             'user': user.to_dict(),
@@ -89,32 +454,30 @@ def login():
 @app.route('/api/auth/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+    profile = load_user_profile(current_user.id)
     
     return jsonify({
-        'user': user.to_dict(),
-        'organization': user.organization.to_dict()
+        'user': profile['user'],
+        'organization': profile['organization']
     })
 
 # Service Routes
 @app.route('/api/services', methods=['GET'])
 @jwt_required()
+@replica_read
 def get_services():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_user
+    
+    def build():
+        services = Service.query.filter_by(organization_id=user.organization_id).all()
+        return jsonify(to_dicts(services, 'services'))
     
-    services = Service.query.filter_by(organization_id=user.organization_id).all()
-    return jsonify([service.to_dict() for service in services])
+    return conditional_response(user.org_slug, build)
 
 @app.route('/api/services', methods=['POST'])
 @jwt_required()
 def create_service():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_user
     data = request.get_json()
     
     if not data or 'name' not in data:
@@ -127,62 +490,323 @@ def create_service():
     )
     db.session.add(service)
     db.session.commit()
+    mark_org_changed(user.org_slug)
     
     # Emit real-time update
-    socketio.emit('service_created', service.to_dict(), to=f"org_{user.organization_id}")
+    payload = service.to_dict()
+    broadcaster.publish(f"org_{user.organization_id}", 'service', 'service_created', payload, full=True)
     
-    return jsonify(service.to_dict()), 201
+    return jsonify(payload), 201
 
 @app.route('/api/services/<int:service_id>', methods=['PUT'])
 @jwt_required()
 def update_service_status(service_id):
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_user
     
-    service = Service.query.filter_by(id=service_id, organization_id=user.organization_id).first()
+    # Lock the row so concurrent changes to one service close its status
+    # intervals one after another
+    service = Service.query.filter_by(
+        id=service_id, organization_id=user.organization_id
+    ).with_for_update().first()
     if not service:
         return jsonify({'error': 'Service not found'}), 404
     
     data = request.get_json()
     old_status = service.status
     new_status = data.get('status', service.status)
+    now = datetime.utcnow()
     
     # Record status change
     if old_status != new_status:
+        rollups.record_transitions([(service, old_status)], now, app.config['UPTIME_HOURLY_DAYS'])
         status_change = StatusChange(
             service_id=service.id,
             old_status=old_status,
             new_status=new_status,
-            changed_by=user_id
+            changed_by=user.id,
+            created_at=now
         )
         db.session.add(status_change)
     
     service.status = new_status
-    service.updated_at = datetime.utcnow()
+    service.updated_at = now
     
     db.session.commit()
+    mark_org_changed(user.org_slug)
     
     # Emit real-time update
-    socketio.emit('service_updated', service.to_dict(), to=f"org_{user.organization_id}")
-    socketio.emit('public_status_update', service.to_dict(), to=f"public_{user.organization.slug}")
+    payload = service.to_dict()
+    broadcaster.publish(f"org_{user.organization_id}", 'service', 'service_updated', payload)
+    broadcaster.publish(f"public_{user.org_slug}", 'service', 'public_status_update', payload)
+    
+    return jsonify(payload)
+
+@app.route('/api/services/bulk', methods=['PATCH'])
+@jwt_required()
+def bulk_update_service_status():
+    user = current_user
+    data = request.get_json() or {}
+    
+    requested, error = parse_bulk_items(data.get('services'), 'id', 'status')
+    if error:
+        return jsonify({'error': error}), 400
+    
+    # Locked in id order, like update_service_status, without deadlocking
+    services = Service.query.filter(
+        Service.id.in_(requested.keys()),
+        Service.organization_id == user.organization_id
+    ).order_by(Service.id).with_for_update().all()
+    missing = set(requested) - {service.id for service in services}
+    if missing:
+        return jsonify({'error': 'Service not found', 'missing_ids': sorted(missing)}), 404
+    
+    now = datetime.utcnow()
+    rollups.record_transitions([
+        (service, service.status) for service in services
+        if service.status != requested[service.id]['status']
+    ], now, app.config['UPTIME_HOURLY_DAYS'])
+    
+    status_changes = []
+    for service in services:
+        new_status = requested[service.id]['status']
+        if service.status != new_status:
+            status_changes.append({
+                'service_id': service.id,
+                'old_status': service.status,
+                'new_status': new_status,
+                'changed_by': user.id,
+                'created_at': now
+            })
+        service.status = new_status
+        service.updated_at = now
+    
+    # One multi-row INSERT for the whole batch
+    if status_changes:
+        db.session.execute(insert(StatusChange.__table__).values(status_changes))
+    payload = to_dicts(services, 'services')
+    db.session.commit()
+    mark_org_changed(user.org_slug)
+    
+    # Emit real-time update; the broadcaster sends one batch event per room
+    broadcaster.publish_many(
+        [(f"org_{user.organization_id}", 'service', 'service_updated', service_payload) for service_payload in payload] +
+        [(f"public_{user.org_slug}", 'service', 'public_status_update', service_payload) for service_payload in payload]
+    )
+    
+    return jsonify(payload)
+
+def parse_bulk_items(items, id_field, required_field):
+    """Index a bulk request body by id, returning (items_by_id, error)"""
+    if not isinstance(items, list) or not items:
+        return None, 'A non-empty list of changes is required'
+    if len(items) > app.config['BULK_UPDATE_MAX_ITEMS']:
+        return None, f"At most {app.config['BULK_UPDATE_MAX_ITEMS']} changes are allowed per request"
+    
+    by_id = {}
+    for item in items:
+        if not isinstance(item, dict) or not item.get(required_field):
+            return None, f'Each change requires {id_field} and {required_field}'
+        try:
+            by_id[int(item[id_field])] = item
+        except (KeyError, TypeError, ValueError):
+            return None, f'Each change requires {id_field} and {required_field}'
+    return by_id, None
+
+# Health Check Routes
+# Health check targets users may save (see outbound.Guard)
+probe_guard = outbound.Guard(app.config['PROBE_ALLOWED_HOSTS'])
+
+CHECK_FIELDS = ['kind', 'target', 'interval_seconds', 'timeout_seconds', 'expected_status', 'degraded_ms',
+                'failure_threshold', 'recovery_threshold', 'enabled']
+
+def find_service(service_id):
+    return Service.query.filter_by(id=service_id, organization_id=current_user.organization_id).first()
+
+@app.route('/api/services/<int:service_id>/check', methods=['GET'])
+@jwt_required()
+def get_service_check(service_id):
+    service = find_service(service_id)
+    if not service or not service.check:
+        return jsonify({'error': 'Check not found'}), 404
+    return jsonify(service.check.to_dict())
+
+@app.route('/api/services/<int:service_id>/check', methods=['PUT'])
+@jwt_required()
+def put_service_check(service_id):
+    """Create or replace the health check of a service; the prober picks it
+    up within PROBER_REFRESH_SECONDS. Admins only, since it makes the server
+    connect to any public address."""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin role required'}), 403
+    service = find_service(service_id)
+    if not service:
+        return jsonify({'error': 'Service not found'}), 404
+    
+    data = request.get_json() or {}
+    error = prober.validate_check(data, probe_guard)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    check = service.check or ServiceCheck(service_id=service.id)
+    for field in CHECK_FIELDS:
+        if field in data:
+            setattr(check, field, data[field])
+    db.session.add(check)
+    db.session.commit()
+    
+    return jsonify(check.to_dict())
+
+@app.route('/api/services/<int:service_id>/check', methods=['DELETE'])
+@jwt_required()
+def delete_service_check(service_id):
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin role required'}), 403
+    service = find_service(service_id)
+    if not service or not service.check:
+        return jsonify({'error': 'Check not found'}), 404
+    db.session.delete(service.check)
+    db.session.commit()
+    return '', 204
+
+def apply_probe_transitions(transitions):
+    """Write the status changes decided by the prober, like
+    bulk_update_service_status, and broadcast them.
+
+    transitions maps service ids to (old_status, new_status); returns the
+    new statuses that were written. Services no longer at old_status were
+    changed by hand in the meantime and are skipped.
+    """
+    with app.app_context():
+        services = Service.query.filter(Service.id.in_(transitions.keys())).order_by(Service.id).with_for_update().all()
+        changed = [(service, service.status) for service in services
+                   if service.status == transitions[service.id][0] != transitions[service.id][1]]
+        if not changed:
+            db.session.rollback()
+            return {}
+        
+        now = datetime.utcnow()
+        rollups.record_transitions(changed, now, app.config['UPTIME_HOURLY_DAYS'])
+        db.session.execute(insert(StatusChange.__table__).values([{
+            'service_id': service.id,
+            'old_status': old_status,
+            'new_status': transitions[service.id][1],
+            'changed_by': None,
+            'created_at': now
+        } for service, old_status in changed]))
+        for service, _ in changed:
+            service.status = transitions[service.id][1]
+            service.updated_at = now
+        payload = to_dicts([service for service, _ in changed], 'services')
+        org_slugs = dict(db.session.query(Organization.id, Organization.slug).filter(
+            Organization.id.in_({service.organization_id for service, _ in changed})
+        ))
+        db.session.commit()
+        
+        for org_slug in org_slugs.values():
+            mark_org_changed(org_slug)
+        # One batch event per room when a shared dependency takes many
+        # services down together
+        broadcaster.publish_many(
+            [(f"org_{service_payload['organization_id']}", 'service', 'service_updated', service_payload)
+             for service_payload in payload] +
+            [(f"public_{org_slugs[service_payload['organization_id']]}", 'service', 'public_status_update', service_payload)
+             for service_payload in payload]
+        )
+        return {service.id: transitions[service.id][1] for service, _ in changed}
+
+def create_prober():
+    return prober.Prober(
+        app,
+        apply_probe_transitions,
+        concurrency=app.config['PROBER_CONCURRENCY'],
+        refresh_interval=app.config['PROBER_REFRESH_SECONDS']
+    )
+
+# Subscriber Routes
+webhook_guard = outbound.Guard(app.config['WEBHOOK_ALLOWED_HOSTS'])
+
+@app.route('/api/subscribers', methods=['GET'])
+@jwt_required()
+def get_subscribers():
+    try:
+        subscribers, next_cursor = paginate(
+            Subscriber.query.filter_by(organization_id=current_user.organization_id), Subscriber,
+            cursor=request.args.get('cursor'),
+            limit=parse_limit(request.args.get('limit'))
+        )
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    response = jsonify(to_dicts(subscribers, 'subscribers'))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+@app.route('/api/subscribers', methods=['POST'])
+@jwt_required()
+def create_subscriber():
+    data = request.get_json() or {}
+    error = notifications.validate_subscriber(data, webhook_guard)
+    if error:
+        return jsonify({'error': error}), 400
     
-    return jsonify(service.to_dict())
+    if Subscriber.query.filter_by(organization_id=current_user.organization_id, kind=data['kind'],
+                                  target=data['target']).first():
+        return jsonify({'error': 'Subscriber already exists'}), 400
+    subscriber = Subscriber(
+        organization_id=current_user.organization_id,
+        kind=data['kind'],
+        target=data['target'],
+        secret=data.get('secret') or None
+    )
+    db.session.add(subscriber)
+    db.session.commit()
+    
+    return jsonify(subscriber.to_dict()), 201
+
+@app.route('/api/subscribers/<int:subscriber_id>', methods=['DELETE'])
+@jwt_required()
+def delete_subscriber(subscriber_id):
+    """Deactivate a subscriber; queued deliveries to it are skipped"""
+    subscriber = Subscriber.query.filter_by(id=subscriber_id, organization_id=current_user.organization_id).first()
+    if not subscriber:
+        return jsonify({'error': 'Subscriber not found'}), 404
+    subscriber.is_active = False
+    db.session.commit()
+    return '', 204
 
 # Incident Routes
 @app.route('/api/incidents', methods=['GET'])
 @jwt_required()
+@replica_read
 def get_incidents():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_user
     
-    incidents = Incident.query.filter_by(organization_id=user.organization_id).order_by(Incident.created_at.desc()).all()
-    return jsonify([incident.to_dict() for incident in incidents])
+    def build():
+        try:
+            # Read-only listing: column tuples encoded straight to JSON
+            query = filter_incidents(serializers.incident_query().filter(
+                Incident.organization_id == user.organization_id
+            ), request.args)
+            rows, next_cursor = paginate(
+                query, Incident,
+                cursor=request.args.get('cursor'),
+                limit=parse_limit(request.args.get('limit'))
+            )
+        except PaginationError as e:
+            return make_response(jsonify({'error': str(e)}), 400)
+        
+        start = time.perf_counter()
+        body = serializers.encode_incidents(rows, fragments)
+        serialization_duration.labels('incidents').observe(time.perf_counter() - start)
+        headers = {'X-Next-Cursor': next_cursor} if next_cursor else None
+        return app.response_class(body, mimetype='application/json', headers=headers)
+    
+    return conditional_response(user.org_slug, build)
 
 @app.route('/api/incidents', methods=['POST'])
 @jwt_required()
 def create_incident():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_user
     data = request.get_json()
     
     required_fields = ['title', 'service_id', 'impact']
@@ -197,22 +821,25 @@ def create_incident():
         incident_type=data.get('incident_type', 'incident'),
         service_id=data['service_id'],
         organization_id=user.organization_id,
-        created_by=user_id
+        created_by=user.id
     )
     db.session.add(incident)
+    db.session.flush()
+    notifications.enqueue(user.organization_id, 'incident_created', incident.to_dict(include_updates=False))
     db.session.commit()
+    mark_org_changed(user.org_slug)
     
     # Emit real-time update
-    socketio.emit('incident_created', incident.to_dict(), to=f"org_{user.organization_id}")
-    socketio.emit('public_incident_update', incident.to_dict(), to=f"public_{user.organization.slug}")
+    payload = incident.to_dict()
+    broadcaster.publish(f"org_{user.organization_id}", 'incident', 'incident_created', payload, full=True)
+    broadcaster.publish(f"public_{user.org_slug}", 'incident', 'public_incident_update', payload, full=True)
     
-    return jsonify(incident.to_dict()), 201
+    return jsonify(payload), 201
 
 @app.route('/api/incidents/<int:incident_id>/updates', methods=['POST'])
 @jwt_required()
 def add_incident_update(incident_id):
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = current_user
     data = request.get_json()
     
     incident = Incident.query.filter_by(id=incident_id, organization_id=user.organization_id).first()
@@ -226,7 +853,7 @@ def add_incident_update(incident_id):
         message=data['message'],
         status=data.get('status', incident.status),
         incident_id=incident_id,
-        created_by=user_id
+        created_by=user.id
     )
     
     # Update incident status if provided
@@ -236,79 +863,426 @@ def add_incident_update(incident_id):
             incident.resolved_at = datetime.utcnow()
     
     db.session.add(update)
+    db.session.flush()
+    notifications.enqueue(user.organization_id, 'incident_updated', incident.to_dict(include_updates=False), update.to_dict())
     db.session.commit()
+    mark_org_changed(user.org_slug)
     
     # Emit real-time update
-    socketio.emit('incident_updated', incident.to_dict(), to=f"org_{user.organization_id}")
-    socketio.emit('public_incident_update', incident.to_dict(), to=f"public_{user.organization.slug}")
+    payload = incident.to_dict()
+    broadcaster.publish(f"org_{user.organization_id}", 'incident', 'incident_updated', payload)
+    broadcaster.publish(f"public_{user.org_slug}", 'incident', 'public_incident_update', payload)
     
     return jsonify(update.to_dict()), 201
 
+@app.route('/api/incidents/bulk', methods=['PATCH'])
+@jwt_required()
+def bulk_add_incident_updates():
+    user = current_user
+    data = request.get_json() or {}
+    
+    requested, error = parse_bulk_items(data.get('updates'), 'incident_id', 'message')
+    if error:
+        return jsonify({'error': error}), 400
+    
+    incidents = Incident.query.filter(
+        Incident.id.in_(requested.keys()),
+        Incident.organization_id == user.organization_id
+    ).all()
+    missing = set(requested) - {incident.id for incident in incidents}
+    if missing:
+        return jsonify({'error': 'Incident not found', 'missing_ids': sorted(missing)}), 404
+    
+    now = datetime.utcnow()
+    updates = []
+    for incident in incidents:
+        item = requested[incident.id]
+        updates.append({
+            'message': item['message'],
+            'status': item.get('status', incident.status),
+            'incident_id': incident.id,
+            'created_by': user.id,
+            'created_at': now
+        })
+        
+        if item.get('status'):
+            incident.status = item['status']
+            if item['status'] == 'resolved':
+                incident.resolved_at = now
+    
+    # One multi-row INSERT for the whole batch
+    db.session.execute(insert(IncidentUpdate.__table__).values(updates))
+    for incident, incident_update in zip(incidents, updates):
+        notifications.enqueue(user.organization_id, 'incident_updated', incident.to_dict(include_updates=False),
+                              dict(incident_update, created_at=now.isoformat()))
+    db.session.commit()
+    mark_org_changed(user.org_slug)
+    
+    incidents = Incident.query.options(
+        selectinload(Incident.updates)
+    ).filter(Incident.id.in_(requested.keys())).order_by(Incident.created_at.desc()).all()
+    payload = to_dicts(incidents, 'incidents')
+    
+    # Emit real-time update; the broadcaster sends one batch event per room
+    broadcaster.publish_many(
+        [(f"org_{user.organization_id}", 'incident', 'incident_updated', incident_payload) for incident_payload in payload] +
+        [(f"public_{user.org_slug}", 'incident', 'public_incident_update', incident_payload) for incident_payload in payload]
+    )
+    
+    return jsonify(payload)
+
 # Public Routes (No auth required)
 @app.route('/api/public/<org_slug>/status', methods=['GET'])
+@limiter.limit('public')
+@replica_read
 def get_public_status(org_slug):
-    organization = Organization.query.filter_by(slug=org_slug).first()
-    if not organization:
+    try:
+        entry = public_status_entry(org_slug)
+        if entry is None:
+            return jsonify({'error': 'Organization not found'}), 404
+        
+        def build():
+            return compressed_response(('status', org_slug), entry.stamp, lambda: status_body(org_slug, entry))
+        
+        return conditional_response(org_slug, build, weak=True, entry=entry)
+    except SQLAlchemyError as e:
+        # With the database unavailable, fall back to the last rendered
+        # snapshot; it carries no ETag so clients do not keep it afterwards
+        db.session.rollback()
+        body = static_pages.read(org_slug, 'status.json')
+        if body is None:
+            raise
+        app.logger.warning('Serving the static status snapshot of %s: %s', org_slug, e)
+        response = app.response_class(body, mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+@app.route('/status/<org_slug>/', defaults={'filename': 'index.html'}, methods=['GET'])
+@app.route('/status/<org_slug>/status.json', defaults={'filename': 'status.json'}, methods=['GET'])
+@limiter.limit('public')
+def get_static_status_page(org_slug, filename):
+    """The pre-rendered public status page, rendered on the first request and
+    then served from disk without touching the database"""
+    if not static_pages.folder:
+        return jsonify({'error': 'Static pages are disabled'}), 404
+    if not static_pages.rendered(org_slug, filename) and not static_pages.render(org_slug):
         return jsonify({'error': 'Organization not found'}), 404
+    response = send_from_directory(static_pages.folder, f'{org_slug}/{filename}')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/public/<org_slug>/events', methods=['GET'])
+@limiter.limit('public')
+@replica_read
+def stream_public_events(org_slug):
+    """Server-sent events of the public room: a snapshot event (or, with a
+    Last-Event-ID that is still buffered, the events missed since), then the
+    same events and payloads as the Socket.IO room"""
+    listen_to_message_queue()
+    room = f"public_{org_slug}"
+    listener = event_streams.subscribe(room, Listener(app.config['SSE_QUEUE_SIZE'], socketio.server.eio.create_queue))
+    if listener is None:
+        return jsonify({'error': 'Too many event streams'}), 503
     
-    services = Service.query.filter_by(organization_id=organization.id).all()
-    active_incidents = Incident.query.filter_by(
-        organization_id=organization.id
-    ).filter(
-        Incident.status.in_(['investigating', 'identified', 'monitoring'])
-    ).order_by(Incident.created_at.desc()).all()
+    # Subscribed first so nothing published while catching up is lost
+    try:
+        caught_up = event_streams.resume(room, request.headers.get('Last-Event-ID'))
+        if caught_up is None:
+            seq = event_streams.events.position(room)
+            body = public_status_body(org_slug)
+            if body is None:
+                event_streams.unsubscribe(room, listener)
+                return jsonify({'error': 'Organization not found'}), 404
+            caught_up = (event_streams.snapshot(body, seq), seq)
+    except Exception:
+        event_streams.unsubscribe(room, listener)
+        raise
     
-    recent_incidents = Incident.query.filter_by(
-        organization_id=organization.id
-    ).order_by(Incident.created_at.desc()).limit(10).all()
+    response = app.response_class(event_streams.stream(listener, *caught_up), mimetype='text/event-stream')
+    response.call_on_close(lambda: event_streams.unsubscribe(room, listener))
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def public_status_body(org_slug):
+    """The public status snapshot as JSON bytes, encoded once per snapshot"""
+    entry = public_status_entry(org_slug)
+    if entry is None:
+        return None
+    return status_body(org_slug, entry)
+
+def status_body(org_slug, entry):
+    return fragments.encode(('public_status', org_slug), entry.stamp, lambda: entry.snapshot)
+
+def public_status_snapshot(org_slug):
+    """Return the cached public status snapshot, rebuilding it when stale"""
+    entry = public_status_entry(org_slug)
+    return entry.snapshot if entry is not None else None
+
+def public_status_entry(org_slug):
+    """StatusEntry of the cached public status snapshot, rebuilt when stale.
+    Every build gets a new stamp, so whatever is derived from a snapshot can
+    be keyed on its stamp and expires along with it, including after
+    PUBLIC_STATUS_CACHE_TTL when the change was made elsewhere."""
+    version, _ = org_versions.get(org_slug)
+    cached = status_cache.get(org_slug)
+    if cached is not None and cached[0] == version:
+        return cached[1]
     
-    return jsonify({
-        'organization': organization.to_dict(),
-        'services': [service.to_dict() for service in services],
-        'active_incidents': [incident.to_dict() for incident in active_incidents],
-        'recent_incidents': [incident.to_dict() for incident in recent_incidents]
-    })
+    snapshot = build_public_status(org_slug)
+    if snapshot is None:
+        return None
+    # Tag the snapshot with the version it was built from so a write
+    # that lands mid-build is never masked by a stale cache entry.
+    entry = new_status_entry(snapshot)
+    status_cache.set(org_slug, (version, entry))
+    return entry
+
+def new_status_entry(snapshot):
+    return StatusEntry(next(snapshot_stamps), snapshot, datetime.utcnow().replace(microsecond=0))
+
+def build_public_status(org_slug):
+    organization = Organization.query.filter_by(slug=org_slug).first()
+    if not organization:
+        return None
+    
+    snapshot = {'organization': organization.to_dict()}
+    for key, statement in public_status_statements(organization.id).items():
+        snapshot[key] = to_dicts(db.session.scalars(statement).all(), key)
+    return snapshot
+
+def public_status_statements(organization_id):
+    """Queries behind the public status snapshot, also run by asgi.py"""
+    return {
+        'services': select(Service).filter_by(organization_id=organization_id),
+        'active_incidents': select(Incident).options(
+            selectinload(Incident.updates)
+        ).filter_by(
+            organization_id=organization_id
+        ).filter(
+            Incident.status.in_(['investigating', 'identified', 'monitoring'])
+        ).order_by(Incident.created_at.desc()),
+        'recent_incidents': select(Incident).options(
+            selectinload(Incident.updates)
+        ).filter_by(
+            organization_id=organization_id
+        ).order_by(Incident.created_at.desc()).limit(10)
+    }
 
 @app.route('/api/public/<org_slug>/timeline', methods=['GET'])
+@limiter.limit('public')
+@replica_read
 def get_public_timeline(org_slug):
+    def build():
+        organization = Organization.query.filter_by(slug=org_slug).first()
+        if not organization:
+            return None
+        
+        # Get recent status changes and incidents
+        changes_query = filter_time_range(StatusChange.query.join(Service).filter(
+            Service.organization_id == organization.id
+        ), StatusChange, request.args)
+        service_id = parse_service_id(request.args)
+        if service_id is not None:
+            changes_query = changes_query.filter(StatusChange.service_id == service_id)
+        status_changes, next_cursor = paginate(
+            changes_query, StatusChange,
+            cursor=request.args.get('cursor'),
+            limit=parse_limit(request.args.get('limit'), default=20)
+        )
+        
+        incidents_query = filter_incidents(Incident.query.options(
+            selectinload(Incident.updates)
+        ).filter_by(
+            organization_id=organization.id
+        ), request.args)
+        incidents, next_incident_cursor = paginate(
+            incidents_query, Incident,
+            cursor=request.args.get('incident_cursor'),
+            limit=parse_limit(request.args.get('incident_limit'), default=10)
+        )
+        return serializers.encode({
+            'status_changes': to_dicts(status_changes, 'status_changes'),
+            'incidents': to_dicts(incidents, 'incidents'),
+            'next_cursor': next_cursor,
+            'next_incident_cursor': next_incident_cursor
+        })
+    
+    # Every page and filter is cached on its own, until the next write
+    try:
+        version, _ = org_versions.get(org_slug)
+        response = compressed_response(('timeline', org_slug, request.query_string), version, build)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    if response is None:
+        return jsonify({'error': 'Organization not found'}), 404
+    return response
+
+@app.route('/api/public/<org_slug>/uptime', methods=['GET'])
+@limiter.limit('public')
+@replica_read
+def get_public_uptime(org_slug):
     organization = Organization.query.filter_by(slug=org_slug).first()
     if not organization:
         return jsonify({'error': 'Organization not found'}), 404
     
-    # Get recent status changes and incidents
-    status_changes = StatusChange.query.join(Service).filter(
-        Service.organization_id == organization.id
-    ).order_by(StatusChange.created_at.desc()).limit(20).all()
-    
-    incidents = Incident.query.filter_by(
-        organization_id=organization.id
-    ).order_by(Incident.created_at.desc()).limit(10).all()
+    # Not type=int, which would quietly turn ?days=abc into the default
+    try:
+        days = int(request.args.get('days', 90))
+    except ValueError:
+        days = None
+    if days is None or days < 1 or days > app.config['UPTIME_MAX_DAYS']:
+        return jsonify({'error': f"days must be an integer between 1 and {app.config['UPTIME_MAX_DAYS']}"}), 400
     
+    services = Service.query.filter_by(organization_id=organization.id).all()
     return jsonify({
-        'status_changes': [change.to_dict() for change in status_changes],
-        'incidents': [incident.to_dict() for incident in incidents]
+        'days': days,
+        'services': rollups.uptime_report(services, days)
     })
 
+# Internal Routes
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text format metrics, for scrapers on METRICS_ALLOWED_IPS only"""
+    if request.remote_addr not in app.config['METRICS_ALLOWED_IPS']:
+        return jsonify({'error': 'Forbidden'}), 403
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.cli.command('backfill-uptime')
+def backfill_uptime():
+    """Rebuild the uptime rollups from the status change history"""
+    rollups.backfill(app.config['UPTIME_HOURLY_DAYS'])
+    print('Uptime rollups rebuilt')
+
+@app.cli.command('apply-retention')
+def apply_retention():
+    """Archive and compact old history according to the retention policies"""
+    static_pages.delay = 0
+    worker = retention.Retention(app.config['RETENTION_BATCH_SIZE'], app.config['RETENTION_BATCH_PAUSE_MS'])
+    organizations = db.session.execute(select(Organization.id, Organization.slug)).all()
+    for organization in organizations:
+        if worker.apply(organization, retention.policy(app.config, organization.slug)):
+            mark_org_changed(organization.slug)
+    worker.prune_hourly_rollups(datetime.utcnow() - timedelta(days=app.config['UPTIME_HOURLY_DAYS']))
+    for (table, action), rows in sorted(worker.moved.items()):
+        print(f'{table}: {rows} rows {action}')
+    print(f'Retention applied to {len(organizations)} organizations; longest batch {worker.longest_batch * 1000:.1f}ms')
+
+@app.cli.command('run-prober')
+def run_prober():
+    """Run the service health checks until interrupted"""
+    if client_manager is None:
+        # The web workers' caches and ETags would keep the old statuses
+        print('SOCKETIO_MESSAGE_QUEUE is not set, so the web workers would never see the status '
+              'changes; set it, or run the prober inside asgi.py with PROBER_ENABLED=true')
+        raise SystemExit(1)
+    # Nothing else runs in this process to flush in the background
+    broadcaster.window = 0
+    static_pages.delay = 0
+    try:
+        asyncio.run(create_prober().run())
+    except KeyboardInterrupt:
+        pass
+
+@app.cli.command('run-notifier')
+def run_notifier():
+    """Deliver subscriber notifications until interrupted"""
+    try:
+        asyncio.run(notifications.NotificationWorker(app).run())
+    except KeyboardInterrupt:
+        pass
+
+@app.cli.command('render-status-pages')
+def render_status_pages():
+    """Render the static public status page of every organization"""
+    if not static_pages.folder:
+        print('STATIC_PAGES_DIR is not set')
+        return
+    slugs = db.session.scalars(select(Organization.slug)).all()
+    print(f'Rendered {static_pages.render_all(slugs)} status pages to {static_pages.folder}')
+
 # WebSocket Events
 @socketio.on('connect')
 def on_connect(auth):
-    print('Client connected')
+    app.logger.debug('Client %s connected', request.sid)
 
 @socketio.on('disconnect')
 def on_disconnect():
-    print('Client disconnected')
+    app.logger.debug('Client %s disconnected', request.sid)
 
 @socketio.on('join_organization')
 def on_join_organization(data):
-    room = f"org_{data['organization_id']}"
+    try:
+        user = user_lookup_callback(None, decode_token(data.get('token') or ''))
+    except Exception:
+        user = None
+    if user is None or user.organization_id != data.get('organization_id'):
+        emit('join_error', {'error': 'Not authorized to join this organization'})
+        return
+    
+    room = f"org_{user.organization_id}"
     join_room(room)
-    emit('joined', {'room': room})
+    emit('joined', join_payload(room, data, lambda: organization_snapshot(user.organization_id)))
 
 @socketio.on('join_public')
 def on_join_public(data):
     room = f"public_{data['org_slug']}"
     join_room(room)
-    emit('joined', {'room': room})
+    emit('joined', join_payload(room, data, lambda: public_status_snapshot(data['org_slug'])))
+
+def join_payload(room, data, build_snapshot):
+    """Describe what a client joining room needs to catch up.
+
+    A client resuming from a sequence number that is still buffered gets only
+    the events it missed; anyone else gets a full snapshot. Either way the
+    client is already in the room, so nothing emitted afterwards is lost.
+    """
+    payload = join_position(room, data)
+    if 'events' not in payload:
+        payload['snapshot'] = build_snapshot()
+    return payload
+
+def join_position(room, data):
+    """The join payload without its snapshot; includes the missed events
+    when the client can resume"""
+    log = broadcaster.events
+    payload = {'room': room, 'stream': log.stream, 'seq': log.position(room)}
+    
+    # Sequence numbers are per process, so only resume without a message queue
+    if client_manager is None and data.get('stream') == log.stream and isinstance(data.get('last_seq'), int):
+        missed = log.since(room, data['last_seq'])
+        if missed is not None:
+            payload['events'] = missed
+    return payload
+
+def organization_snapshot(organization_id):
+    return organization_snapshot_body({
+        key: db.session.scalars(statement).all()
+        for key, statement in organization_snapshot_statements(organization_id).items()
+    })
+
+def organization_snapshot_statements(organization_id):
+    """Services and the first page of incidents, also run by asgi.py; one
+    extra incident tells whether there is a next page"""
+    return {
+        'services': select(Service).filter_by(organization_id=organization_id),
+        'incidents': select(Incident).options(
+            selectinload(Incident.updates)
+        ).filter_by(
+            organization_id=organization_id
+        ).order_by(Incident.created_at.desc(), Incident.id.desc()).limit(DEFAULT_LIMIT + 1)
+    }
+
+def organization_snapshot_body(rows):
+    """Serialize the rows of organization_snapshot_statements. Older incidents
+    are loaded on demand from GET /api/incidents?cursor=<next_incident_cursor>"""
+    incidents, next_incident_cursor = next_page(rows['incidents'])
+    return {
+        'services': to_dicts(rows['services'], 'services'),
+        'incidents': to_dicts(incidents, 'incidents'),
+        'next_incident_cursor': next_incident_cursor
+    }
 
 if __name__ == '__main__':
     with app.app_context():
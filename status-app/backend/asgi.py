@@ -0,0 +1,379 @@
+"""
+ASGI entry point, an alternative to wsgi.py that does not use eventlet.
+
+python-socketio's AsyncServer serves the Socket.IO events on the event loop,
+the hot read paths (public status and join snapshots) run on async
+SQLAlchemy over the same models and the public event streams are coroutines.
+Every other /api route is the Flask app, run on a thread pool through a2wsgi,
+so both modes share the caches, ETags and broadcast queue of app.py:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --no-proxy-headers
+
+X-Forwarded-For is read according to TRUSTED_PROXY_COUNT, as in the Flask
+app, so uvicorn must not rewrite the client address itself.
+Only a single worker is supported for now: SOCKETIO_MESSAGE_QUEUE must be unset.
+With PROBER_ENABLED and NOTIFY_WORKER_ENABLED the health checks and the
+notification worker run on the same event loop.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'threading')
+
+import socketio
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import decode_token
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import selectinload
+from werkzeug.http import http_date, parse_date, parse_etags
+
+import app as flask_module
+from metrics import instrument_engine
+from models import Organization, User
+from notifications import NotificationWorker
+from ratelimit import retry_after
+from serializers import encode
+from sse import HEARTBEAT, AsyncListener
+
+flask_app = flask_module.app
+compressed = flask_module.compressed
+if flask_module.client_manager is not None:
+    raise RuntimeError('SOCKETIO_MESSAGE_QUEUE is not supported by the ASGI entry point')
+
+# Async drivers for the synchronous drivers accepted in MYSQL_URI
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+PUBLIC_STATUS_PATH = re.compile(r'/api/public/([^/]+)/status')
+PUBLIC_EVENTS_PATH = re.compile(r'/api/public/([^/]+)/events')
+
+
+def async_database_uri(uri):
+    url = make_url(uri)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+engine = create_async_engine(
+    async_database_uri(flask_app.config['SQLALCHEMY_DATABASE_URI']),
+    **flask_app.config['SQLALCHEMY_ENGINE_OPTIONS']
+)
+instrument_engine(engine.sync_engine, name='async', slow_query_ms=flask_app.config['DB_SLOW_QUERY_MS'])
+flask_module.count_request_queries(engine.sync_engine)
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins=flask_app.config['CORS_ORIGINS'])
+
+
+class LoopEmitter:
+    """Lets the Broadcaster, driven by Flask routes on worker threads, emit
+    through the AsyncServer running on the event loop"""
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = None
+
+    def emit(self, event, data, to=None):
+        asyncio.run_coroutine_threadsafe(self.server.emit(event, data, room=to), self.loop)
+
+    def start_background_task(self, target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+
+emitter = LoopEmitter(sio)
+flask_module.broadcaster.socketio = emitter
+
+
+async def load_user_profile(session, user_id):
+    profile = flask_module.user_cache.get(user_id)
+    if profile is None:
+        user = await session.get(User, user_id, options=[selectinload(User.organization)])
+        if not user:
+            return None
+        profile = flask_module.user_profile(user)
+        flask_module.user_cache.set(user_id, profile)
+    return profile
+
+
+async def run_statements(session, statements):
+    return {
+        key: flask_module.to_dicts((await session.scalars(statement)).all(), key)
+        for key, statement in statements.items()
+    }
+
+
+async def build_public_status(session, org_slug):
+    organization = await session.scalar(select(Organization).filter_by(slug=org_slug))
+    if not organization:
+        return None
+
+    snapshot = {'organization': organization.to_dict()}
+    snapshot.update(await run_statements(session, flask_module.public_status_statements(organization.id)))
+    return snapshot
+
+
+async def public_status_snapshot(org_slug):
+    entry = await public_status_entry(org_slug)
+    return entry.snapshot if entry is not None else None
+
+
+async def public_status_entry(org_slug):
+    """Async twin of app.public_status_entry, sharing its cache"""
+    version, _ = flask_module.org_versions.get(org_slug)
+    cached = flask_module.status_cache.get(org_slug)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    async with async_session() as session:
+        snapshot = await build_public_status(session, org_slug)
+    if snapshot is None:
+        return None
+    entry = flask_module.new_status_entry(snapshot)
+    flask_module.status_cache.set(org_slug, (version, entry))
+    return entry
+
+
+async def organization_snapshot(organization_id):
+    async with async_session() as session:
+        statements = flask_module.organization_snapshot_statements(organization_id)
+        return flask_module.organization_snapshot_body({
+            key: (await session.scalars(statement)).all() for key, statement in statements.items()
+        })
+
+
+# WebSocket Events
+@sio.event
+async def join_organization(sid, data):
+    try:
+        with flask_app.app_context():
+            jwt_data = decode_token(data.get('token') or '')
+        async with async_session() as session:
+            profile = await load_user_profile(session, int(jwt_data['sub']))
+        user = flask_module.identity_from_claims(jwt_data, profile)
+    except Exception:
+        user = None
+    if user is None or user.organization_id != data.get('organization_id'):
+        await sio.emit('join_error', {'error': 'Not authorized to join this organization'}, to=sid)
+        return
+
+    room = f"org_{user.organization_id}"
+    sio.enter_room(sid, room)
+    payload = flask_module.join_position(room, data)
+    if 'events' not in payload:
+        payload['snapshot'] = await organization_snapshot(user.organization_id)
+    await sio.emit('joined', payload, to=sid)
+
+
+@sio.event
+async def join_public(sid, data):
+    room = f"public_{data['org_slug']}"
+    sio.enter_room(sid, room)
+    payload = flask_module.join_position(room, data)
+    if 'events' not in payload:
+        payload['snapshot'] = await public_status_snapshot(data['org_slug'])
+    await sio.emit('joined', payload, to=sid)
+
+
+# HTTP
+def request_headers(scope):
+    return {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+
+
+def cors_headers(headers):
+    if headers.get('origin') not in flask_app.config['CORS_ORIGINS']:
+        return []
+    return [
+        (b'access-control-allow-origin', headers['origin'].encode('latin-1')),
+        (b'access-control-expose-headers', b'X-Next-Cursor'),
+    ]
+
+
+def client_address(scope, headers):
+    """The client's IP address, read from X-Forwarded-For past
+    TRUSTED_PROXY_COUNT proxies like ProxyFix does for the Flask routes"""
+    proxies = flask_app.config['TRUSTED_PROXY_COUNT']
+    forwarded = headers.get('x-forwarded-for', '').split(',')
+    if proxies and len(forwarded) >= proxies:
+        return forwarded[-proxies].strip()
+    client = scope.get('client')
+    return client[0] if client else None
+
+
+def check_public_limit(scope, headers, org_slug):
+    return flask_module.limiter.check('public', {'ip': client_address(scope, headers), 'org': org_slug})
+
+
+async def send_error(scope, send, status, message, extra_headers=()):
+    body = encode({'error': message})
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        *extra_headers,
+        (b'content-length', str(len(body)).encode('latin-1')),
+    ]})
+    await send({'type': 'http.response.body', 'body': body if scope['method'] == 'GET' else b''})
+    return status
+
+
+async def public_status(scope, send, org_slug):
+    """GET /api/public/<org_slug>/status without leaving the event loop,
+    with the same conditional request handling as app.conditional_response
+    and the same compressed bodies as app.compressed_response"""
+    headers = request_headers(scope)
+    wait = check_public_limit(scope, headers, org_slug)
+    if wait:
+        return await send_error(scope, send, 429, 'Too many requests', [(b'retry-after', retry_after(wait).encode('latin-1'))])
+
+    entry = await public_status_entry(org_slug)
+    if entry is None:
+        return await send_error(scope, send, 404, 'Organization not found')
+    etag, last_modified = flask_module.org_versions.etag(org_slug)
+    etag = f'{etag}.{entry.stamp}'
+    last_modified = max(last_modified, entry.built_at)
+    if 'if-none-match' in headers:
+        not_modified = parse_etags(headers['if-none-match']).contains_weak(etag)
+    else:
+        since = parse_date(headers.get('if-modified-since'))
+        not_modified = bool(since and since.replace(tzinfo=None) >= last_modified)
+
+    status, body, encoding = 304, b'', 'identity'
+    if not not_modified:
+        encoding = compressed.negotiate(headers.get('accept-encoding'))
+        cached = compressed.get(('status', org_slug), entry.stamp, encoding)
+        if cached is None:
+            body = flask_module.status_body(org_slug, entry)
+            cached = compressed.put(('status', org_slug), entry.stamp, encoding, body)
+        status, (body, encoding) = 200, cached
+
+    response_headers = [(b'content-type', b'application/json'), (b'vary', b'Origin, Authorization, Accept-Encoding')]
+    if encoding != 'identity':
+        response_headers.append((b'content-encoding', encoding.encode('latin-1')))
+    response_headers += [
+        (b'etag', f'W/"{etag}"'.encode('latin-1')),
+        (b'last-modified', http_date(last_modified).encode('latin-1')),
+        (b'cache-control', b'no-cache'),
+    ]
+    response_headers += cors_headers(headers)
+    response_headers.append((b'content-length', str(len(body)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': body if scope['method'] == 'GET' else b''})
+    return status
+
+
+async def public_events(scope, receive, send, org_slug):
+    """GET /api/public/<org_slug>/events as a coroutine, so open streams
+    cost no thread; same protocol as app.stream_public_events"""
+    headers = request_headers(scope)
+    wait = check_public_limit(scope, headers, org_slug)
+    if wait:
+        return await send_error(scope, send, 429, 'Too many requests', [(b'retry-after', retry_after(wait).encode('latin-1'))])
+    streams = flask_module.event_streams
+    room = f"public_{org_slug}"
+    listener = streams.subscribe(room, AsyncListener(asyncio.get_running_loop(), flask_app.config['SSE_QUEUE_SIZE']))
+    if listener is None:
+        return await send_error(scope, send, 503, 'Too many event streams')
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        listener.close()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        caught_up = streams.resume(room, headers.get('last-event-id'))
+        if caught_up is None:
+            seq = streams.events.position(room)
+            entry = await public_status_entry(org_slug)
+            if entry is None:
+                return await send_error(scope, send, 404, 'Organization not found')
+            body = flask_module.status_body(org_slug, entry)
+            caught_up = (streams.snapshot(body, seq), seq)
+        first, after = caught_up
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            *cors_headers(headers),
+        ]})
+        if scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return 200
+        await send({'type': 'http.response.body', 'body': streams.preamble() + first, 'more_body': True})
+        while True:
+            items = await listener.get(streams.heartbeat)
+            if listener.closed:
+                break
+            data = b''.join(message for seq, message in items if seq > after)
+            if items:
+                after = max(after, items[-1][0])
+            await send({'type': 'http.response.body', 'body': data or HEARTBEAT, 'more_body': True})
+        if not watcher.done():
+            # Dropped for falling behind; the client reconnects and resumes
+            await send({'type': 'http.response.body', 'body': b''})
+        return 200
+    finally:
+        watcher.cancel()
+        streams.unsubscribe(room, listener)
+
+
+flask_asgi = WSGIMiddleware(flask_app)
+
+
+async def http_app(scope, receive, send):
+    if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+        match = PUBLIC_STATUS_PATH.fullmatch(scope['path'])
+        if match:
+            start = time.perf_counter()
+            queries = [0]
+            flask_module.native_request_queries.set(queries)
+            status = await public_status(scope, send, match.group(1))
+            flask_module.observe_request(scope['method'], '/api/public/<org_slug>/status', status,
+                                         time.perf_counter() - start, queries[0])
+            return
+        match = PUBLIC_EVENTS_PATH.fullmatch(scope['path'])
+        if match:
+            start = time.perf_counter()
+            status = await public_events(scope, receive, send, match.group(1))
+            flask_module.observe_request(scope['method'], '/api/public/<org_slug>/events', status,
+                                         time.perf_counter() - start)
+            return
+    return await flask_asgi(scope, receive, send)
+
+
+background_tasks = []
+
+
+async def on_startup():
+    emitter.loop = asyncio.get_running_loop()
+    if flask_app.config['PROBER_ENABLED']:
+        # Health checks share the event loop with the sockets
+        background_tasks.append(asyncio.create_task(flask_module.create_prober().run()))
+    if flask_app.config['NOTIFY_WORKER_ENABLED']:
+        background_tasks.append(asyncio.create_task(NotificationWorker(flask_app).run()))
+
+
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await engine.dispose()
+
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=on_startup, on_shutdown=on_shutdown)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)), proxy_headers=False)
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from cache import SnapshotCache
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Events that are sent as a single list when several entities change in the
+# same window (the list form of each single-entity event)
+BATCH_EVENTS = {
+    'service_updated': 'services_updated',
+    'public_status_update': 'public_status_bulk_update',
+    'incident_updated': 'incidents_updated',
+    'public_incident_update': 'public_incident_bulk_update',
+}
+
+emit_count = registry.counter('socketio_emits_total', 'Broadcast events emitted, by event', ['event'])
+emit_duration = registry.histogram(
+    'socketio_emit_duration_seconds', 'Time to emit a broadcast to its room, by event', ['event']
+)
+flush_duration = registry.histogram('socketio_flush_duration_seconds', 'Time to flush the broadcast queue')
+
+
+def diff(previous, current):
+    """Return the fields of current that differ from previous, keyed by id"""
+    changed = {key: value for key, value in current.items() if previous.get(key) != value}
+    if not changed:
+        return None
+    changed['id'] = current['id']
+    return changed
+
+
+class EventLog:
+    """Per-room ring buffer of recently broadcast events.
+
+    Every event gets the next sequence number of its room so a reconnecting
+    client can ask for exactly the events it missed. The stream id changes on
+    every restart, which invalidates sequence numbers held by clients.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.stream = uuid.uuid4().hex[:8]
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def append(self, room, event, payload):
+        with self._lock:
+            seq, events = self._rooms.get(room, (0, None))
+            if events is None:
+                events = deque(maxlen=self.size)
+            seq += 1
+            events.append((seq, event, payload))
+            self._rooms[room] = (seq, events)
+            return seq
+
+    def position(self, room):
+        with self._lock:
+            return self._rooms.get(room, (0, None))[0]
+
+    def since(self, room, last_seq):
+        """Return [event, payload, seq] entries after last_seq, or None when
+        some of them are no longer buffered"""
+        with self._lock:
+            seq, events = self._rooms.get(room, (0, None))
+            if last_seq > seq:
+                return None
+            if last_seq == seq:
+                return []
+            if not events or events[0][0] > last_seq + 1:
+                return None
+            return [[event, payload, event_seq] for event_seq, event, payload in events if event_seq > last_seq]
+
+
+class Broadcaster:
+    """Coalescing Socket.IO broadcast queue.
+
+    Write routes publish the latest state of an entity and return immediately.
+    A background task flushes the queue every `window` seconds: successive
+    updates to the same entity in a room are merged into one, the payload is
+    reduced to the fields that changed since the last broadcast, and several
+    entities changed together are sent as one batch event.
+
+    Diffs are computed against what this process last sent, so they must be
+    disabled when several workers broadcast to the same rooms. Callables in
+    `listeners` get (room, event, payload) for every event emitted.
+    """
+
+    def __init__(self, socketio, window=0.25, diffs=True, state_size=10000, log_size=256):
+        self.socketio = socketio
+        self.window = window
+        self.diffs = diffs
+        self.events = EventLog(log_size)
+        self._pending = OrderedDict()
+        self._sent = SnapshotCache(max_entries=state_size, ttl=3600)
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._task = None
+
+    def publish(self, room, entity, event, payload, full=False):
+        """Queue payload (a to_dict() result) for room.
+
+        full forces the whole object to be sent, e.g. for creation events.
+        """
+        self.publish_many([(room, entity, event, payload)], full)
+
+    def publish_many(self, messages, full=False):
+        """Queue several (room, entity, event, payload) messages at once.
+
+        They are queued under one lock, so the same flush sends them all and
+        entities changed together go out as one batch event per room, even
+        when the queue is flushed inline or from another thread.
+        """
+        with self._lock:
+            for room, entity, event, payload in messages:
+                key = (entity, payload['id'])
+                entries = self._pending.setdefault(room, OrderedDict())
+                if key in entries:
+                    # Keep the first event name (so created+updated is still
+                    # a creation) but always send the latest state
+                    first_event, _, first_full = entries[key]
+                    entries[key] = (first_event, payload, first_full or full)
+                else:
+                    entries[key] = (event, payload, full)
+
+        if self.window <= 0:
+            self.flush()
+        elif self._task is None:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.window)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Broadcast flush failed')
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+        if not pending:
+            return
+        start = time.perf_counter()
+
+        for room, entries in pending.items():
+            grouped = OrderedDict()
+            for (entity, entity_id), (event, payload, full) in entries.items():
+                message = payload
+                if self.diffs:
+                    state_key = (room, entity, entity_id)
+                    previous = self._sent.get(state_key)
+                    self._sent.set(state_key, payload)
+                    if not full and previous is not None:
+                        message = diff(previous, payload)
+                if message is not None:
+                    grouped.setdefault(event, []).append(message)
+
+            for event, messages in grouped.items():
+                batch_event = BATCH_EVENTS.get(event)
+                if batch_event and len(messages) > 1:
+                    self._emit(room, batch_event, messages)
+                else:
+                    for message in messages:
+                        self._emit(room, event, message)
+        flush_duration.observe(time.perf_counter() - start)
+
+    def _emit(self, room, event, payload):
+        # A tuple is sent as two arguments; the second one lets clients track
+        # their position in the room. Sequence numbers only order events of
+        # the same stream, since every worker keeps its own log
+        seq = self.events.append(room, event, payload)
+        start = time.perf_counter()
+        self.socketio.emit(event, (payload, {'room': room, 'seq': seq, 'stream': self.events.stream}), to=room)
+        emit_duration.labels(event).observe(time.perf_counter() - start)
+        emit_count.labels(event).inc()
+        for listener in self.listeners:
+            listener(room, event, payload)
@@ -0,0 +1,85 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+class SnapshotCache:
+    """In-process LRU cache with a per-entry TTL.
+
+    Used for the public status snapshot of each organization. Any object with
+    the same get/set/invalidate/clear methods (e.g. a Redis-backed cache) can
+    be swapped in.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class VersionRegistry:
+    """Per-key monotonically increasing version counters.
+
+    Write routes bump the version of an organization; read routes turn the
+    current version into an ETag/Last-Modified pair without touching the
+    database. Versions live in process memory, so each ETag is prefixed with
+    a per-process boot id to avoid false matches after a restart.
+    """
+
+    def __init__(self):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.started_at = datetime.utcnow().replace(microsecond=0)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (version, last_modified) for key."""
+        with self._lock:
+            return self._versions.get(key, (0, self.started_at))
+
+    def bump(self, key):
+        with self._lock:
+            version, previous = self._versions.get(key, (0, self.started_at))
+            # HTTP dates have one second resolution; keep Last-Modified
+            # strictly increasing so two writes in the same second still
+            # invalidate an If-Modified-Since from between them.
+            modified = max(datetime.utcnow().replace(microsecond=0), previous + timedelta(seconds=1))
+            self._versions[key] = (version + 1, modified)
+            return version + 1
+
+    def etag(self, key):
+        version, last_modified = self.get(key)
+        return f'{self.boot_id}-{version}', last_modified
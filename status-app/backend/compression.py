@@ -0,0 +1,136 @@
+import gzip
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip is offered without it
+    brotli = None
+
+from werkzeug.http import parse_accept_header
+
+from metrics import registry
+
+IDENTITY = 'identity'
+
+lookup_count = registry.counter(
+    'compression_cache_requests_total', 'Compressed response cache lookups, by encoding and result', ['encoding', 'result']
+)
+compress_duration = registry.histogram(
+    'compression_duration_seconds', 'Time to compress one response body, by encoding', ['encoding'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+)
+sent_bytes = registry.counter('compression_sent_bytes_total', 'Response body bytes served from the cache, by encoding', ['encoding'])
+
+
+class CompressedCache:
+    """Response bodies of the public endpoints, compressed once per payload.
+
+    Entries are kept per (key, encoding) together with the fingerprint (a
+    snapshot stamp or organization version) they were built for, so a payload is compressed
+    the first time it is asked for in an encoding after it changes and every
+    later request is served the same bytes. The uncompressed body is kept
+    as the identity entry, so a miss in another encoding does not rebuild
+    it. Entries expire ttl seconds after their body was built (compressed
+    copies included), so a change this worker was never told about is picked
+    up like in the snapshot cache; least recently used entries are evicted
+    beyond max_bytes in total.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, min_size=1024, gzip_level=9, brotli_quality=9, ttl=30):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def negotiate(self, accept_encoding):
+        """The encoding to send for an Accept-Encoding header"""
+        if not self.max_bytes or not accept_encoding:
+            return IDENTITY
+        return parse_accept_header(accept_encoding).best_match(self.encodings) or IDENTITY
+
+    def compress(self, body, encoding):
+        start = time.perf_counter()
+        if encoding == 'br':
+            data = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            # mtime=0 so the same body always gives the same bytes
+            data = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        compress_duration.labels(encoding).observe(time.perf_counter() - start)
+        return data
+
+    def get(self, key, fingerprint, encoding):
+        """(body, encoding) for key at fingerprint, or None when its body
+        has to be built and put(). Small bodies are sent uncompressed."""
+        sent_as = encoding
+        cached = self._get((key, encoding), fingerprint)
+        if cached is None and encoding != IDENTITY:
+            identity = self._get((key, IDENTITY), fingerprint)
+            if identity is not None and len(identity[0]) >= self.min_size:
+                lookup_count.labels(encoding, 'miss').inc()
+                return self._store(key, fingerprint, encoding, *identity)
+            cached, sent_as = identity, IDENTITY
+        if cached is None:
+            lookup_count.labels(encoding, 'miss').inc()
+            return None
+        lookup_count.labels(encoding, 'hit').inc()
+        sent_bytes.labels(sent_as).inc(len(cached[0]))
+        return cached[0], sent_as
+
+    def put(self, key, fingerprint, encoding, body):
+        """Cache a freshly built body; returns (body, encoding) to send"""
+        expires_at = time.monotonic() + self.ttl
+        self._set((key, IDENTITY), fingerprint, body, expires_at)
+        if encoding == IDENTITY:
+            sent_bytes.labels(IDENTITY).inc(len(body))
+            return body, IDENTITY
+        return self._store(key, fingerprint, encoding, body, expires_at)
+
+    def _store(self, key, fingerprint, encoding, body, expires_at):
+        if len(body) < self.min_size:
+            sent_bytes.labels(IDENTITY).inc(len(body))
+            return body, IDENTITY
+        data = self.compress(body, encoding)
+        self._set((key, encoding), fingerprint, data, expires_at)
+        sent_bytes.labels(encoding).inc(len(data))
+        return data, encoding
+
+    def _get(self, entry_key, fingerprint):
+        """(data, expires_at) of a live entry, or None"""
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None or entry[0] != fingerprint:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[entry_key]
+                self.size -= len(entry[1])
+                return None
+            self._entries.move_to_end(entry_key)
+            return entry[1], entry[2]
+
+    def _set(self, entry_key, fingerprint, data, expires_at):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(entry_key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self._entries[entry_key] = (fingerprint, data, expires_at)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,272 @@
+import bisect
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from fast queries up to request timeouts
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric with optional labels; values are kept per label tuple"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        return _Child(self, tuple(str(value) for value in values))
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, key, value in self.samples():
+            lines.append(f'{name}{format_labels(self.label_names, key)} {format_value(value)}')
+        return lines
+
+
+class _Child:
+    """A metric bound to one set of label values"""
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        self._metric.inc(amount, key=self._key)
+
+    def dec(self, amount=1):
+        self._metric.dec(amount, key=self._key)
+
+    def set(self, value):
+        self._metric.set(value, key=self._key)
+
+    def observe(self, value):
+        self._metric.observe(value, key=self._key)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, key=()):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A gauge that is either set directly or read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value, key=()):
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, key=()):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, key=()):
+        self.inc(-amount, key=key)
+
+    def samples(self):
+        if self.callback is not None:
+            return [(self.name, key, value) for key, value in self.callback()]
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, key=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, the sum and the count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', key + (format_value(bound),), cumulative))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, count))
+        return samples
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, key, value in self.samples():
+            names = self.label_names + ('le',) if name.endswith('_bucket') else self.label_names
+            lines.append(f'{name}{format_labels(names, key)} {format_value(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), callback=None):
+        return self.register(Gauge(name, documentation, labels, callback))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """The registry in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Instrumented engines by name
+engines = {}
+
+
+def pool_sizes():
+    samples = []
+    for name, engine in list(engines.items()):
+        pool = engine.pool
+        # Only QueuePool has a fixed size and overflow
+        if hasattr(pool, 'size') and hasattr(pool, 'overflow'):
+            samples.append(((name, 'size'), pool.size()))
+            samples.append(((name, 'idle'), pool.checkedin()))
+            # overflow() counts down from -size until the pool is full
+            samples.append(((name, 'overflow'), max(0, pool.overflow())))
+    return samples
+
+
+registry.gauge('db_pool_connections', 'Pool size, idle connections and connections opened beyond the size', ['engine', 'state'], callback=pool_sizes)
+
+
+def timed_pool_class(pool_class, checkout_wait):
+    """Subclass of pool_class recording how long connect() waited for a connection"""
+    class TimedPool(pool_class):
+        def connect(self):
+            start = time.perf_counter()
+            try:
+                return super().connect()
+            finally:
+                checkout_wait.observe(time.perf_counter() - start)
+
+    TimedPool.__name__ = TimedPool.__qualname__ = 'Timed' + pool_class.__name__
+    return TimedPool
+
+
+def instrument_engine(engine, name='primary', slow_query_ms=0):
+    """Export pool and query metrics for engine.
+
+    The pool's class is swapped for a subclass that times checkouts, so the
+    timing survives engine.dispose(), which recreates the pool from its class.
+    Queries slower than slow_query_ms are printed (0 disables the log).
+    """
+    checkout_wait = registry.histogram(
+        'db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection', ['engine']
+    ).labels(name)
+    engine.pool.__class__ = timed_pool_class(engine.pool.__class__, checkout_wait)
+
+    checked_out = registry.gauge(
+        'db_pool_checked_out', 'Connections currently checked out of the pool', ['engine']
+    ).labels(name)
+    checkouts = registry.counter('db_pool_checkouts_total', 'Connection checkouts', ['engine']).labels(name)
+    connects = registry.counter('db_pool_connects_total', 'New DBAPI connections opened', ['engine']).labels(name)
+    invalidations = registry.counter(
+        'db_pool_invalidations_total', 'Connections invalidated, e.g. after a failed pre-ping', ['engine']
+    ).labels(name)
+    query_duration = registry.histogram(
+        'db_query_duration_seconds', 'SQL statement execution time', ['engine']
+    ).labels(name)
+    query_errors = registry.counter('db_query_errors_total', 'SQL statements that raised', ['engine']).labels(name)
+
+    engines[name] = engine
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checkouts.inc()
+        checked_out.inc()
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        connects.inc()
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        invalidations.inc()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        query_duration.observe(elapsed)
+        if slow_query_ms and elapsed * 1000 >= slow_query_ms:
+            logger.warning('Slow query (%.1fms): %s', elapsed * 1000, statement)
+
+    @event.listens_for(engine, 'handle_error')
+    def on_error(context):
+        query_errors.inc()
+        if context.connection is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
@@ -1,9 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-import bcrypt
-from sqlalchemy import inspect
+from passwords import hasher
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Organization(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -35,10 +35,13 @@ class User(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    
+        self.password_hash = hasher.hash(password)
+
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        return hasher.verify(password, self.password_hash)
+
+    def password_needs_rehash(self):
+        return hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
         return {
@@ -63,6 +66,10 @@ class Service(db.Model):
     incidents = db.relationship('Incident', backref='service', lazy=True)
     status_changes = db.relationship('StatusChange', backref='service', lazy=True)
     
+    __table_args__ = (
+        db.Index('ix_service_organization_id', 'organization_id'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -74,6 +81,42 @@ class Service(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
+class ServiceCheck(db.Model):
+    """Health check that drives a service's status (run by prober.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.Integer, db.ForeignKey('service.id'), unique=True, nullable=False)
+    kind = db.Column(db.String(8), nullable=False, default='http')  # http, tcp
+    target = db.Column(db.String(512), nullable=False)  # URL for http, host:port for tcp
+    interval_seconds = db.Column(db.Integer, nullable=False, default=60)
+    timeout_seconds = db.Column(db.Float, nullable=False, default=5.0)
+    expected_status = db.Column(db.Integer)  # any 2xx/3xx when unset
+    degraded_ms = db.Column(db.Integer)  # slower responses count as degraded
+    # Consecutive results needed before the service status changes
+    failure_threshold = db.Column(db.Integer, nullable=False, default=3)
+    recovery_threshold = db.Column(db.Integer, nullable=False, default=2)
+    enabled = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    service = db.relationship('Service', backref=db.backref('check', uselist=False))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'service_id': self.service_id,
+            'kind': self.kind,
+            'target': self.target,
+            'interval_seconds': self.interval_seconds,
+            'timeout_seconds': self.timeout_seconds,
+            'expected_status': self.expected_status,
+            'degraded_ms': self.degraded_ms,
+            'failure_threshold': self.failure_threshold,
+            'recovery_threshold': self.recovery_threshold,
+            'enabled': self.enabled,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
 class Incident(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -90,6 +133,13 @@ class Incident(db.Model):
     # Relationships
     updates = db.relationship('IncidentUpdate', backref='incident', lazy=True, order_by='IncidentUpdate.created_at.desc()')
     
+    # Dashboard/timeline listings page on (created_at, id) within an
+    # organization; the public page additionally filters on status
+    __table_args__ = (
+        db.Index('ix_incident_org_created', 'organization_id', 'created_at', 'id'),
+        db.Index('ix_incident_org_status_created', 'organization_id', 'status', 'created_at'),
+    )
+    
     def to_dict(self, include_updates=True):
         result = {
             'id': self.id,
@@ -105,18 +155,10 @@ class Incident(db.Model):
             'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None
         }
         
-        # Only include updates if requested and safely accessible
+        # Callers listing incidents should load updates with
+        # selectinload(Incident.updates) to avoid a query per incident
         if include_updates:
-            try:
-                # Use SQLAlchemy inspection to check if relationship is loaded
-                state = inspect(self)
-                if 'updates' in state.attrs and state.attrs.updates.loaded_value is not None:
-                    result['updates'] = [update.to_dict() for update in state.attrs.updates.loaded_value]
-                else:
-                    result['updates'] = []
-            except Exception:
-                # If updates aren't loaded or accessible, leave as empty list
-                result['updates'] = []
+            result['updates'] = [update.to_dict() for update in self.updates]
         
         return result
 
@@ -128,6 +170,10 @@ class IncidentUpdate(db.Model):
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_incident_update_incident_created', 'incident_id', 'created_at'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -145,6 +191,14 @@ class StatusChange(db.Model):
     new_status = db.Column(db.String(32), nullable=False)
     changed_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set on rows summarizing a compacted run of flapping changes (see
+    # retention.py): how many changes it replaces and when the last one was
+    flap_count = db.Column(db.Integer)
+    flap_ended_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_status_change_service_created', 'service_id', 'created_at', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -153,5 +207,113 @@ class StatusChange(db.Model):
             'old_status': self.old_status,
             'new_status': self.new_status,
             'changed_by': self.changed_by,
+            'created_at': self.created_at.isoformat(),
+            'flap_count': self.flap_count,
+            'flap_ended_at': self.flap_ended_at.isoformat() if self.flap_ended_at else None
+        }
+
+class StatusChangeArchive(db.Model):
+    """StatusChange rows moved out of the hot table"""
+    id = db.Column(db.Integer, primary_key=True)
+    # Ids of deleted rows can be handed out again, so this is not unique
+    original_id = db.Column(db.Integer, nullable=False)
+    service_id = db.Column(db.Integer, nullable=False)
+    old_status = db.Column(db.String(32))
+    new_status = db.Column(db.String(32), nullable=False)
+    changed_by = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime)
+    flap_count = db.Column(db.Integer)
+    flap_ended_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_status_change_archive_service_created', 'service_id', 'created_at'),
+    )
+
+class IncidentUpdateArchive(db.Model):
+    """IncidentUpdate rows moved out of the hot table"""
+    id = db.Column(db.Integer, primary_key=True)
+    original_id = db.Column(db.Integer, nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(32), nullable=False)
+    incident_id = db.Column(db.Integer, nullable=False)
+    created_by = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_incident_update_archive_incident_created', 'incident_id', 'created_at'),
+    )
+
+class Subscriber(db.Model):
+    """Receives incident notifications of an organization by webhook or email"""
+    id = db.Column(db.Integer, primary_key=True)
+    organization_id = db.Column(db.Integer, db.ForeignKey('organization.id'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # webhook, email
+    target = db.Column(db.String(512), nullable=False)  # URL or email address
+    secret = db.Column(db.String(128))  # signs webhook bodies when set
+    is_active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('organization_id', 'kind', 'target', name='uq_subscriber_target'),
+        db.Index('ix_subscriber_org_active', 'organization_id', 'is_active', 'id'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'organization_id': self.organization_id,
+            'kind': self.kind,
+            'target': self.target,
+            'has_secret': bool(self.secret),
+            'is_active': self.is_active,
             'created_at': self.created_at.isoformat()
         }
+
+class NotificationJob(db.Model):
+    """A unit of work of the notification queue (see notifications.py).
+
+    A fanout job holds an incident event; a worker expands it into webhook
+    and email jobs for batches of subscribers, which are retried with
+    backoff for the subscribers that failed.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    organization_id = db.Column(db.Integer, db.ForeignKey('organization.id'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # fanout, webhook, email
+    payload = db.Column(db.Text, nullable=False)  # JSON event
+    subscriber_ids = db.Column(db.Text)  # JSON list, for webhook and email jobs
+    status = db.Column(db.String(16), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(64))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.String(512))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_notification_job_status_run_after', 'status', 'run_after'),
+    )
+
+class StatusRollup(db.Model):
+    """Seconds a service spent in a status during one hour or day bucket"""
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.Integer, db.ForeignKey('service.id'), nullable=False)
+    period = db.Column(db.String(8), nullable=False)  # hour, day
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(32), nullable=False)
+    seconds = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('service_id', 'period', 'bucket_start', 'status', name='uq_status_rollup_bucket'),
+    )
+    
+    def to_dict(self):
+        return {
+            'service_id': self.service_id,
+            'period': self.period,
+            'bucket_start': self.bucket_start.isoformat(),
+            'status': self.status,
+            'seconds': self.seconds
+        }
@@ -0,0 +1,343 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import smtplib
+import socket
+import time
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import aiohttp
+from sqlalchemy import and_, insert, or_, select, update
+
+from metrics import registry
+from models import db, NotificationJob, Organization, Subscriber
+from outbound import BlockedAddress, Guard
+import serializers
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_KINDS = ('webhook', 'email')
+
+delivery_count = registry.counter('notify_deliveries_total', 'Notification deliveries, by channel and result', ['channel', 'result'])
+delivery_duration = registry.histogram('notify_delivery_duration_seconds', 'Time to deliver one notification, by channel', ['channel'])
+job_count = registry.counter('notify_jobs_total', 'Notification jobs processed, by kind and result', ['kind', 'result'])
+queue_delay = registry.histogram(
+    'notify_queue_delay_seconds', 'Time from enqueueing an event to its first delivery attempt',
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+)
+
+Job = namedtuple('Job', ['id', 'kind', 'organization_id', 'payload', 'subscriber_ids', 'attempts', 'token'])
+Target = namedtuple('Target', ['id', 'kind', 'target', 'secret'])
+
+
+def enqueue(organization_id, event, incident, update=None):
+    """Add a fanout job for an incident event to the session; it is committed
+    with the write it announces, so no event is lost or sent for a rollback"""
+    payload = {'event': event, 'incident': incident, 'update': update, 'enqueued_at': time.time()}
+    db.session.add(NotificationJob(
+        organization_id=organization_id,
+        kind='fanout',
+        payload=serializers.encode(payload).decode('utf-8'),
+        run_after=datetime.utcnow()
+    ))
+
+
+def validate_subscriber(data, guard=None):
+    """Return an error message for an invalid subscriber, or None; with a
+    guard, also when a webhook target may not be reached"""
+    kind = data.get('kind')
+    target = data.get('target')
+    if kind not in SUBSCRIBER_KINDS:
+        return 'kind must be webhook or email'
+    if not isinstance(target, str) or not target or len(target) > 512:
+        return 'target is required'
+    if kind == 'webhook' and not target.startswith(('http://', 'https://')):
+        return 'target must be an http:// or https:// URL'
+    if kind == 'email' and ('@' not in target or any(c.isspace() for c in target)):
+        return 'target must be an email address'
+    if kind == 'webhook' and guard is not None:
+        return guard.check_url(target)
+    return None
+
+
+def backoff(attempts, base, maximum):
+    """Seconds before retry number `attempts`: exponential, with jitter"""
+    delay = min(maximum, base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def sign(secret, body):
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def email_message(sender, recipient, payload, base_url):
+    """base_url is where the frontend serves the public pages"""
+    incident = payload['incident']
+    organization = payload['organization']['name']
+    status = incident['status'].replace('_', ' ')
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient
+    message['Subject'] = f"[{organization}] {incident['title']} ({status})"
+    lines = [f"{incident['title']}", f"Status: {status}", f"Impact: {incident['impact']}", '']
+    if payload.get('update'):
+        lines += [payload['update']['message'], '']
+    elif incident.get('description'):
+        lines += [incident['description'], '']
+    lines.append(f"Status page: {base_url.rstrip('/')}/public/{payload['organization']['slug']}")
+    message.set_content('\n'.join(lines))
+    return message
+
+
+# Queue operations; each runs in its own application context on a thread
+def claim(worker_id, limit, lease_seconds):
+    """Lock up to limit due jobs (or jobs whose worker's lease expired)"""
+    now = datetime.utcnow()
+    due = or_(
+        and_(NotificationJob.status == 'pending', NotificationJob.run_after <= now),
+        and_(NotificationJob.status == 'running', NotificationJob.locked_until < now),
+    )
+    candidates = select(NotificationJob.id).where(due).order_by(NotificationJob.run_after, NotificationJob.id).limit(limit)
+    if db.engine.dialect.name in ('mysql', 'postgresql'):
+        candidates = candidates.with_for_update(skip_locked=True)
+    ids = db.session.scalars(candidates).all()
+    if not ids:
+        db.session.rollback()
+        return []
+
+    # The guarded UPDATE makes the claim safe where SKIP LOCKED is not
+    # available: a job taken by another worker in the meantime no longer matches
+    token = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    db.session.execute(update(NotificationJob).where(NotificationJob.id.in_(ids), due).values(
+        status='running', locked_by=token, locked_until=now + timedelta(seconds=lease_seconds)
+    ))
+    db.session.commit()
+    rows = db.session.query(NotificationJob).filter(
+        NotificationJob.id.in_(ids), NotificationJob.locked_by == token
+    ).order_by(NotificationJob.id)
+    return [Job(
+        row.id, row.kind, row.organization_id, json.loads(row.payload),
+        json.loads(row.subscriber_ids) if row.subscriber_ids else None, row.attempts, token
+    ) for row in rows]
+
+
+def expand(job, batch_size):
+    """Turn a fanout job into delivery jobs of up to batch_size subscribers"""
+    organization = db.session.get(Organization, job.organization_id)
+    payload = dict(job.payload, organization={'name': organization.name, 'slug': organization.slug})
+    encoded = serializers.encode(payload).decode('utf-8')
+    batches = {kind: [] for kind in SUBSCRIBER_KINDS}
+    rows = db.session.query(Subscriber.id, Subscriber.kind).filter(
+        Subscriber.organization_id == job.organization_id, Subscriber.is_active.is_(True)
+    ).order_by(Subscriber.id)
+    for subscriber_id, kind in rows:
+        batches[kind].append(subscriber_id)
+
+    now = datetime.utcnow()
+    jobs = [{
+        'organization_id': job.organization_id,
+        'kind': kind,
+        'payload': encoded,
+        'subscriber_ids': json.dumps(ids[start:start + batch_size]),
+        'status': 'pending',
+        'attempts': 0,
+        'run_after': now,
+        'created_at': now,
+    } for kind, ids in batches.items() for start in range(0, len(ids), batch_size)]
+    for start in range(0, len(jobs), 500):
+        db.session.execute(insert(NotificationJob.__table__).values(jobs[start:start + 500]))
+    finish(job, [], None)
+    return len(jobs)
+
+
+def load_targets(subscriber_ids):
+    """Active subscribers among subscriber_ids (some may have unsubscribed)"""
+    rows = db.session.query(Subscriber.id, Subscriber.kind, Subscriber.target, Subscriber.secret).filter(
+        Subscriber.id.in_(subscriber_ids), Subscriber.is_active.is_(True)
+    )
+    targets = [Target(*row) for row in rows]
+    db.session.rollback()
+    return targets
+
+
+def finish(job, failed_ids, error, max_attempts=1, backoff_base=30, backoff_max=3600):
+    """Complete a job, or keep it for another attempt at the subscribers that
+    failed (the whole job when error is set without failed_ids)"""
+    now = datetime.utcnow()
+    values = {'locked_by': None, 'locked_until': None}
+    if not failed_ids and error is None:
+        result = 'done'
+        values.update(status='done', finished_at=now)
+    else:
+        attempts = job.attempts + 1
+        values.update(attempts=attempts, last_error=(error or '')[:512])
+        if failed_ids:
+            values['subscriber_ids'] = json.dumps(failed_ids)
+        if attempts >= max_attempts:
+            result = 'failed'
+            values.update(status='failed', finished_at=now)
+        else:
+            result = 'retry'
+            values.update(status='pending', run_after=now + timedelta(seconds=backoff(attempts, backoff_base, backoff_max)))
+    # Only while the lease is still ours; otherwise another worker owns it now
+    db.session.execute(update(NotificationJob).where(
+        NotificationJob.id == job.id, NotificationJob.locked_by == job.token
+    ).values(**values))
+    db.session.commit()
+    job_count.labels(job.kind, result).inc()
+    return result
+
+
+def send_emails(config, targets, payload):
+    """Send over one SMTP connection; returns (failed ids, last error)"""
+    failed, error = [], None
+    start = time.perf_counter()
+    try:
+        with smtplib.SMTP(config['SMTP_HOST'], config['SMTP_PORT'], timeout=config['NOTIFY_TIMEOUT_SECONDS']) as smtp:
+            if config['SMTP_STARTTLS']:
+                smtp.starttls()
+            if config['SMTP_USERNAME']:
+                smtp.login(config['SMTP_USERNAME'], config['SMTP_PASSWORD'])
+            for index, target in enumerate(targets):
+                try:
+                    smtp.send_message(email_message(
+                        config['NOTIFY_EMAIL_FROM'], target.target, payload, config['PUBLIC_BASE_URL']
+                    ))
+                    delivery_count.labels('email', 'sent').inc()
+                except smtplib.SMTPRecipientsRefused as e:
+                    failed.append(target.id)
+                    error = str(e)
+                    delivery_count.labels('email', 'failed').inc()
+                except (OSError, smtplib.SMTPException) as e:
+                    # The connection is gone: everyone left fails this attempt
+                    remaining = [t.id for t in targets[index:]]
+                    failed.extend(remaining)
+                    error = str(e)
+                    delivery_count.labels('email', 'failed').inc(len(remaining))
+                    break
+    except (OSError, smtplib.SMTPException) as e:
+        failed = [target.id for target in targets]
+        error = f'SMTP {config["SMTP_HOST"]}:{config["SMTP_PORT"]}: {e}'
+        delivery_count.labels('email', 'failed').inc(len(failed))
+    if targets:
+        delivery_duration.labels('email').observe((time.perf_counter() - start) / len(targets))
+    return failed, error
+
+
+class NotificationWorker:
+    """Processes the notification queue on an asyncio loop.
+
+    Claims up to `claim_size` due jobs at a time. Webhook jobs are posted
+    concurrently (at most `concurrency` requests in flight) over one pooled
+    aiohttp session; email jobs are sent over one SMTP connection per batch
+    on a thread. Subscribers that fail are retried with exponential backoff
+    until NOTIFY_MAX_ATTEMPTS. Several workers can share the queue. Webhook
+    targets are checked against WEBHOOK_ALLOWED_HOSTS and the public address
+    rule on every connection, and redirects are not followed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.guard = Guard(app.config['WEBHOOK_ALLOWED_HOSTS'])
+        self.concurrency = app.config['NOTIFY_CONCURRENCY']
+        self._session = None
+        self._semaphore = None
+        self._sent = 0
+        self._reported = (time.monotonic(), 0)
+
+    def _in_context(self, function, *args, **kwargs):
+        with self.app.app_context():
+            return function(*args, **kwargs)
+
+    async def run(self, until_idle=False):
+        """Process jobs forever, or until the queue has no due job left"""
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300, resolver=self.guard.resolver())
+        timeout = aiohttp.ClientTimeout(total=self.config['NOTIFY_TIMEOUT_SECONDS'])
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            self._session = session
+            while True:
+                try:
+                    jobs = await asyncio.to_thread(
+                        self._in_context, claim, self.worker_id, self.config['NOTIFY_CLAIM_SIZE'],
+                        self.config['NOTIFY_LEASE_SECONDS']
+                    )
+                except Exception:
+                    logger.exception('Claiming notification jobs failed')
+                    jobs = []
+                if not jobs:
+                    if until_idle:
+                        return
+                    await asyncio.sleep(self.config['NOTIFY_POLL_SECONDS'])
+                    continue
+                await asyncio.gather(*(self.process(job) for job in jobs))
+                self._report()
+
+    async def process(self, job):
+        try:
+            if job.kind == 'fanout':
+                await asyncio.to_thread(self._in_context, expand, job, self.config['NOTIFY_BATCH_SIZE'])
+                return
+            if job.attempts == 0 and job.payload.get('enqueued_at'):
+                queue_delay.observe(max(0.0, time.time() - job.payload['enqueued_at']))
+            targets = await asyncio.to_thread(self._in_context, load_targets, job.subscriber_ids)
+            if job.kind == 'webhook':
+                failed, error = await self.send_webhooks(targets, job.payload)
+            elif not self.config['SMTP_HOST']:
+                failed = [target.id for target in targets]
+                error = 'SMTP_HOST is not set' if failed else None
+            else:
+                failed, error = await asyncio.to_thread(send_emails, self.config, targets, job.payload)
+            self._sent += len(targets) - len(failed)
+        except Exception as e:
+            # Retry the whole job
+            failed, error = job.subscriber_ids or [], f'{type(e).__name__}: {e}'
+            logger.exception('Notification job %s failed', job.id)
+        try:
+            await asyncio.to_thread(
+                self._in_context, finish, job, failed, error, self.config['NOTIFY_MAX_ATTEMPTS'],
+                self.config['NOTIFY_BACKOFF_SECONDS'], self.config['NOTIFY_BACKOFF_MAX_SECONDS']
+            )
+        except Exception:
+            # The lease expires and another attempt picks the job up again
+            logger.exception('Finishing notification job %s failed', job.id)
+
+    async def send_webhooks(self, targets, payload):
+        body = serializers.encode(payload)
+        results = await asyncio.gather(*(self._post(target, body, payload['event']) for target in targets))
+        errors = [(target.id, error) for target, error in zip(targets, results) if error]
+        return [target_id for target_id, _ in errors], (errors[-1][1] if errors else None)
+
+    async def _post(self, target, body, event):
+        headers = {'Content-Type': 'application/json', 'X-Status-Event': event, 'User-Agent': 'status-app-notifier'}
+        if target.secret:
+            headers['X-Status-Signature'] = sign(target.secret, body)
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                self.guard.check_literal(target.target)
+                async with self._session.post(target.target, data=body, headers=headers, allow_redirects=False) as response:
+                    await response.read()
+                    error = None if 200 <= response.status < 300 else f'HTTP {response.status} from {target.target}'
+            except (aiohttp.ClientError, asyncio.TimeoutError, BlockedAddress) as e:
+                error = f'{target.target}: {type(e).__name__} {e}'
+            delivery_duration.labels('webhook').observe(time.perf_counter() - start)
+        delivery_count.labels('webhook', 'failed' if error else 'sent').inc()
+        return error
+
+    def _report(self):
+        started, sent = self._reported
+        now = time.monotonic()
+        if now - started >= self.config['NOTIFY_STATS_SECONDS']:
+            print(f'Notifications: {self._sent - sent} delivered in {now - started:.0f}s '
+                  f'({(self._sent - sent) / (now - started):.1f}/s)')
+            self._reported = (now, self._sent)
@@ -0,0 +1,113 @@
+import asyncio
+import errno
+import ipaddress
+import socket
+from urllib.parse import urlsplit
+
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+
+
+class BlockedAddress(OSError):
+    """A target chosen by a user resolves to an address it may not reach"""
+
+    def __init__(self, message):
+        # aiohttp reports connection errors by their strerror
+        super().__init__(errno.EACCES, message)
+
+    def __str__(self):
+        return self.strerror
+
+
+def is_public(address):
+    """Whether an IP address is globally routable: not loopback, private,
+    link-local (cloud metadata endpoints included), multicast or reserved"""
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def url_host(url):
+    """(host, port) of an http(s) URL; raises ValueError"""
+    parts = urlsplit(url)
+    if not parts.hostname:
+        raise ValueError('target must include a host')
+    return parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80)
+
+
+class Guard:
+    """Keeps connections to targets chosen by users (health checks and
+    webhooks) off the internal network.
+
+    Every address a target resolves to must be public. Hosts listed in
+    allowed_hosts are exempt, for internal services probed on purpose.
+    check() validates a target when it is saved; resolve() and resolver()
+    validate it again on every connection, so a name that is later pointed
+    at an internal address is refused too.
+    """
+
+    def __init__(self, allowed_hosts=()):
+        self.allowed_hosts = {host.strip().lower().rstrip('.') for host in allowed_hosts if host.strip()}
+
+    def allows(self, host):
+        return host.lower().rstrip('.') in self.allowed_hosts
+
+    def verify(self, host, addresses):
+        """Return addresses, or raise BlockedAddress if host may not reach them"""
+        if not addresses:
+            raise BlockedAddress(f'{host} does not resolve')
+        if not self.allows(host) and not all(is_public(address) for address in addresses):
+            raise BlockedAddress(f'{host} resolves to a private or reserved address')
+        return addresses
+
+    def check(self, host, port):
+        """Return an error message when host may not be reached, or None;
+        blocks on the DNS lookup"""
+        if self.allows(host):
+            return None
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            self.verify(host, [info[4][0] for info in infos])
+        except (OSError, UnicodeError) as e:
+            return str(e) if isinstance(e, BlockedAddress) else f'{host} does not resolve'
+        return None
+
+    def check_url(self, url):
+        try:
+            return self.check(*url_host(url))
+        except ValueError as e:
+            return str(e)
+
+    def check_literal(self, url):
+        """Raise BlockedAddress for a URL whose host is a non-public IP
+        address, which aiohttp connects to without calling the resolver"""
+        host, _ = url_host(url)
+        try:
+            ipaddress.ip_address(host)
+        except ValueError:
+            return
+        self.verify(host, [host])
+
+    async def resolve(self, host, port):
+        """Addresses of host to connect to; raises BlockedAddress"""
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        return self.verify(host, [info[4][0] for info in infos])
+
+    def resolver(self):
+        """aiohttp resolver applying the same rule"""
+        return GuardedResolver(self)
+
+
+class GuardedResolver(AbstractResolver):
+    def __init__(self, guard):
+        self.guard = guard
+        self._resolver = DefaultResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        hosts = await self._resolver.resolve(host, port, family)
+        self.guard.verify(host, [entry['host'] for entry in hosts])
+        return hosts
+
+    async def close(self):
+        await self._resolver.close()
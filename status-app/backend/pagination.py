@@ -0,0 +1,85 @@
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(row):
+    raw = f"{row.created_at.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeError):
+        raise PaginationError('Invalid cursor')
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, MAX_LIMIT)
+
+
+def parse_timestamp(value, name):
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise PaginationError(f'{name} must be an ISO 8601 timestamp')
+    # Timestamps are stored as naive UTC
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+
+def filter_time_range(query, model, args):
+    """Apply since/until query parameters to model.created_at"""
+    since = parse_timestamp(args.get('since'), 'since')
+    until = parse_timestamp(args.get('until'), 'until')
+    if since is not None:
+        query = query.filter(model.created_at >= since)
+    if until is not None:
+        query = query.filter(model.created_at < until)
+    return query
+
+
+def paginate(query, model, cursor=None, limit=DEFAULT_LIMIT):
+    """Keyset pagination over (created_at, id), newest first.
+
+    Returns the rows of the page and the cursor for the next page, or None
+    when this is the last page.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    return next_page(rows, limit)
+
+
+def next_page(rows, limit=DEFAULT_LIMIT):
+    """Split rows fetched with limit + 1 into the page and the cursor for the
+    next page, or None when this is the last page"""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+class PasswordHasher:
+    """bcrypt hashing and verification off the request thread.
+
+    bcrypt releases the GIL, so running it in OS threads keeps the eventlet hub
+    (and every WebSocket on the worker) responsive during bursts of logins.
+    Under eventlet the work goes to eventlet's native thread pool; otherwise
+    to a bounded ThreadPoolExecutor. With workers=0 it runs inline.
+    """
+
+    def __init__(self, app=None, async_mode=None):
+        self.rounds = 12
+        self.workers = 0
+        self._execute = None
+        if app is not None:
+            self.init_app(app, async_mode)
+
+    def init_app(self, app, async_mode=None):
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        if not self.workers:
+            self._execute = None
+        elif async_mode == 'eventlet':
+            from eventlet import tpool
+            tpool.set_num_threads(self.workers)
+            self._execute = tpool.execute
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            self._execute = lambda fn, *args: executor.submit(fn, *args).result()
+
+    def _run(self, fn, *args):
+        if self._execute is None:
+            return fn(*args)
+        return self._execute(fn, *args)
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, password_hash):
+        if not password_hash:
+            return False
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        """True when password_hash was made with a different cost factor"""
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (AttributeError, IndexError, ValueError):
+            return True
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import random
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from metrics import registry
+from models import db, Service, ServiceCheck
+from outbound import Guard
+
+logger = logging.getLogger(__name__)
+
+# Probe outcomes are the service statuses they lead to
+UP, DEGRADED, DOWN = 'operational', 'degraded', 'major_outage'
+# Statuses set by hand that probes leave alone until someone changes them
+HELD_STATUSES = ('maintenance',)
+
+check_count = registry.counter('probe_checks_total', 'Health checks run, by kind and outcome', ['kind', 'outcome'])
+check_duration = registry.histogram('probe_duration_seconds', 'Time to run one health check, by kind', ['kind'])
+transition_count = registry.counter('probe_transitions_total', 'Service status changes made by the prober', ['status'])
+in_flight = registry.gauge('probe_in_flight', 'Health checks currently running')
+
+Check = namedtuple('Check', [
+    'id', 'service_id', 'kind', 'target', 'interval', 'timeout', 'expected_status', 'degraded_ms',
+    'failure_threshold', 'recovery_threshold'
+])
+Result = namedtuple('Result', ['outcome', 'latency_ms', 'error'])
+
+# Accepted range of each numeric check setting; all but timeout_seconds are
+# stored in Integer columns
+CHECK_LIMITS = {
+    'interval_seconds': (1, 86400),
+    'timeout_seconds': (0.1, 60),
+    'failure_threshold': (1, 100),
+    'recovery_threshold': (1, 100),
+    'degraded_ms': (1, 60000),
+    'expected_status': (100, 599),
+}
+
+
+def load_checks():
+    """Enabled checks and the current status of their services; needs an
+    application context"""
+    rows = db.session.query(ServiceCheck, Service.status).join(
+        Service, Service.id == ServiceCheck.service_id
+    ).filter(ServiceCheck.enabled.is_(True)).all()
+    checks = {}
+    for check, status in rows:
+        checks[check.id] = (Check(
+            check.id, check.service_id, check.kind, check.target, check.interval_seconds, check.timeout_seconds,
+            check.expected_status, check.degraded_ms, check.failure_threshold, check.recovery_threshold
+        ), status)
+    return checks
+
+
+def parse_tcp_target(target):
+    """'host:port' (or tcp://host:port) -> (host, port)"""
+    parts = urlsplit(target if '//' in target else f'tcp://{target}')
+    if not parts.hostname or not parts.port:
+        raise ValueError(f'TCP target must be host:port, got {target!r}')
+    return parts.hostname, parts.port
+
+
+def validate_check(data, guard=None):
+    """Return an error message for an invalid check configuration, or None;
+    with a guard, also when the target may not be probed"""
+    kind = data.get('kind', 'http')
+    target = data.get('target')
+    if kind not in ('http', 'tcp'):
+        return 'kind must be http or tcp'
+    if not isinstance(target, str) or not target:
+        return 'target is required'
+    if kind == 'http' and urlsplit(target).scheme not in ('http', 'https'):
+        return 'target must be an http:// or https:// URL'
+    if kind == 'tcp':
+        try:
+            parse_tcp_target(target)
+        except ValueError as e:
+            return str(e)
+    for field, (minimum, maximum) in CHECK_LIMITS.items():
+        value = data.get(field)
+        # Only these two can be cleared
+        if value is None and (field not in data or field in ('expected_status', 'degraded_ms')):
+            continue
+        expected, types = ('a number', (int, float)) if field == 'timeout_seconds' else ('an integer', int)
+        # The range test also rejects NaN
+        if isinstance(value, bool) or not isinstance(value, types) or not minimum <= value <= maximum:
+            return f'{field} must be {expected} between {minimum} and {maximum}'
+    if 'enabled' in data and not isinstance(data['enabled'], bool):
+        return 'enabled must be true or false'
+    if guard is not None:
+        return guard.check_url(target) if kind == 'http' else guard.check(*parse_tcp_target(target))
+    return None
+
+
+class Hysteresis:
+    """Turns a stream of probe outcomes into status transitions.
+
+    A different outcome must repeat failure_threshold times in a row (or
+    recovery_threshold times to go back to operational) before the status
+    changes, so a single slow or failed probe does not flap the service.
+    A service in one of HELD_STATUSES never transitions.
+    """
+
+    def __init__(self, status):
+        self.status = status
+        self.candidate = None
+        self.count = 0
+
+    def observe(self, outcome, failure_threshold, recovery_threshold):
+        """Return the new status on a transition, else None"""
+        if outcome == self.status or self.status in HELD_STATUSES:
+            self.candidate, self.count = None, 0
+            return None
+        if outcome != self.candidate:
+            self.candidate, self.count = outcome, 0
+        self.count += 1
+        if self.count < (recovery_threshold if outcome == UP else failure_threshold):
+            return None
+        self.status, self.candidate, self.count = outcome, None, 0
+        return outcome
+
+
+class Prober:
+    """Runs the service health checks concurrently on an asyncio loop.
+
+    Checks are reloaded every refresh_interval seconds, so configuration
+    changes and manual status changes are picked up without a restart. At
+    most `concurrency` checks run at once; HTTP checks share one session so
+    connections to the same host are kept alive between checks. Status
+    transitions are collected and handed to apply_transitions({service_id:
+    (old_status, new_status)}) in batches, on a thread since it writes
+    through the ORM; it returns the statuses actually written, skipping
+    services no longer at old_status. Targets are checked against
+    PROBE_ALLOWED_HOSTS and the public address rule on every connection.
+    """
+
+    def __init__(self, app, apply_transitions, concurrency=200, refresh_interval=30.0, flush_interval=0.5):
+        self.app = app
+        self.guard = Guard(app.config['PROBE_ALLOWED_HOSTS'])
+        self.apply_transitions = apply_transitions
+        self.concurrency = concurrency
+        self.refresh_interval = refresh_interval
+        self.flush_interval = flush_interval
+        self.checks = {}
+        self._states = {}
+        self._due = {}
+        self._running = set()
+        self._tasks = set()
+        self._pending = {}
+        self._session = None
+        self._semaphore = None
+
+    async def run(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300, resolver=self.guard.resolver())
+        async with aiohttp.ClientSession(connector=connector, headers={'User-Agent': 'status-app-prober'}) as session:
+            self._session = session
+            flusher = asyncio.create_task(self._flush_loop())
+            try:
+                next_refresh = 0.0
+                while True:
+                    now = time.monotonic()
+                    if now >= next_refresh:
+                        await self.refresh()
+                        next_refresh = now + self.refresh_interval
+                    self._start_due(now)
+                    await asyncio.sleep(min(1.0, max(0.01, min(self._due.values(), default=now + 1) - now)))
+            finally:
+                flusher.cancel()
+                await self.flush()
+
+    async def refresh(self):
+        try:
+            loaded = await asyncio.to_thread(self._load)
+        except Exception:
+            logger.exception('Loading health checks failed')
+            return
+        now = time.monotonic()
+        for check_id, (check, status) in loaded.items():
+            state = self._states.get(check.service_id)
+            if state is None:
+                self._states[check.service_id] = Hysteresis(status)
+                # Spread the first runs over the interval instead of all at once
+                self._due[check_id] = now + random.uniform(0, check.interval)
+            elif state.status != status and check.service_id not in self._pending:
+                # Changed by hand since the last refresh
+                self._states[check.service_id] = Hysteresis(status)
+        for check_id in set(self.checks) - set(loaded):
+            self._due.pop(check_id, None)
+            self._states.pop(self.checks[check_id].service_id, None)
+        self.checks = {check_id: check for check_id, (check, _) in loaded.items()}
+
+    def _load(self):
+        with self.app.app_context():
+            return load_checks()
+
+    def _start_due(self, now):
+        for check_id, due in list(self._due.items()):
+            if due <= now and check_id not in self._running:
+                check = self.checks[check_id]
+                self._due[check_id] = now + check.interval
+                self._running.add(check_id)
+                task = asyncio.create_task(self._run_check(check))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run_check(self, check):
+        try:
+            async with self._semaphore:
+                in_flight.inc()
+                try:
+                    result = await self.probe(check)
+                finally:
+                    in_flight.dec()
+            check_count.labels(check.kind, result.outcome).inc()
+            state = self._states.get(check.service_id)
+            if check.id not in self.checks or state is None:
+                return
+            previous = state.status
+            status = state.observe(result.outcome, check.failure_threshold, check.recovery_threshold)
+            if status is not None:
+                # Several transitions before a flush start from the first one's status
+                previous = self._pending.get(check.service_id, (previous,))[0]
+                self._pending[check.service_id] = (previous, status)
+        finally:
+            self._running.discard(check.id)
+
+    async def probe(self, check):
+        start = time.perf_counter()
+        try:
+            if check.kind == 'tcp':
+                await self._probe_tcp(check)
+            else:
+                await self._probe_http(check)
+        except Exception as e:
+            return Result(DOWN, None, str(e) or type(e).__name__)
+        finally:
+            check_duration.labels(check.kind).observe(time.perf_counter() - start)
+        latency_ms = (time.perf_counter() - start) * 1000
+        if check.degraded_ms and latency_ms > check.degraded_ms:
+            return Result(DEGRADED, latency_ms, None)
+        return Result(UP, latency_ms, None)
+
+    async def _probe_http(self, check):
+        timeout = aiohttp.ClientTimeout(total=check.timeout)
+        self.guard.check_literal(check.target)
+        async with self._session.get(check.target, timeout=timeout, allow_redirects=False) as response:
+            # Read the body so the connection goes back to the pool
+            await response.read()
+            if check.expected_status is not None:
+                ok = response.status == check.expected_status
+            else:
+                ok = 200 <= response.status < 400
+            if not ok:
+                raise ValueError(f'HTTP {response.status}')
+
+    async def _probe_tcp(self, check):
+        host, port = parse_tcp_target(check.target)
+        addresses = await asyncio.wait_for(self.guard.resolve(host, port), check.timeout)
+        _, writer = await asyncio.wait_for(asyncio.open_connection(addresses[0], port), check.timeout)
+        writer.close()
+        await writer.wait_closed()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            written = await asyncio.to_thread(self.apply_transitions, pending)
+        except Exception:
+            logger.exception('Writing %d probe transitions failed', len(pending))
+            # Forget them; the next refresh resyncs with the database
+            for service_id in pending:
+                self._states.pop(service_id, None)
+            return
+        for status in written.values():
+            transition_count.labels(status).inc()
+        # Changed by hand meanwhile; the next refresh resyncs them
+        for service_id in set(pending) - set(written):
+            self._states.pop(service_id, None)
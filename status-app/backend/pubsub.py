@@ -0,0 +1,62 @@
+import os
+
+import socketio
+
+# Reserved event/room used to fan out cache invalidations between workers over
+# the Socket.IO message queue; it is never delivered to clients
+INTERNAL_EVENT = '_status_app_internal'
+INTERNAL_ROOM = '_status_app_internal'
+
+
+class InternalMessageMixin:
+    """Intercepts internal messages published on the Socket.IO message queue.
+
+    Every worker shares the queue used for room fan-out, so it also carries
+    notifications such as "organization changed" that each worker must apply
+    to its in-process caches. Messages published by this worker are skipped
+    because they have already been applied locally.
+
+    on_room_message, when set, sees every other message before it is
+    delivered to the room; those include this worker's own emits, which also
+    make the round trip through the queue.
+    """
+
+    on_internal_message = None
+    on_room_message = None
+
+    def _handle_emit(self, message):
+        if message.get('event') != INTERNAL_EVENT:
+            if self.on_room_message:
+                self.on_room_message(message)
+            return super()._handle_emit(message)
+        if message.get('host_id') != self.host_id and self.on_internal_message:
+            self.on_internal_message(message['data'])
+
+
+def create_client_manager(url, channel, queue_folder=None):
+    """Build the Socket.IO client manager for url, like Flask-SocketIO does,
+    with internal message support.
+
+    filesystem:// selects Kombu's filesystem transport, a broker-less stand-in
+    that lets several workers on one host share rooms through queue_folder.
+    """
+    options = {}
+    if url.startswith(('redis://', 'rediss://')):
+        base = socketio.RedisManager
+    elif url.startswith('kafka://'):
+        base = socketio.KafkaManager
+    elif url.startswith('zmq'):
+        base = socketio.ZmqManager
+    else:
+        base = socketio.KombuManager
+        if url.startswith('filesystem://'):
+            os.makedirs(queue_folder, exist_ok=True)
+            options['connection_options'] = {'transport_options': {
+                'data_folder_in': queue_folder,
+                'data_folder_out': queue_folder,
+                'control_folder': queue_folder,
+                'polling_interval': 0.05,
+            }}
+
+    manager_class = type('StatusApp' + base.__name__, (InternalMessageMixin, base), {})
+    return manager_class(url, channel=channel, **options)
@@ -0,0 +1,214 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+
+try:
+    import redis
+except ImportError:  # only needed for a redis:// RATE_LIMIT_STORAGE
+    redis = None
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+limited_count = registry.counter(
+    'rate_limit_requests_total', 'Requests checked against a rate limit, by result', ['limit', 'key', 'result']
+)
+store_errors = registry.counter('rate_limit_store_errors_total', 'Limiter store failures (requests were let through)')
+
+
+def parse_rate(value):
+    """'10/minute' -> (capacity, tokens per second); the capacity is the burst"""
+    count, _, period = value.partition('/')
+    count = int(count)
+    if count <= 0 or period not in PERIODS:
+        raise ValueError(f'Invalid rate limit {value!r}, expected e.g. 10/minute')
+    return count, count / PERIODS[period]
+
+
+class MemoryStore:
+    """Token buckets in process memory, least recently used evicted first.
+
+    Each worker limits on its own; an evicted bucket simply starts full again.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets, cost=1):
+        """Take cost tokens from each (key, capacity, rate) bucket, or from
+        none of them when one is short; returns for each bucket 0 when it
+        holds enough tokens, else the seconds until it does"""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, capacity, rate in buckets:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                levels.append(min(capacity, tokens + (now - updated) * rate))
+            waits = [0 if tokens >= cost else (cost - tokens) / rate for tokens, (_, _, rate) in zip(levels, buckets)]
+            spend = 0 if any(waits) else cost
+            for tokens, (key, _, _) in zip(levels, buckets):
+                self._buckets[key] = (tokens - spend, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return waits
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisStore:
+    """Token buckets shared by all workers, updated atomically in Redis"""
+
+    # ARGV is cost, then capacity and rate of each key
+    SCRIPT = """
+    local cost = tonumber(ARGV[1])
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local levels, waits, short = {}, {}, false
+    for i, key in ipairs(KEYS) do
+        local capacity, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+        local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        levels[i] = tokens
+        if tokens >= cost then
+            waits[i] = '0'
+        else
+            waits[i] = tostring((cost - tokens) / rate)
+            short = true
+        end
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+        local tokens = levels[i]
+        if not short then
+            tokens = tokens - cost
+        end
+        redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    end
+    return waits
+    """
+
+    def __init__(self, url, prefix='ratelimit:'):
+        if redis is None:
+            raise RuntimeError('RATE_LIMIT_STORAGE=redis:// needs the redis package')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take(self, buckets, cost=1):
+        args = [cost]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        waits = self._take(keys=[self.prefix + ':'.join(key) for key, _, _ in buckets], args=args)
+        return [float(wait) for wait in waits]
+
+    def __len__(self):
+        return 0
+
+
+def create_store(url, max_keys=100000):
+    if url.startswith(('redis://', 'rediss://')):
+        return RedisStore(url)
+    if url != 'memory://':
+        raise ValueError(f'Unsupported RATE_LIMIT_STORAGE {url!r}')
+    return MemoryStore(max_keys)
+
+
+class RateLimiter:
+    """Token-bucket rate limits with budgets from RATE_LIMITS.
+
+    RATE_LIMITS maps a limit name to the keys it is counted by and a rate for
+    each, e.g. {'login': {'ip': '20/minute', 'user': '10/minute'}}. A request
+    must fit in the bucket of every key, and a refused one spends no token
+    from any of them; key functions return None to skip a key (e.g. no org
+    in the URL).
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.limits = {}
+        self.store = None
+        self.key_functions = {
+            'ip': lambda: request.remote_addr,
+            'org': lambda: (request.view_args or {}).get('org_slug'),
+        }
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        self.limits = {
+            name: {key: parse_rate(rate) for key, rate in keys.items()}
+            for name, keys in app.config['RATE_LIMITS'].items()
+        }
+        self.store = create_store(app.config['RATE_LIMIT_STORAGE'], app.config['RATE_LIMIT_MAX_KEYS'])
+        registry.gauge('rate_limit_buckets', 'Token buckets held in process memory',
+                       callback=lambda: [((), len(self.store))])
+
+    def key_function(self, key):
+        """Register the function that returns the value of a key kind"""
+        def decorator(function):
+            self.key_functions[key] = function
+            return function
+        return decorator
+
+    def check(self, name, values):
+        """Spend a token of limit name for each key value; returns 0 when the
+        request is allowed, else the seconds the client should wait"""
+        if not self.enabled:
+            return 0
+        buckets = [
+            ((name, key, str(values[key])), capacity, rate)
+            for key, (capacity, rate) in self.limits[name].items() if values.get(key) is not None
+        ]
+        if not buckets:
+            return 0
+        try:
+            waits = self.store.take(buckets)
+        except Exception as e:
+            # Fail open: a limiter outage must not take the API down
+            store_errors.inc()
+            logger.warning('Rate limit store failed: %s', e)
+            return 0
+        for ((_, key, _), _, _), key_wait in zip(buckets, waits):
+            limited_count.labels(name, key, 'limited' if key_wait else 'allowed').inc()
+        return max(waits)
+
+    def limit(self, name):
+        """Decorator answering 429 with Retry-After once a budget is spent"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled:
+                    values = {key: self.key_functions[key]() for key in self.limits[name]}
+                    wait = self.check(name, values)
+                    if wait:
+                        return too_many_requests(wait)
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
+
+
+def too_many_requests(wait):
+    response = jsonify({'error': 'Too many requests'})
+    response.status_code = 429
+    response.headers['Retry-After'] = retry_after(wait)
+    return response
@@ -0,0 +1,132 @@
+import logging
+import threading
+import time
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+replica_reads = registry.counter('db_replica_requests_total', 'Read-only requests served by each bind', ['bind'])
+replica_lag = registry.gauge('db_replica_lag_seconds', 'Last measured replication lag', ['bind'])
+replica_healthy = registry.gauge('db_replica_healthy', 'Whether the replica is used for reads (1) or not (0)', ['bind'])
+
+
+class RoutingSession(Session):
+    """Session that sends the queries of read-only requests to the replica
+    chosen for the request (g.replica_bind); flushes always go to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            bind_key = g.get('replica_bind')
+            if bind_key is not None:
+                return self._db.engines[bind_key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Chooses a replica bind for read-only requests.
+
+    Replicas are probed at most every check_interval seconds, from whichever
+    request needs one; a replica that fails the probe or lags more than
+    max_lag seconds is skipped. Reads for an organization stay on the primary
+    for sticky_seconds (or the current lag, if longer) after it was written,
+    so clients and snapshot caches see their own writes.
+    """
+
+    def __init__(self, app=None):
+        self.bind_keys = []
+        self.max_lag = 5.0
+        self.sticky_seconds = 5.0
+        self.check_interval = 2.0
+        self._state = {}
+        self._last_write = {}
+        self._next_check = 0.0
+        self._check_lock = threading.Lock()
+        self._next = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.bind_keys = [key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith('replica_')]
+        self.max_lag = app.config['REPLICA_MAX_LAG_SECONDS']
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        self.check_interval = app.config['REPLICA_CHECK_INTERVAL']
+        # Unchecked replicas are not used until the first probe succeeds
+        self._state = {key: (False, None) for key in self.bind_keys}
+
+    def watch(self, bind_key, engine):
+        """Stop using the replica as soon as one of its queries fails; the
+        next successful probe brings it back"""
+        @event.listens_for(engine, 'handle_error')
+        def on_error(context):
+            self._state[bind_key] = (False, None)
+            replica_healthy.labels(bind_key).set(0)
+
+    def note_write(self, org_slug):
+        self._last_write[org_slug] = time.monotonic()
+
+    def choose(self, engines, org_slug=None):
+        """Return the bind key of a usable replica, or None for the primary"""
+        if not self.bind_keys:
+            return None
+        self._maybe_check(engines)
+
+        healthy = [(key, lag) for key, (ok, lag) in self._state.items() if ok]
+        if not healthy:
+            return None
+        written = self._last_write.get(org_slug)
+        if written is not None:
+            window = max(self.sticky_seconds, max(lag for _, lag in healthy))
+            if time.monotonic() - written < window:
+                return None
+
+        # Round robin over the healthy replicas
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next][0]
+
+    def _maybe_check(self, engines):
+        now = time.monotonic()
+        if now < self._next_check or not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = now + self.check_interval
+            for key in self.bind_keys:
+                lag = measure_lag(engines[key])
+                ok = lag is not None and lag <= self.max_lag
+                self._state[key] = (ok, lag)
+                replica_healthy.labels(key).set(1 if ok else 0)
+                if lag is not None:
+                    replica_lag.labels(key).set(lag)
+        finally:
+            self._check_lock.release()
+
+
+def measure_lag(engine):
+    """Replication lag of engine in seconds, 0 when the server does not report
+    one (e.g. a SQLite copy), or None when it is unreachable or not replicating"""
+    try:
+        with engine.connect() as connection:
+            # Also proves the schema is there (a SQLite path may be any file)
+            connection.execute(text('SELECT 1 FROM organization LIMIT 1'))
+            if engine.dialect.name != 'mysql':
+                return 0.0
+            status = None
+            for statement in ('SHOW REPLICA STATUS', 'SHOW SLAVE STATUS'):
+                try:
+                    status = connection.execute(text(statement)).mappings().first()
+                    break
+                except Exception:
+                    continue
+            if status is None:
+                # Not a replica, or no privilege to ask: only reachability is known
+                return 0.0
+            lag = status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+            return None if lag is None else float(lag)
+    except Exception as e:
+        # Expected while a replica is down; no traceback every check
+        logger.warning('Replica check failed for %s: %s', engine.url.render_as_string(hide_password=True), e)
+        return None
@@ -0,0 +1,201 @@
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import aliased
+
+from metrics import registry
+from models import db, Incident, IncidentUpdate, IncidentUpdateArchive, Service, StatusChange, StatusChangeArchive, StatusRollup
+
+# Policy keys and the settings holding their defaults; RETENTION_POLICIES
+# overrides any of them per organization slug
+POLICY_SETTINGS = {
+    'status_change_days': 'RETENTION_STATUS_CHANGE_DAYS',
+    'incident_update_days': 'RETENTION_INCIDENT_UPDATE_DAYS',
+    'compact_after_days': 'RETENTION_COMPACT_AFTER_DAYS',
+    'flap_window_seconds': 'RETENTION_FLAP_WINDOW_SECONDS',
+    'flap_min_changes': 'RETENTION_FLAP_MIN_CHANGES',
+}
+
+row_count = registry.counter('retention_rows_total', 'History rows handled by retention, by table and action', ['table', 'action'])
+batch_duration = registry.histogram(
+    'retention_batch_duration_seconds', 'Time to run and commit one retention batch, by table', ['table'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+STATUS_CHANGE_COLUMNS = ['id', 'service_id', 'old_status', 'new_status', 'changed_by', 'created_at', 'flap_count', 'flap_ended_at']
+INCIDENT_UPDATE_COLUMNS = ['id', 'message', 'status', 'incident_id', 'created_by', 'created_at']
+
+
+def policy(config, org_slug):
+    """Retention policy of an organization: the defaults from config with
+    its RETENTION_POLICIES entry applied; 0 days keeps rows forever"""
+    overrides = config['RETENTION_POLICIES'].get(org_slug, {})
+    return {key: overrides.get(key, config[setting]) for key, setting in POLICY_SETTINGS.items()}
+
+
+def flap_runs(changes, window_seconds, min_changes):
+    """Split (id, old_status, new_status, changed_by, created_at) rows of one
+    service, oldest first, into runs at least min_changes long whose changes
+    are less than window_seconds apart"""
+    window = timedelta(seconds=window_seconds)
+    runs = []
+    run = []
+    for change in changes:
+        if run and change[4] - run[-1][4] >= window:
+            if len(run) >= min_changes:
+                runs.append(run)
+            run = []
+        run.append(change)
+    if len(run) >= min_changes:
+        runs.append(run)
+    return runs
+
+
+class Retention:
+    """Moves old history out of the hot tables in small batches.
+
+    Each batch moves at most batch_size rows into the archive table and is
+    committed on its own, so row locks are held for one short transaction
+    and writers are never blocked behind a long purge; batches are spaced
+    pause_ms apart to leave the database room for regular traffic.
+    """
+
+    def __init__(self, batch_size=500, pause_ms=50):
+        self.batch_size = batch_size
+        self.pause = pause_ms / 1000.0
+        self.moved = {}
+        self.longest_batch = 0.0
+
+    def _commit(self, table, action, rows, start):
+        db.session.commit()
+        elapsed = time.perf_counter() - start
+        batch_duration.labels(table).observe(elapsed)
+        row_count.labels(table, action).inc(rows)
+        self.moved[(table, action)] = self.moved.get((table, action), 0) + rows
+        self.longest_batch = max(self.longest_batch, elapsed)
+        if self.pause:
+            time.sleep(self.pause)
+
+    def _move(self, model, archive, columns, ids):
+        """Copy rows to the archive table and delete them, in the current
+        transaction; columns starts with id, kept as original_id"""
+        source = model.__table__
+        db.session.execute(insert(archive.__table__).from_select(
+            ['original_id'] + columns[1:], select(*(source.c[name] for name in columns)).where(source.c.id.in_(ids))
+        ))
+        db.session.execute(delete(source).where(source.c.id.in_(ids)))
+
+    def _archive(self, table, model, archive, columns, query):
+        """Move the rows whose ids query selects, batch by batch; query must
+        stop matching rows once they are moved"""
+        total = 0
+        while True:
+            start = time.perf_counter()
+            ids = db.session.scalars(query.limit(self.batch_size)).all()
+            if not ids:
+                db.session.rollback()
+                return total
+            self._move(model, archive, columns, ids)
+            self._commit(table, 'archived', len(ids), start)
+            total += len(ids)
+
+    def archive_status_changes(self, organization_id, cutoff):
+        """Archive status changes older than cutoff, keeping the latest
+        change of every service so its current status keeps its start time"""
+        newer = aliased(StatusChange)
+        query = select(StatusChange.id).join(Service, Service.id == StatusChange.service_id).where(
+            Service.organization_id == organization_id,
+            StatusChange.created_at < cutoff,
+            select(newer.id).where(
+                newer.service_id == StatusChange.service_id,
+                newer.created_at > StatusChange.created_at
+            ).exists()
+        ).order_by(StatusChange.id)
+        return self._archive('status_change', StatusChange, StatusChangeArchive, STATUS_CHANGE_COLUMNS, query)
+
+    def archive_incident_updates(self, organization_id, cutoff):
+        """Archive the updates of incidents resolved before cutoff, except
+        the latest update of each, which stays with its incident"""
+        newer = aliased(IncidentUpdate)
+        query = select(IncidentUpdate.id).join(Incident, Incident.id == IncidentUpdate.incident_id).where(
+            Incident.organization_id == organization_id,
+            Incident.status == 'resolved',
+            Incident.resolved_at < cutoff,
+            select(newer.id).where(
+                newer.incident_id == IncidentUpdate.incident_id,
+                newer.created_at > IncidentUpdate.created_at
+            ).exists()
+        ).order_by(IncidentUpdate.id)
+        return self._archive('incident_update', IncidentUpdate, IncidentUpdateArchive, INCIDENT_UPDATE_COLUMNS, query)
+
+    def compact_status_changes(self, organization_id, before, window_seconds, min_changes):
+        """Replace each flapping run of status changes older than before with
+        one summary change from the run's first old status to its last new
+        status; the originals are archived. Returns the number of runs."""
+        service_ids = db.session.scalars(select(Service.id).filter_by(organization_id=organization_id)).all()
+        db.session.rollback()
+        compacted = 0
+        for service_id in service_ids:
+            changes = db.session.execute(select(
+                StatusChange.id, StatusChange.old_status, StatusChange.new_status,
+                StatusChange.changed_by, StatusChange.created_at
+            ).where(
+                StatusChange.service_id == service_id,
+                StatusChange.created_at < before,
+                StatusChange.flap_count.is_(None)
+            ).order_by(StatusChange.created_at, StatusChange.id)).all()
+            db.session.rollback()
+            runs = flap_runs(changes, window_seconds, min_changes)
+            # Several runs share a batch; a run is never split across two
+            while runs:
+                batch = []
+                while runs and (not batch or sum(len(run) for run in batch) + len(runs[0]) <= self.batch_size):
+                    batch.append(runs.pop(0))
+                start = time.perf_counter()
+                self._move(StatusChange, StatusChangeArchive, STATUS_CHANGE_COLUMNS,
+                           [change[0] for run in batch for change in run])
+                db.session.execute(insert(StatusChange.__table__), [{
+                    'service_id': service_id,
+                    'old_status': run[0][1],
+                    'new_status': run[-1][2],
+                    'changed_by': run[-1][3],
+                    'created_at': run[0][4],
+                    'flap_count': len(run),
+                    'flap_ended_at': run[-1][4]
+                } for run in batch])
+                self._commit('status_change', 'compacted', sum(len(run) for run in batch), start)
+                compacted += len(batch)
+        return compacted
+
+    def prune_hourly_rollups(self, before):
+        """Delete hourly uptime buckets older than before; the daily buckets
+        already hold the same seconds"""
+        table = StatusRollup.__table__
+        total = 0
+        while True:
+            start = time.perf_counter()
+            ids = db.session.scalars(select(table.c.id).where(
+                table.c.period == 'hour', table.c.bucket_start < before
+            ).limit(self.batch_size)).all()
+            if not ids:
+                db.session.rollback()
+                return total
+            db.session.execute(delete(table).where(table.c.id.in_(ids)))
+            self._commit('status_rollup', 'deleted', len(ids), start)
+            total += len(ids)
+
+    def apply(self, organization, settings, now=None):
+        """Apply an organization's policy; returns the rows it changed"""
+        now = now or datetime.utcnow()
+        changed = 0
+        if settings['compact_after_days'] and settings['flap_min_changes'] > 1:
+            before = now - timedelta(days=settings['compact_after_days'])
+            changed += self.compact_status_changes(
+                organization.id, before, settings['flap_window_seconds'], settings['flap_min_changes']
+            )
+        if settings['status_change_days']:
+            changed += self.archive_status_changes(organization.id, now - timedelta(days=settings['status_change_days']))
+        if settings['incident_update_days']:
+            changed += self.archive_incident_updates(organization.id, now - timedelta(days=settings['incident_update_days']))
+        return changed
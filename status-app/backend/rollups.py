@@ -0,0 +1,210 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Service, StatusChange, StatusChangeArchive, StatusRollup
+
+# Statuses counted as downtime when computing availability
+DOWN_STATUSES = ('partial_outage', 'major_outage')
+PERIODS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+
+def bucket_floor(moment, period):
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def split_interval(start, end, period):
+    """Yield (bucket_start, seconds) for the part of [start, end) in each bucket"""
+    step = PERIODS[period]
+    bucket = bucket_floor(start, period)
+    while bucket < end:
+        overlap = min(end, bucket + step) - max(start, bucket)
+        seconds = int(overlap.total_seconds())
+        if seconds > 0:
+            yield bucket, seconds
+        bucket += step
+
+
+def interval_increments(intervals, hourly_since):
+    """Turn (service_id, status, start, end) intervals into per-bucket seconds.
+
+    Hourly buckets are only produced from hourly_since onwards.
+    """
+    increments = defaultdict(int)
+    for service_id, status, start, end in intervals:
+        for bucket, seconds in split_interval(start, end, 'day'):
+            increments[(service_id, 'day', bucket, status)] += seconds
+        for bucket, seconds in split_interval(max(start, hourly_since), end, 'hour'):
+            increments[(service_id, 'hour', bucket, status)] += seconds
+    return increments
+
+
+def add_intervals(intervals, hourly_since):
+    """Add closed status intervals to the rollup table in the current transaction"""
+    increments = interval_increments(intervals, hourly_since)
+    if not increments:
+        return
+
+    rows = [{
+        'service_id': service_id,
+        'period': period,
+        'bucket_start': bucket_start,
+        'status': status,
+        'seconds': seconds
+    } for (service_id, period, bucket_start, status), seconds in increments.items()]
+    upsert = upsert_statement(db.session.get_bind().dialect.name)
+    if upsert is not None:
+        db.session.execute(upsert, rows)
+    else:
+        add_rows(rows)
+
+
+def upsert_statement(dialect_name):
+    """INSERT that adds to the seconds of an existing bucket instead of
+    failing, so concurrent transactions can share a bucket"""
+    table = StatusRollup.__table__
+    if dialect_name == 'mysql':
+        statement = mysql_insert(table)
+        return statement.on_duplicate_key_update(seconds=table.c.seconds + statement.inserted.seconds)
+    if dialect_name in ('sqlite', 'postgresql'):
+        insert = sqlite_insert if dialect_name == 'sqlite' else postgresql_insert
+        statement = insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=['service_id', 'period', 'bucket_start', 'status'],
+            set_={'seconds': table.c.seconds + statement.excluded.seconds}
+        )
+    return None
+
+
+def add_rows(rows):
+    """Read-then-write fallback for databases without an upsert"""
+    existing = {
+        (row.service_id, row.period, row.bucket_start, row.status): row
+        for row in StatusRollup.query.filter(
+            StatusRollup.service_id.in_({row['service_id'] for row in rows}),
+            StatusRollup.bucket_start >= min(row['bucket_start'] for row in rows),
+            StatusRollup.bucket_start <= max(row['bucket_start'] for row in rows)
+        )
+    }
+    new_rows = []
+    for row in rows:
+        key = (row['service_id'], row['period'], row['bucket_start'], row['status'])
+        if key in existing:
+            existing[key].seconds += row['seconds']
+        else:
+            new_rows.append(row)
+    if new_rows:
+        db.session.execute(StatusRollup.__table__.insert(), new_rows)
+
+
+def status_since(services):
+    """Map service id to the time its current status began"""
+    # A compacted run of flapping changes ends at flap_ended_at
+    last_changes = dict(db.session.query(
+        StatusChange.service_id, func.max(func.coalesce(StatusChange.flap_ended_at, StatusChange.created_at))
+    ).filter(
+        StatusChange.service_id.in_([service.id for service in services])
+    ).group_by(StatusChange.service_id).all())
+    return {service.id: last_changes.get(service.id) or service.created_at for service in services}
+
+
+def record_transitions(transitions, changed_at, hourly_days=7):
+    """Close the current status interval of each service changing status.
+
+    transitions is a list of (service, old_status) pairs. Must run before the
+    new StatusChange rows are added to the session.
+    """
+    if not transitions:
+        return
+    since = status_since([service for service, _ in transitions])
+    add_intervals([
+        (service.id, old_status, since[service.id], changed_at)
+        for service, old_status in transitions
+    ], changed_at - timedelta(days=hourly_days))
+
+
+def backfill(hourly_days=7):
+    """Rebuild the rollup table from the full status change history, hot
+    and archived (compaction summaries are skipped in favour of the archived
+    changes they replaced)"""
+    StatusRollup.query.delete()
+    hourly_since = datetime.utcnow() - timedelta(days=hourly_days)
+    for service in Service.query.all():
+        changes = []
+        for model, id_column in ((StatusChange, StatusChange.id), (StatusChangeArchive, StatusChangeArchive.original_id)):
+            changes.extend(db.session.query(id_column.label('id'), model.old_status, model.created_at).filter(
+                model.service_id == service.id, model.flap_count.is_(None)
+            ))
+        changes.sort(key=lambda change: (change.created_at, change.id))
+        intervals = []
+        start = service.created_at
+        for change in changes:
+            intervals.append((service.id, change.old_status or 'operational', start, change.created_at))
+            start = change.created_at
+        add_intervals(intervals, hourly_since)
+    db.session.commit()
+
+
+def uptime_report(services, days, now=None):
+    """Daily availability per service for the last `days` days.
+
+    Reads the precomputed daily buckets plus the still-open interval of each
+    service's current status, so the cost is O(services * days).
+    """
+    now = now or datetime.utcnow()
+    first_day = bucket_floor(now, 'day') - timedelta(days=days - 1)
+
+    seconds = defaultdict(lambda: defaultdict(int))
+    rows = db.session.query(
+        StatusRollup.service_id, StatusRollup.bucket_start, StatusRollup.status, StatusRollup.seconds
+    ).filter(
+        StatusRollup.service_id.in_([service.id for service in services]),
+        StatusRollup.period == 'day',
+        StatusRollup.bucket_start >= first_day
+    )
+    for service_id, bucket_start, status, value in rows:
+        seconds[(service_id, bucket_start)][status] += value
+
+    since = status_since(services)
+    for service in services:
+        for bucket, value in split_interval(max(since[service.id], first_day), now, 'day'):
+            seconds[(service.id, bucket)][service.status] += value
+
+    report = []
+    for service in services:
+        daily = []
+        total_seconds = down_seconds = 0
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            by_status = seconds.get((service.id, day), {})
+            day_total = sum(by_status.values())
+            day_down = sum(by_status.get(status, 0) for status in DOWN_STATUSES)
+            total_seconds += day_total
+            down_seconds += day_down
+            daily.append({
+                'date': day.date().isoformat(),
+                'uptime': availability(day_total, day_down),
+                'seconds': dict(by_status)
+            })
+        report.append({
+            'service_id': service.id,
+            'name': service.name,
+            'uptime': availability(total_seconds, down_seconds),
+            'days': daily
+        })
+    return report
+
+
+def availability(total_seconds, down_seconds):
+    if not total_seconds:
+        return None
+    return round(100.0 * (total_seconds - down_seconds) / total_seconds, 3)
@@ -0,0 +1,98 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library encoder is used instead
+    orjson = None
+
+from cache import SnapshotCache
+from models import db, Incident, IncidentUpdate
+
+# Fields in to_dict() order; rows are read as plain column tuples in this
+# order, without building ORM objects
+INCIDENT_FIELDS = (
+    'id', 'title', 'description', 'status', 'impact', 'incident_type', 'service_id',
+    'organization_id', 'created_by', 'created_at', 'resolved_at'
+)
+INCIDENT_UPDATE_FIELDS = ('id', 'message', 'status', 'incident_id', 'created_by', 'created_at')
+
+
+def encode(value):
+    """JSON bytes for value, with sorted keys like Flask's jsonify.
+
+    Datetimes are encoded as ISO 8601 strings, matching to_dict().
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=_isoformat).encode('utf-8')
+
+
+def _isoformat(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def columns(model, fields):
+    return [model.__table__.c[name] for name in fields]
+
+
+def incident_query():
+    """Incident rows as column tuples, to filter and paginate like Incident.query"""
+    return db.session.query(*columns(Incident, INCIDENT_FIELDS))
+
+
+def updates_by_incident(incident_ids):
+    """Map incident id to its update rows, newest first, in one query"""
+    grouped = {}
+    if not incident_ids:
+        return grouped
+    rows = db.session.query(*columns(IncidentUpdate, INCIDENT_UPDATE_FIELDS)).filter(
+        IncidentUpdate.incident_id.in_(incident_ids)
+    ).order_by(IncidentUpdate.created_at.desc(), IncidentUpdate.id.desc())
+    for row in rows:
+        grouped.setdefault(row.incident_id, []).append(tuple(row))
+    return grouped
+
+
+class FragmentCache:
+    """Encoded JSON of individual entities, reused while the entity is unchanged.
+
+    Each entry is stored with a fingerprint of the data it was encoded from
+    (the row tuples themselves), so a changed row is simply re-encoded.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600):
+        self._cache = SnapshotCache(max_entries=max_entries, ttl=ttl)
+
+    def encode(self, key, fingerprint, build):
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        fragment = encode(build())
+        self._cache.set(key, (fingerprint, fragment))
+        return fragment
+
+    def clear(self):
+        self._cache.clear()
+
+
+def encode_incidents(rows, fragments=None):
+    """JSON array bytes for incident rows from incident_query(), including
+    their updates, identical to [incident.to_dict() for ...]"""
+    updates = updates_by_incident([row.id for row in rows])
+    parts = []
+    for row in rows:
+        row = tuple(row)
+        incident_updates = tuple(updates.get(row[0], ()))
+
+        def build(row=row, incident_updates=incident_updates):
+            incident = dict(zip(INCIDENT_FIELDS, row))
+            incident['updates'] = [dict(zip(INCIDENT_UPDATE_FIELDS, update)) for update in incident_updates]
+            return incident
+
+        if fragments is None:
+            parts.append(encode(build()))
+        else:
+            parts.append(fragments.encode(('incident', row[0]), (row, incident_updates), build))
+    return b'[' + b','.join(parts) + b']'
@@ -0,0 +1,217 @@
+import asyncio
+import queue
+import threading
+import time
+
+from broadcast import EventLog
+from metrics import registry
+import serializers
+
+# Comment line sent on idle streams so proxies and clients keep them open
+HEARTBEAT = b': ping\n\n'
+
+event_count = registry.counter('sse_events_total', 'Events published to the server-sent event streams, by event', ['event'])
+fanout_duration = registry.histogram('sse_fanout_duration_seconds', 'Time to encode an event and queue it for every listener')
+dropped_count = registry.counter(
+    'sse_listeners_dropped_total', 'Event streams closed or refused by the server, by reason', ['reason']
+)
+
+
+def frame(event, data, event_id=None):
+    """One server-sent event; data is single-line JSON bytes"""
+    head = f'id: {event_id}\nevent: {event}\n' if event_id else f'event: {event}\n'
+    return head.encode('utf-8') + b'data: ' + data + b'\n\n'
+
+
+class Listener:
+    """Frames waiting to be written to one streaming WSGI response.
+
+    Items are (seq, frame) tuples. The queue is bounded so a client that
+    stops reading cannot make the worker buffer events without limit.
+    make_queue builds it; pass the server's (socketio.server.eio.create_queue)
+    so that waiting on it yields to other green threads under eventlet.
+    """
+
+    def __init__(self, size=256, make_queue=queue.Queue):
+        self.closed = False
+        self._queue = make_queue(size)
+
+    def put(self, item):
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        self.closed = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def get(self, timeout):
+        """Every queued item, waiting up to timeout seconds for the first;
+        [] when none arrived"""
+        try:
+            items = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return [item for item in items if item is not None]
+
+
+class AsyncListener(Listener):
+    """Listener for a response written by a coroutine on loop; put() may be
+    called from any thread"""
+
+    def __init__(self, loop, size=256):
+        self.closed = False
+        self.loop = loop
+        self._queue = asyncio.Queue(size)
+
+    def put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self._put, item)
+        except RuntimeError:  # the loop is closed
+            return False
+        return True
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if not self.closed:
+                dropped_count.labels('slow').inc()
+            self.closed = True
+
+    def close(self):
+        """Wake up get(); only call on the loop"""
+        self.closed = True
+        try:
+            self._queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout):
+        try:
+            items = [await asyncio.wait_for(self._queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return [item for item in items if item is not None]
+
+
+class EventStreams:
+    """Server-sent event streams of the public rooms.
+
+    Each room has one channel shared by every listener on this worker: an
+    event is encoded into its SSE frame once, kept in a ring buffer so a
+    client reconnecting with Last-Event-ID gets exactly what it missed, and
+    the same bytes are queued for every listener. A listener that falls
+    SSE_QUEUE_SIZE events behind is dropped; its client reconnects and
+    resumes from the buffer. Event ids are <stream>:<seq>, where the stream
+    changes on every restart.
+    """
+
+    def __init__(self, app=None, prefix='public_'):
+        self.prefix = prefix
+        self.events = EventLog()
+        self.heartbeat = 15.0
+        self.queue_size = 256
+        self.max_listeners = 20000
+        self.retry_ms = 3000
+        self._rooms = {}
+        self.count = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.events = EventLog(app.config['EVENT_BUFFER_SIZE'])
+        self.heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+        self.queue_size = app.config['SSE_QUEUE_SIZE']
+        self.max_listeners = app.config['SSE_MAX_LISTENERS']
+        self.retry_ms = app.config['SSE_RETRY_MS']
+
+    def publish(self, room, event, payload):
+        """Send a broadcast event of room to its listeners"""
+        if not room.startswith(self.prefix):
+            return
+        start = time.perf_counter()
+        data = serializers.encode(payload)
+        # Under the lock so buffered frames and their ids stay in order
+        with self._lock:
+            seq = self.events.position(room) + 1
+            message = frame(event, data, self.event_id(seq))
+            self.events.append(room, event, message)
+            listeners = list(self._rooms.get(room, ()))
+        slow = [listener for listener in listeners if not listener.put((seq, message))]
+        for listener in slow:
+            dropped_count.labels('slow').inc()
+            listener.close()
+            self.unsubscribe(room, listener)
+        fanout_duration.observe(time.perf_counter() - start)
+        event_count.labels(event).inc()
+
+    def subscribe(self, room, listener):
+        """Add listener to room; returns None when the worker is full"""
+        with self._lock:
+            if self.count >= self.max_listeners:
+                dropped_count.labels('full').inc()
+                return None
+            self._rooms.setdefault(room, set()).add(listener)
+            self.count += 1
+        return listener
+
+    def unsubscribe(self, room, listener):
+        with self._lock:
+            listeners = self._rooms.get(room)
+            if listeners is None or listener not in listeners:
+                return
+            listeners.discard(listener)
+            self.count -= 1
+            if not listeners:
+                del self._rooms[room]
+
+    def event_id(self, seq):
+        return f'{self.events.stream}:{seq}'
+
+    def resume(self, room, last_event_id):
+        """(frames, seq) catching up a client that last saw last_event_id, or
+        None when it needs a snapshot instead"""
+        stream, _, seq = (last_event_id or '').partition(':')
+        if stream != self.events.stream or not seq.isdigit():
+            return None
+        missed = self.events.since(room, int(seq))
+        if missed is None:
+            return None
+        return b''.join(message for _, message, _ in missed), missed[-1][2] if missed else int(seq)
+
+    def snapshot(self, body, seq):
+        """The snapshot event for a client starting at seq; body is JSON bytes"""
+        return frame('snapshot', body, self.event_id(seq))
+
+    def preamble(self):
+        return f'retry: {self.retry_ms}\n\n'.encode('utf-8')
+
+    def stream(self, listener, first, after):
+        """Response body of a WSGI listener: first, then every event after
+        seq `after`, with heartbeats while idle. Unsubscribing is left to the
+        response's close callback, which also runs if this never starts."""
+        yield self.preamble() + first
+        while True:
+            items = listener.get(self.heartbeat)
+            if listener.closed:
+                return
+            # Events queued while the client was catching up may already
+            # have been sent
+            data = b''.join(message for seq, message in items if seq > after)
+            if items:
+                after = max(after, items[-1][0])
+            yield data or HEARTBEAT
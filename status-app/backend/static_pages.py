@@ -0,0 +1,165 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from flask import render_template
+
+from metrics import registry
+import serializers
+
+logger = logging.getLogger(__name__)
+
+render_count = registry.counter('static_page_renders_total', 'Public status pages written to disk, by result', ['result'])
+render_duration = registry.histogram('static_page_render_duration_seconds', 'Time to render and write one public status page')
+
+# Worst first; the page headline shows the worst status of any service
+SERVICE_STATUSES = ['major_outage', 'partial_outage', 'degraded', 'operational']
+
+
+def overall_status(services):
+    statuses = {service['status'] for service in services}
+    for status in SERVICE_STATUSES:
+        if status in statuses:
+            return status
+    return 'operational'
+
+
+def write_atomic(path, data):
+    """Replace path with data so readers see either the old or the new file"""
+    folder = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # mkstemp creates the file 0600; the pages are public
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class StaticPages:
+    """Pre-rendered public status pages, regenerated after writes.
+
+    Each organization gets <folder>/<slug>/index.html and status.json, built
+    from the public status snapshot. Write routes mark an organization dirty
+    and a background task renders the dirty ones every `delay` seconds, so a
+    burst of writes costs one render. The files are replaced atomically and
+    can be served by a web server in front of the app, without the database.
+    """
+
+    def __init__(self, app=None, socketio=None, build_snapshot=None):
+        self.folder = None
+        self.delay = 1.0
+        self.app = None
+        self.socketio = socketio
+        self.build_snapshot = build_snapshot
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._task = None
+        if app is not None:
+            self.init_app(app, socketio, build_snapshot)
+
+    def init_app(self, app, socketio, build_snapshot):
+        """build_snapshot(org_slug) returns the public status snapshot, or None
+        when the organization does not exist"""
+        self.app = app
+        self.socketio = socketio
+        self.build_snapshot = build_snapshot
+        self.folder = app.config['STATIC_PAGES_DIR'] or None
+        self.delay = app.config['STATIC_PAGES_DELAY_MS'] / 1000.0
+        if self.folder:
+            os.makedirs(self.folder, exist_ok=True)
+
+    def mark_dirty(self, org_slug):
+        if not self.folder:
+            return
+        with self._lock:
+            self._dirty.add(org_slug)
+        if self.delay <= 0:
+            self.flush()
+        elif self._task is None:
+            self._start()
+
+    def _start(self):
+        with self._lock:
+            if self._task is None:
+                self._task = self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.delay)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Static page regeneration failed')
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        with self.app.app_context():
+            for org_slug in dirty:
+                try:
+                    self.render(org_slug)
+                except Exception:
+                    # Keep serving the previous page; the next write retries
+                    render_count.labels('error').inc()
+                    logger.exception('Rendering the status page of %s failed', org_slug)
+
+    def render(self, org_slug):
+        """Write the pages of org_slug; returns False when it does not exist.
+
+        Needs an application context.
+        """
+        if not self._valid(org_slug):
+            return False
+        start = time.perf_counter()
+        snapshot = self.build_snapshot(org_slug)
+        if snapshot is None:
+            render_count.labels('missing').inc()
+            return False
+
+        folder = self.path(org_slug)
+        os.makedirs(folder, exist_ok=True)
+        generated_at = datetime.utcnow()
+        # The JSON goes first so the page never links to an older snapshot
+        write_atomic(os.path.join(folder, 'status.json'), serializers.encode(snapshot))
+        html = render_template(
+            'public_status.html',
+            snapshot=snapshot,
+            overall=overall_status(snapshot['services']),
+            generated_at=generated_at
+        )
+        write_atomic(os.path.join(folder, 'index.html'), html.encode('utf-8'))
+        render_count.labels('ok').inc()
+        render_duration.observe(time.perf_counter() - start)
+        return True
+
+    def render_all(self, org_slugs):
+        return sum(1 for org_slug in org_slugs if self.render(org_slug))
+
+    def path(self, org_slug, filename=None):
+        folder = os.path.join(self.folder, org_slug)
+        return folder if filename is None else os.path.join(folder, filename)
+
+    def rendered(self, org_slug, filename):
+        return self._valid(org_slug) and os.path.isfile(self.path(org_slug, filename))
+
+    def read(self, org_slug, filename):
+        """Contents of a rendered file, or None when it has not been rendered"""
+        if not self._valid(org_slug):
+            return None
+        try:
+            with open(self.path(org_slug, filename), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _valid(self, org_slug):
+        return bool(self.folder) and os.sep not in org_slug and org_slug not in ('', '.', '..')
@@ -0,0 +1,82 @@
+"""
+The incident endpoints must not issue more statements as incidents are
+added: updates and services are loaded in a fixed number of queries.
+
+    cd backend && python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+# A file, since each connection to an in-memory SQLite database is empty
+scratch = tempfile.TemporaryDirectory(prefix='status_test_')
+os.environ['MYSQL_URI'] = f'sqlite:///{os.path.join(scratch.name, "status.db")}'
+os.environ['STATIC_PAGES_DIR'] = os.path.join(scratch.name, 'pages')
+os.environ['RATE_LIMIT_ENABLED'] = 'false'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+import app as app_module
+
+INCIDENT_COUNTS = [1, 5, 20]
+
+
+@pytest.fixture(scope='module')
+def client():
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    return app_module.app.test_client()
+
+
+def create_organization(client, name, incidents):
+    """Register an organization with `incidents` incidents of two updates
+    each; returns (auth headers, org slug)"""
+    response = client.post('/api/auth/register', json={
+        'email': f'{name}@example.com', 'password': 'password', 'name': name, 'organization_name': name
+    })
+    headers = {'Authorization': f"Bearer {response.json['access_token']}"}
+    service_id = client.post('/api/services', json={'name': 'API'}, headers=headers).json['id']
+    for index in range(incidents):
+        incident_id = client.post('/api/incidents', json={
+            'title': f'Incident {index}', 'service_id': service_id, 'impact': 'minor'
+        }, headers=headers).json['id']
+        client.post(f'/api/incidents/{incident_id}/updates', json={'message': 'Found it', 'status': 'identified'},
+                    headers=headers)
+    return headers, response.json['organization']['slug']
+
+
+def count_queries(client, url, headers=None):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app_module.app.app_context():
+        engine = app_module.db.engine
+    event.listen(engine, 'after_cursor_execute', record)
+    try:
+        response = client.get(url, headers=headers)
+    finally:
+        event.remove(engine, 'after_cursor_execute', record)
+    assert response.status_code == 200, response.json
+    return len(statements)
+
+
+def test_incident_list_queries_are_constant(client):
+    counts = []
+    for incidents in INCIDENT_COUNTS:
+        headers, _ = create_organization(client, f'list{incidents}', incidents)
+        counts.append(count_queries(client, '/api/incidents', headers))
+    assert len(set(counts)) == 1, dict(zip(INCIDENT_COUNTS, counts))
+
+
+def test_public_status_queries_are_constant(client):
+    counts = []
+    for incidents in INCIDENT_COUNTS:
+        _, slug = create_organization(client, f'public{incidents}', incidents)
+        # A fresh organization, so the snapshot is built rather than cached
+        counts.append(count_queries(client, f'/api/public/{slug}/status'))
+    assert len(set(counts)) == 1, dict(zip(INCIDENT_COUNTS, counts))
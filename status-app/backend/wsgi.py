@@ -0,0 +1,22 @@
+"""
+Production entry point.
+
+Run one eventlet worker per process and put them behind a load balancer with
+sticky sessions; set SOCKETIO_MESSAGE_QUEUE so the workers share rooms:
+
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 gunicorn -k eventlet -w 1 -b :5001 wsgi:app
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 gunicorn -k eventlet -w 1 -b :5002 wsgi:app
+
+Every open socket or event stream holds one green thread; raise gunicorn's
+--worker-connections (or WSGI_MAX_CONNECTIONS here) to hold more viewers.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import os
+
+from app import app, socketio
+
+if __name__ == '__main__':
+    socketio.run(app, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', 5000)),
+                 max_size=int(os.environ.get('WSGI_MAX_CONNECTIONS', 1024)))
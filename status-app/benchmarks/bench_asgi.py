@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Compare the eventlet (backend/wsgi.py) and ASGI (backend/asgi.py) modes.
+
+For each mode, starts one worker against the same seeded SQLite database and
+reports:
+  - requests/sec and latency for the public status endpoint (served on the
+    event loop in ASGI mode) and the authenticated incident list (Flask in
+    both modes), with --concurrency client threads
+  - how many of --sockets concurrent Socket.IO clients could connect and join
+    the public room, the join round trip, and broadcast delivery to all of them
+
+    python benchmarks/bench_asgi.py --requests 2000 --concurrency 32 --sockets 500
+
+Requires the requests, websocket-client, uvicorn, a2wsgi and aiosqlite packages.
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import socketio
+
+from common import load_app, percentile, seed, start_workers
+
+
+def throughput(url, count, concurrency, headers=None):
+    local = threading.local()
+
+    def fetch(_):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        response = local.session.get(url, headers=headers)
+        assert response.status_code == 200, response.status_code
+        return (time.perf_counter() - start) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(fetch, range(count)))
+    return count / (time.perf_counter() - started), samples
+
+
+def socket_capacity(url, slug, count, headers, service_id):
+    clients = []
+    join_samples = []
+    received = []
+    lock = threading.Lock()
+
+    def connect(_):
+        client = socketio.Client(reconnection=False)
+        joined = threading.Event()
+        client.on('joined', lambda info: joined.set())
+        client.on('public_status_update', lambda payload, meta=None: received.append(time.perf_counter()))
+        try:
+            client.connect(url, transports=['websocket'], wait_timeout=10)
+            start = time.perf_counter()
+            client.emit('join_public', {'org_slug': slug})
+            if not joined.wait(10):
+                raise TimeoutError
+        except Exception:
+            return None
+        with lock:
+            join_samples.append((time.perf_counter() - start) * 1000)
+            clients.append(client)
+        return client
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        failed = sum(client is None for client in pool.map(connect, range(count)))
+
+    sent_at = time.perf_counter()
+    requests.put(f'{url}/api/services/{service_id}', json={'status': 'major_outage'}, headers=headers)
+    deadline = time.time() + 10
+    while time.time() < deadline and len(received) < len(clients):
+        time.sleep(0.01)
+    delivery = [(at - sent_at) * 1000 for at in received]
+
+    for client in clients:
+        client.disconnect()
+    return len(clients), failed, join_samples, delivery
+
+
+def report(samples):
+    return (f"p50={percentile(samples, 50):.1f}ms p95={percentile(samples, 95):.1f}ms "
+            f"p99={percentile(samples, 99):.1f}ms")
+
+
+def run(script, args, port, database_uri):
+    url = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        MYSQL_URI=database_uri,
+        CORS_ORIGINS=url,
+        BROADCAST_WINDOW_MS='0',
+        PASSWORD_HASH_WORKERS='0',
+        BCRYPT_LOG_ROUNDS='4',
+    )
+    process = start_workers(1, port, env, script=script)[0]
+    try:
+        data = requests.post(f'{url}/api/auth/register', json={
+            'email': f'bench-{port}@example.com', 'password': 'bench', 'name': 'Bench',
+            'organization_name': f'Bench {port}'
+        }).json()
+        headers = {'Authorization': f"Bearer {data['access_token']}"}
+        service = requests.post(f'{url}/api/services', json={'name': 'API'}, headers=headers).json()
+
+        print(f"{script}")
+        rate, samples = throughput(f'{url}/api/public/{args.slug}/status', args.requests, args.concurrency)
+        print(f"  public status   {rate:8.1f} req/s  {report(samples)}")
+        rate, samples = throughput(f'{url}/api/incidents?limit=50', args.requests, args.concurrency, headers)
+        print(f"  incident list   {rate:8.1f} req/s  {report(samples)}")
+
+        connected, failed, join_samples, delivery = socket_capacity(
+            url, data['organization']['slug'], args.sockets, headers, service['id']
+        )
+        print(f"  sockets joined  {connected}/{args.sockets} ({failed} failed)  join {report(join_samples)}")
+        print(f"  broadcast       {len(delivery)}/{connected} delivered  {report(delivery)}")
+    finally:
+        process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--sockets', type=int, default=200)
+    parser.add_argument('--incidents', type=int, default=500, help='incidents seeded per organization')
+    parser.add_argument('--base-port', type=int, default=5300)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    database_uri = os.environ['MYSQL_URI']
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        args.slug = seed(app_module.db, orgs=2, services=20, incidents=args.incidents, updates=2, changes=500)[0]
+
+    run('wsgi.py', args, args.base_port, database_uri)
+    run('asgi.py', args, args.base_port + 1, database_uri)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Measure bytes and CPU per request of the public endpoints by content encoding.
+
+Seeds a synthetic dataset and requests /api/public/<org_slug>/status and
+/timeline through the Flask test client, --requests times per encoding. For
+each endpoint it reports the body size and the CPU time per request:
+
+  - identity: the uncompressed body from the cache
+  - gzip on the fly: the identity body compressed on every request at level
+    6, the cost of a compressing proxy or middleware in front of the app
+  - gzip / br: bodies from the compressed response cache (br needs brotli)
+
+and the CPU time of a miss, i.e. of compressing a payload after a write.
+Every --write-every requests a service status changes, so the hit ratio
+reflects a page that is being updated during an incident.
+
+    python benchmarks/bench_compression.py --requests 2000
+    python benchmarks/bench_compression.py --write-every 100
+"""
+import argparse
+import gzip
+import time
+
+from common import load_app, seed
+
+
+def run(client, url, encoding, requests, write, write_every, recompress=False):
+    """(body bytes, CPU microseconds) per request"""
+    headers = {'Accept-Encoding': encoding}
+    sizes = 0
+    cpu = 0.0
+    for index in range(requests):
+        if write_every and index % write_every == write_every - 1:
+            write()
+        start = time.process_time()
+        response = client.get(url, headers=headers)
+        body = response.data
+        if recompress:
+            body = gzip.compress(body, compresslevel=6)
+        cpu += time.process_time() - start
+        assert response.status_code == 200, response.status_code
+        sizes += len(body)
+    return sizes / requests, cpu / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help='database URI (default: a temporary SQLite file)')
+    parser.add_argument('--services', type=int, default=50)
+    parser.add_argument('--incidents', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=1000, help='requests per endpoint and encoding')
+    parser.add_argument('--write-every', type=int, default=0, help='change a service status every n requests (0: never)')
+    args = parser.parse_args()
+
+    app_module = load_app(args.uri)
+    app, db = app_module.app, app_module.db
+    from compression import brotli, compress_duration, lookup_count
+    from models import Organization, Service
+
+    with app.app_context():
+        db.create_all()
+        slug = seed(db, orgs=1, services=args.services, incidents=args.incidents, updates=3, changes=5000)[0]
+        organization = Organization.query.filter_by(slug=slug).one()
+        service_ids = [service_id for (service_id,) in db.session.query(Service.id).filter_by(organization_id=organization.id)]
+
+    statuses = ['degraded', 'operational']
+    writes = [0]
+
+    def write():
+        with app.app_context():
+            service = db.session.get(Service, service_ids[writes[0] % len(service_ids)])
+            service.status = statuses[writes[0] % 2]
+            db.session.commit()
+        writes[0] += 1
+        app_module.mark_org_changed(slug)
+
+    encodings = [('identity', 'identity', False), ('gzip on the fly', 'identity', True), ('gzip', 'gzip', False)]
+    if brotli is not None:
+        encodings.append(('br', 'br', False))
+    else:
+        print('brotli is not installed; skipping br')
+
+    client = app.test_client()
+    for endpoint in ('status', 'timeline'):
+        url = f'/api/public/{slug}/{endpoint}'
+        print(f"{url.replace(slug, '<org_slug>')}")
+        for name, encoding, recompress in encodings:
+            client.get(url, headers={'Accept-Encoding': encoding})
+            size, cpu = run(client, url, encoding, args.requests, write, args.write_every, recompress)
+            print(f"  {name:<16}{size:>10.0f} bytes{cpu:>10.0f}us CPU per request")
+
+    totals = {(name, key): value for name, key, value in compress_duration.samples() if not name.endswith('_bucket')}
+    for name, key in totals:
+        if name.endswith('_count'):
+            count = totals[(name, key)]
+            average = totals[(name.replace('_count', '_sum'), key)] / count
+            print(f"miss: {key[0]} compression {average * 1e6:.0f}us on average over {count:.0f} payloads")
+    lookups = {key[1]: 0 for _, key, _ in lookup_count.samples()}
+    for _, key, value in lookup_count.samples():
+        lookups[key[1]] += value
+    print(f"cache hit ratio {lookups.get('hit', 0) / sum(lookups.values()):.3f} "
+          f"({writes[0]} writes, {app_module.compressed.size} bytes cached)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark the hot query shapes with and without the composite indexes.
+
+Seeds a synthetic dataset, drops the indexes declared in models.py, reports
+query plans and latencies, recreates the indexes and reports again.
+
+    python benchmarks/bench_indexes.py
+    python benchmarks/bench_indexes.py --uri mysql+pymysql://root:pw@localhost/status_bench
+"""
+import argparse
+
+from sqlalchemy import text
+
+from common import load_app, seed, timed, percentile
+
+
+def hot_queries(models, org_id, service_id):
+    Service, Incident, StatusChange = models.Service, models.Incident, models.StatusChange
+    return {
+        'services by org': Service.query.filter_by(organization_id=org_id),
+        'active incidents': Incident.query.filter_by(organization_id=org_id).filter(
+            Incident.status.in_(['investigating', 'identified', 'monitoring'])
+        ).order_by(Incident.created_at.desc()),
+        'incident page': Incident.query.filter_by(organization_id=org_id).order_by(
+            Incident.created_at.desc(), Incident.id.desc()
+        ).limit(50),
+        'service changes': StatusChange.query.filter_by(service_id=service_id).order_by(
+            StatusChange.created_at.desc()
+        ).limit(20),
+        'org timeline': StatusChange.query.join(Service).filter(
+            Service.organization_id == org_id
+        ).order_by(StatusChange.created_at.desc()).limit(20),
+    }
+
+
+def explain(db, query):
+    compiled = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(text(prefix + str(compiled))).fetchall()
+    return [' | '.join(str(value) for value in row) for row in rows]
+
+
+def composite_indexes(db):
+    return [index for table in db.metadata.sorted_tables for index in table.indexes]
+
+
+def report(db, queries, repeat):
+    for name, query in queries.items():
+        samples = timed(query.all, repeat)
+        print(f"  {name:<18} p50={percentile(samples, 50):8.2f}ms  p95={percentile(samples, 95):8.2f}ms")
+        for line in explain(db, query):
+            print(f"      {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help='database URI (defaults to a temporary SQLite file)')
+    parser.add_argument('--orgs', type=int, default=5)
+    parser.add_argument('--services', type=int, default=40)
+    parser.add_argument('--incidents', type=int, default=5000)
+    parser.add_argument('--changes', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app_module = load_app(args.uri)
+    db = app_module.db
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f"Seeding {args.orgs} orgs on {db.engine.dialect.name}...")
+        slugs = seed(db, orgs=args.orgs, services=args.services, incidents=args.incidents,
+                     updates=0, changes=args.changes)
+        org = app_module.Organization.query.filter_by(slug=slugs[0]).first()
+        service = app_module.Service.query.filter_by(organization_id=org.id).first()
+        queries = hot_queries(app_module, org.id, service.id)
+
+        indexes = composite_indexes(db)
+        with db.engine.begin() as connection:
+            for index in indexes:
+                index.drop(connection)
+        print("\nBefore (no composite indexes):")
+        report(db, queries, args.repeat)
+
+        with db.engine.begin() as connection:
+            for index in indexes:
+                index.create(connection)
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(text('ANALYZE'))
+        print("\nAfter:")
+        report(db, queries, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
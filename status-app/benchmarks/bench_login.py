@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Login latency and WebSocket responsiveness under a burst of logins.
+
+Starts a backend worker (backend/wsgi.py, eventlet) once with bcrypt hashed
+inline on the event loop and once with it offloaded to the thread pool, fires
+concurrent logins at it while a Socket.IO client keeps re-joining the public
+room, and reports login and join round-trip percentiles for both runs.
+
+    python benchmarks/bench_login.py --logins 200 --concurrency 16 --rounds 12
+
+Requires the requests and websocket-client packages.
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import socketio
+
+from common import load_app, percentile, start_workers
+
+
+def measure_socket(url, slug, stop, samples):
+    """Join the public room in a loop and record each join -> joined round trip"""
+    client = socketio.Client()
+    joined = threading.Event()
+    client.on('joined', lambda info: joined.set())
+    client.connect(url, transports=['websocket'])
+    try:
+        while not stop.is_set():
+            joined.clear()
+            start = time.perf_counter()
+            client.emit('join_public', {'org_slug': slug})
+            if joined.wait(10):
+                samples.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.02)
+    finally:
+        client.disconnect()
+
+
+def run(label, workers, args, port):
+    env = dict(
+        os.environ,
+        CORS_ORIGINS=f'http://127.0.0.1:{port}',
+        BCRYPT_LOG_ROUNDS=str(args.rounds),
+        PASSWORD_HASH_WORKERS=str(workers),
+    )
+    process = start_workers(1, port, env)[0]
+    url = f'http://127.0.0.1:{port}'
+    try:
+        email = f'bench-{port}@example.com'
+        data = requests.post(f'{url}/api/auth/register', json={
+            'email': email, 'password': 'bench', 'name': 'Bench', 'organization_name': f'Bench {port}'
+        }).json()
+        slug = data['organization']['slug']
+
+        stop = threading.Event()
+        socket_samples = []
+        socket_thread = threading.Thread(target=measure_socket, args=(url, slug, stop, socket_samples))
+        socket_thread.start()
+        time.sleep(0.5)
+
+        def login(_):
+            start = time.perf_counter()
+            response = requests.post(f'{url}/api/auth/login', json={'email': email, 'password': 'bench'})
+            assert response.status_code == 200, response.text
+            return (time.perf_counter() - start) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            login_samples = list(pool.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        socket_thread.join()
+
+        print(f"{label}: {args.logins / elapsed:.1f} logins/s")
+        print(f"  login  p50={percentile(login_samples, 50):.1f}ms p95={percentile(login_samples, 95):.1f}ms "
+              f"p99={percentile(login_samples, 99):.1f}ms")
+        print(f"  socket p50={percentile(socket_samples, 50):.1f}ms p95={percentile(socket_samples, 95):.1f}ms "
+              f"p99={percentile(socket_samples, 99):.1f}ms ({len(socket_samples)} joins)")
+    finally:
+        process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=12, help='BCRYPT_LOG_ROUNDS for the worker')
+    parser.add_argument('--hash-workers', type=int, default=4, help='PASSWORD_HASH_WORKERS for the offloaded run')
+    parser.add_argument('--base-port', type=int, default=5200)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    with app_module.app.app_context():
+        app_module.db.create_all()
+
+    print(f"bcrypt rounds: {args.rounds}  concurrency: {args.concurrency}")
+    run('inline', 0, args, args.base_port)
+    run(f'offloaded ({args.hash_workers} threads)', args.hash_workers, args, args.base_port + 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Delivers incident notifications to local stand-in webhook and SMTP servers.
+
+Seeds an organization with --webhooks webhook and --emails email subscribers,
+creates an incident through the API (timing the request, which only enqueues
+one job whatever the subscriber count) and runs a notification worker until
+the queue is drained. A share of the webhook endpoints answer 503 to their
+first attempts and a few email addresses are refused by the SMTP server, so
+retries with backoff and permanent failures are exercised too. It checks:
+
+  - every webhook subscriber got exactly one accepted, correctly signed POST
+  - every valid email address got exactly one message
+  - refused addresses end in failed jobs after NOTIFY_MAX_ATTEMPTS
+
+and reports delivery throughput and how many connections each server saw.
+
+    python benchmarks/bench_notifications.py --webhooks 20000 --emails 2000
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import socket
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from common import load_app
+
+SECRET = 'bench-secret'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class WebhookStandIn:
+    """Accepts POST /hook/<n>; hooks with n % flaky_every == 0 fail their first `failures` attempts"""
+
+    def __init__(self, flaky_every, failures):
+        self.flaky_every = flaky_every
+        self.failures = failures
+        self.attempts = Counter()
+        self.accepted = Counter()
+        self.bad_signatures = 0
+        self.connections = set()
+
+    async def handle(self, request):
+        hook = int(request.match_info['hook'])
+        body = await request.read()
+        self.connections.add(id(request.transport))
+        self.attempts[hook] += 1
+        expected = 'sha256=' + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+        if request.headers.get('X-Status-Signature') != expected:
+            self.bad_signatures += 1
+        if hook % self.flaky_every == 0 and self.attempts[hook] <= self.failures:
+            return web.Response(status=503)
+        self.accepted[hook] += 1
+        return web.Response(status=204)
+
+
+class SMTPStandIn:
+    """Just enough SMTP for smtplib; refuses recipients containing 'bounce'"""
+
+    def __init__(self):
+        self.delivered = Counter()
+        self.connections = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        writer.write(b'220 stand-in ESMTP\r\n')
+        recipients, in_data = [], False
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if in_data:
+                if line == b'.\r\n':
+                    in_data = False
+                    for recipient in recipients:
+                        self.delivered[recipient] += 1
+                    recipients = []
+                    writer.write(b'250 OK\r\n')
+                continue
+            command = line[:4].upper()
+            if command == b'EHLO':
+                writer.write(b'250-stand-in\r\n250 8BITMIME\r\n')
+            elif command == b'RCPT':
+                address = line.decode().split(':', 1)[1].strip().strip('<>')
+                if 'bounce' in address:
+                    writer.write(b'550 No such user\r\n')
+                else:
+                    recipients.append(address)
+                    writer.write(b'250 OK\r\n')
+            elif command == b'DATA':
+                in_data = True
+                writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+            elif command == b'QUIT':
+                writer.write(b'221 Bye\r\n')
+                await writer.drain()
+                break
+            elif command in (b'HELO', b'MAIL', b'RSET', b'NOOP'):
+                writer.write(b'250 OK\r\n')
+            else:
+                writer.write(b'502 Not implemented\r\n')
+            await writer.drain()
+        writer.close()
+
+
+async def run(args, app_module, webhook_port, smtp_port):
+    from models import NotificationJob, Organization, Subscriber, User, Service
+    from notifications import NotificationWorker
+    from sqlalchemy import func, insert
+
+    app = app_module.app
+    db = app_module.db
+    hooks = WebhookStandIn(args.flaky_every, args.failures)
+    server = web.Application()
+    server.router.add_post('/hook/{hook}', hooks.handle)
+    runner = web.AppRunner(server, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', webhook_port).start()
+    smtp = SMTPStandIn()
+    smtp_server = await asyncio.start_server(smtp.handle, '127.0.0.1', smtp_port)
+
+    with app.app_context():
+        organization = Organization(name='Notified', slug='notified')
+        db.session.add(organization)
+        db.session.flush()
+        admin = User(email='admin@example.com', name='Admin', role='admin', organization_id=organization.id)
+        admin.set_password('password')
+        service = Service(name='API', organization_id=organization.id)
+        db.session.add_all([admin, service])
+        rows = [{'organization_id': organization.id, 'kind': 'webhook', 'is_active': True, 'secret': SECRET,
+                 'target': f'http://127.0.0.1:{webhook_port}/hook/{index}'} for index in range(args.webhooks)]
+        rows += [{'organization_id': organization.id, 'kind': 'email', 'is_active': True, 'secret': None,
+                  'target': f"{'bounce' if index < args.bounces else 'user'}{index}@example.com"}
+                 for index in range(args.emails)]
+        for start in range(0, len(rows), 1000):
+            db.session.execute(insert(Subscriber.__table__).values(rows[start:start + 1000]))
+        db.session.commit()
+        token = app_module.create_user_token(admin, organization)
+        service_id = service.id
+
+    client = app.test_client()
+    start = time.perf_counter()
+    response = client.post('/api/incidents', json={'title': 'Elevated errors', 'service_id': service_id, 'impact': 'major'},
+                           headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 201, response.get_json()
+    print(f"POST /api/incidents with {args.webhooks + args.emails} subscribers: "
+          f"{(time.perf_counter() - start) * 1000:.1f}ms")
+
+    worker = NotificationWorker(app)
+    start = time.perf_counter()
+    while True:
+        await worker.run(until_idle=True)
+        with app.app_context():
+            pending = NotificationJob.query.filter(NotificationJob.status.in_(['pending', 'running'])).count()
+        if not pending:
+            break
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - start
+    await runner.cleanup()
+    smtp_server.close()
+
+    with app.app_context():
+        jobs = dict(db.session.query(NotificationJob.status, func.count()).group_by(NotificationJob.status).all())
+        failed_ids = [subscriber_id for (ids,) in db.session.query(NotificationJob.subscriber_ids).filter_by(status='failed')
+                      for subscriber_id in json.loads(ids)]
+        failed_targets = {target for (target,) in db.session.query(Subscriber.target).filter(Subscriber.id.in_(failed_ids))}
+
+    delivered = sum(hooks.accepted.values()) + sum(smtp.delivered.values())
+    print(f"  {delivered} notifications delivered in {elapsed:.1f}s ({delivered / elapsed:.0f}/s); jobs: {jobs}")
+    print(f"  webhooks: {sum(hooks.attempts.values())} requests over {len(hooks.connections)} connections; "
+          f"email: {sum(smtp.delivered.values())} messages over {smtp.connections} SMTP connections")
+    checks = {
+        'each webhook accepted once': len(hooks.accepted) == args.webhooks and set(hooks.accepted.values()) <= {1},
+        'webhook signatures valid': hooks.bad_signatures == 0,
+        'each valid address mailed once': len(smtp.delivered) == args.emails - args.bounces
+        and set(smtp.delivered.values()) <= {1},
+        'refused addresses failed': failed_targets == {f'bounce{index}@example.com' for index in range(args.bounces)},
+    }
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+    return all(checks.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help='database URI (default: a temporary SQLite file)')
+    parser.add_argument('--webhooks', type=int, default=5000)
+    parser.add_argument('--emails', type=int, default=1000)
+    parser.add_argument('--bounces', type=int, default=5, help='email addresses the SMTP server refuses')
+    parser.add_argument('--flaky-every', type=int, default=10, help='every nth webhook fails its first attempts')
+    parser.add_argument('--failures', type=int, default=2, help='failed attempts of each flaky webhook')
+    args = parser.parse_args()
+
+    webhook_port, smtp_port = free_port(), free_port()
+    os.environ.update({
+        'SMTP_HOST': '127.0.0.1',
+        'WEBHOOK_ALLOWED_HOSTS': '127.0.0.1',
+        'SMTP_PORT': str(smtp_port),
+        'NOTIFY_BACKOFF_SECONDS': '0.2',
+        'NOTIFY_BACKOFF_MAX_SECONDS': '1',
+        'NOTIFY_MAX_ATTEMPTS': str(args.failures + 2),
+        'BCRYPT_LOG_ROUNDS': '4',
+    })
+    app_module = load_app(args.uri)
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    ok = asyncio.run(run(args, app_module, webhook_port, smtp_port))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
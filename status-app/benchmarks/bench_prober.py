@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Runs the health check prober against local stand-in servers.
+
+Creates --checks services with HTTP checks (and a few TCP checks) pointing
+at an in-process aiohttp server whose answer for each target can be changed
+while the prober runs. After a first healthy phase, a share of the targets is
+switched to failing, slow or flapping, then back to healthy, and the script
+verifies the prober wrote exactly the expected transitions:
+
+  failing   HTTP 500        -> major_outage, then operational again
+  slow      over degraded_ms -> degraded, then operational again
+  flapping  fails every other probe, which the hysteresis must absorb
+  tcp       closed port     -> major_outage
+
+It reports checks per minute, mean probe time and how many connections the
+stand-in server accepted (keep-alive reuse keeps this near the pool size).
+
+    python benchmarks/bench_prober.py --checks 2000 --interval 5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from common import load_app
+
+
+class StandIn:
+    """HTTP server answering /target/<n> as modes[n] says"""
+
+    def __init__(self):
+        self.modes = {}
+        self.hits = Counter()
+        self.connections = set()
+        self.slow_seconds = 0.3
+
+    async def handle(self, request):
+        target = int(request.match_info['target'])
+        self.connections.add(id(request.transport))
+        self.hits[target] += 1
+        mode = self.modes.get(target, 'ok')
+        if mode == 'failing' or (mode == 'flapping' and self.hits[target] % 2):
+            return web.Response(status=500, text='down')
+        if mode == 'slow':
+            await asyncio.sleep(self.slow_seconds)
+        return web.Response(text='ok')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def run(args, app_module):
+    from models import Organization, Service, ServiceCheck, StatusChange, User
+
+    app = app_module.app
+    db = app_module.db
+    stand_in = StandIn()
+    server = web.Application()
+    server.router.add_get('/target/{target}', stand_in.handle)
+    runner = web.AppRunner(server, access_log=None)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    closed_port = free_port()
+
+    with app.app_context():
+        organization = Organization(name='Probed', slug='probed')
+        db.session.add(organization)
+        db.session.flush()
+        db.session.add(User(email='probe@example.com', name='Probe', organization_id=organization.id))
+        for index in range(args.checks):
+            service = Service(name=f'service-{index}', organization_id=organization.id)
+            db.session.add(service)
+            db.session.flush()
+            tcp = index < args.tcp_checks
+            db.session.add(ServiceCheck(
+                service_id=service.id,
+                kind='tcp' if tcp else 'http',
+                target=f'127.0.0.1:{closed_port if index % 2 else port}' if tcp else f'http://127.0.0.1:{port}/target/{index}',
+                interval_seconds=args.interval,
+                timeout_seconds=2,
+                degraded_ms=int(stand_in.slow_seconds * 1000 / 2),
+                failure_threshold=2,
+                recovery_threshold=2,
+            ))
+        db.session.commit()
+
+    http_targets = list(range(args.tcp_checks, args.checks))
+    share = max(1, len(http_targets) // 10)
+    groups = {
+        'failing': http_targets[:share],
+        'slow': http_targets[share:2 * share],
+        'flapping': http_targets[2 * share:3 * share],
+    }
+
+    prober = app_module.create_prober()
+    prober.refresh_interval = args.interval
+    task = asyncio.create_task(prober.run())
+    phase = args.interval * 3
+    print(f"{args.checks} checks every {args.interval}s against 127.0.0.1:{port}, {phase}s per phase")
+
+    started = time.perf_counter()
+    await asyncio.sleep(phase)
+    for mode, targets in groups.items():
+        for target in targets:
+            stand_in.modes[target] = mode
+    await asyncio.sleep(phase)
+    stand_in.modes.clear()
+    await asyncio.sleep(phase)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    elapsed = time.perf_counter() - started
+    await runner.cleanup()
+
+    from prober import check_count, check_duration
+    checks = sum(value for _, _, value in check_count.samples())
+    totals = {name: value for name, key, value in check_duration.samples() if key == ('http',)}
+    with app.app_context():
+        changes = Counter((change.service_id, change.new_status) for change in StatusChange.query.all())
+        statuses = Counter(status for (status,) in db.session.query(Service.status))
+
+    def services(targets):
+        return [target + 1 for target in targets]  # service ids follow the target index
+
+    expected = {
+        'failing -> major_outage': all(changes[(s, 'major_outage')] == 1 for s in services(groups['failing'])),
+        'failing -> operational': all(changes[(s, 'operational')] == 1 for s in services(groups['failing'])),
+        'slow -> degraded': all(changes[(s, 'degraded')] == 1 for s in services(groups['slow'])),
+        'slow -> operational': all(changes[(s, 'operational')] == 1 for s in services(groups['slow'])),
+        'flapping absorbed': not any(changes[(s, status)] for s in services(groups['flapping'])
+                                     for status in ('major_outage', 'degraded')),
+        'closed tcp port -> major_outage': all(
+            changes[(index + 1, 'major_outage')] == 1 for index in range(args.tcp_checks) if index % 2
+        ),
+    }
+    print(f"  {checks:.0f} checks in {elapsed:.0f}s ({checks / elapsed * 60:.0f}/min), "
+          f"{len(stand_in.connections)} server connections for {sum(stand_in.hits.values())} HTTP requests")
+    if totals.get('probe_duration_seconds_count'):
+        mean = totals['probe_duration_seconds_sum'] / totals['probe_duration_seconds_count'] * 1000
+        print(f"  mean HTTP probe time {mean:.1f}ms")
+    print(f"  {sum(changes.values())} status changes written; final statuses: {dict(statuses)}")
+    for name, ok in expected.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+    return all(expected.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help='database URI (default: a temporary SQLite file)')
+    parser.add_argument('--checks', type=int, default=1000)
+    parser.add_argument('--tcp-checks', type=int, default=10)
+    parser.add_argument('--interval', type=int, default=2, help='seconds between runs of each check')
+    args = parser.parse_args()
+
+    os.environ['BROADCAST_WINDOW_MS'] = '0'
+    os.environ['STATIC_PAGES_DELAY_MS'] = '0'
+    os.environ['PROBE_ALLOWED_HOSTS'] = '127.0.0.1'
+    app_module = load_app(args.uri)
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    ok = asyncio.run(run(args, app_module))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Overhead of the rate limiter on the hot path, and how it sheds a burst.
+
+Times the limiter check alone, then a conditional GET /api/public/<slug>/status
+(answered 304 from memory, so the limiter is a visible share of it) with the
+limiter disabled and enabled, using budgets too large to be hit. Finally
+replays a credential-stuffing burst against /api/auth/login with the default
+login budget and counts the 429s.
+
+    python benchmarks/bench_ratelimit.py --repeat 5000
+"""
+import argparse
+import os
+
+from common import load_app, percentile, seed, timed
+
+
+def report(label, samples, unit='ms'):
+    scale = 1000 if unit == 'us' else 1
+    print(f"  {label:<26} p50={percentile(samples, 50) * scale:8.2f}{unit} "
+          f"p99={percentile(samples, 99) * scale:8.2f}{unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help='database URI (default: a temporary SQLite file)')
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--attempts', type=int, default=200, help='login attempts in the burst')
+    args = parser.parse_args()
+
+    os.environ['RATE_LIMIT_ENABLED'] = 'true'
+    os.environ['RATE_LIMIT_PUBLIC_IP'] = '1000000000/second'
+    os.environ['RATE_LIMIT_PUBLIC_ORG'] = '1000000000/second'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    app_module = load_app(args.uri)
+    app = app_module.app
+    limiter = app_module.limiter
+    with app.app_context():
+        app_module.db.create_all()
+        slug = seed(app_module.db, orgs=1, services=20, incidents=50, changes=100)[0]
+
+    print(f"Limiter store: {type(limiter.store).__name__}")
+    values = {'ip': '127.0.0.1', 'org': slug}
+    report('check()', timed(lambda: limiter.check('public', values), args.repeat), unit='us')
+
+    client = app.test_client()
+    etag = client.get(f'/api/public/{slug}/status').headers['ETag']
+
+    def conditional_get():
+        assert client.get(f'/api/public/{slug}/status', headers={'If-None-Match': etag}).status_code == 304
+
+    print("Conditional GET /api/public/<slug>/status:")
+    for enabled in (False, True):
+        limiter.enabled = enabled
+        timed(conditional_get, 200)
+        report('limiter ' + ('enabled' if enabled else 'disabled'), timed(conditional_get, args.repeat))
+
+    statuses = {}
+    for attempt in range(args.attempts):
+        response = client.post('/api/auth/login', json={'email': f'victim{attempt % 3}@example.com', 'password': 'guess'},
+                               environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    print(f"Login burst of {args.attempts} attempts from one address: "
+          + ', '.join(f"{count} x {status}" for status, count in sorted(statuses.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Archive and compact a year of synthetic history with the retention policy.
+
+Seeds organizations with --changes status changes each (a share of them in
+flapping bursts) and incidents with updates spread over the last year, then
+times the public timeline before and after `Retention.apply`. It reports:
+
+  - timeline latency (first page, one service, and a page 30 days back)
+  - rows compacted and archived, and the longest single batch transaction
+  - whether the rebuilt uptime rollups are unchanged by the retention run
+
+    python benchmarks/bench_retention.py --changes 50000
+    python benchmarks/bench_retention.py --uri mysql+pymysql://root:pw@localhost/status_bench
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from common import load_app, percentile, seed, timed
+
+
+def add_flaps(db, slugs, bursts, length, seed_value=7):
+    """Add bursts of status changes a minute apart to random services"""
+    from models import Organization, Service, StatusChange
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    rows = []
+    for slug in slugs:
+        organization = Organization.query.filter_by(slug=slug).one()
+        service_ids = [service_id for (service_id,) in db.session.query(Service.id).filter_by(organization_id=organization.id)]
+        for _ in range(bursts):
+            service_id = rng.choice(service_ids)
+            start = now - timedelta(days=365 * rng.random())
+            statuses = ['operational', 'degraded']
+            rows += [{
+                'service_id': service_id,
+                'old_status': statuses[index % 2],
+                'new_status': statuses[(index + 1) % 2],
+                'changed_by': None,
+                'created_at': start + timedelta(minutes=index),
+            } for index in range(length)]
+    db.session.execute(StatusChange.__table__.insert(), rows)
+    db.session.commit()
+
+
+def resolve_incidents(db):
+    from models import Incident
+
+    for incident in Incident.query.filter_by(status='resolved'):
+        incident.resolved_at = incident.created_at + timedelta(hours=2)
+    db.session.commit()
+
+
+def uptime_snapshot(db, rollups):
+    from models import StatusRollup
+
+    # Daily buckets only: the first hourly bucket depends on when backfill runs
+    rollups.backfill()
+    return sorted(db.session.query(
+        StatusRollup.service_id, StatusRollup.bucket_start, StatusRollup.status, StatusRollup.seconds
+    ).filter_by(period='day').all())
+
+
+def measure(client, slug, service_id, repeat):
+    month_ago = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    urls = {
+        'first page': f'/api/public/{slug}/timeline',
+        'one service': f'/api/public/{slug}/timeline?service_id={service_id}',
+        '30 days back': f'/api/public/{slug}/timeline?until={month_ago}',
+    }
+    results = {}
+    for name, url in urls.items():
+        assert client.get(url).status_code == 200
+        samples = timed(lambda: client.get(url), repeat)
+        results[name] = (percentile(samples, 50), percentile(samples, 99))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help='database URI (default: a temporary SQLite file)')
+    parser.add_argument('--orgs', type=int, default=3)
+    parser.add_argument('--services', type=int, default=20)
+    parser.add_argument('--changes', type=int, default=20000, help='status changes per organization')
+    parser.add_argument('--bursts', type=int, default=500, help='flapping bursts per organization')
+    parser.add_argument('--burst-length', type=int, default=8)
+    parser.add_argument('--status-change-days', type=int, default=90)
+    parser.add_argument('--incident-update-days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ.update({
+        'RETENTION_STATUS_CHANGE_DAYS': str(args.status_change_days),
+        'RETENTION_INCIDENT_UPDATE_DAYS': str(args.incident_update_days),
+    })
+
+    app_module = load_app(args.uri)
+    app, db = app_module.app, app_module.db
+    import retention
+    import rollups
+    from models import Organization, Service, StatusChange, StatusChangeArchive, IncidentUpdate, IncidentUpdateArchive
+
+    with app.app_context():
+        db.create_all()
+        slugs = seed(db, orgs=args.orgs, services=args.services, incidents=1000, updates=4, changes=args.changes)
+        add_flaps(db, slugs, args.bursts, args.burst_length)
+        resolve_incidents(db)
+        organization = Organization.query.filter_by(slug=slugs[0]).one()
+        service_id = db.session.query(Service.id).filter_by(organization_id=organization.id).first()[0]
+        hot_before = StatusChange.query.count(), IncidentUpdate.query.count()
+        uptime_before = uptime_snapshot(db, rollups)
+
+    client = app.test_client()
+    before = measure(client, slugs[0], service_id, args.repeat)
+
+    worker = retention.Retention(app.config['RETENTION_BATCH_SIZE'], app.config['RETENTION_BATCH_PAUSE_MS'])
+    start = time.perf_counter()
+    with app.app_context():
+        for organization in Organization.query.all():
+            worker.apply(organization, retention.policy(app.config, organization.slug))
+        elapsed = time.perf_counter() - start
+        hot_after = StatusChange.query.count(), IncidentUpdate.query.count()
+        archived = StatusChangeArchive.query.count(), IncidentUpdateArchive.query.count()
+        uptime_after = uptime_snapshot(db, rollups)
+    for slug in slugs:
+        app_module.mark_org_changed(slug)
+    after = measure(client, slugs[0], service_id, args.repeat)
+
+    print(f"status_change:   {hot_before[0]} -> {hot_after[0]} hot rows ({archived[0]} archived)")
+    print(f"incident_update: {hot_before[1]} -> {hot_after[1]} hot rows ({archived[1]} archived)")
+    for (table, action), rows in sorted(worker.moved.items()):
+        print(f"  {table} {action}: {rows} rows")
+    print(f"retention run {elapsed:.1f}s; longest batch {worker.longest_batch * 1000:.1f}ms "
+          f"(batch size {worker.batch_size}, pause {worker.pause * 1000:.0f}ms)")
+    print(f"{'timeline':<14}{'before p50/p99':>20}{'after p50/p99':>20}")
+    for name in before:
+        print(f"{name:<14}{before[name][0]:>11.2f}/{before[name][1]:.2f}ms{after[name][0]:>11.2f}/{after[name][1]:.2f}ms")
+    same = uptime_before == uptime_after
+    print(f"{'ok  ' if same else 'FAIL'} uptime rollups rebuilt from hot + archive match the original history")
+    raise SystemExit(0 if same else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Before/after numbers for the incident list serialization path.
+
+Seeds a synthetic dataset and serializes the same page of incidents:
+  - before:     ORM objects with selectinload, to_dict() and Flask's JSON encoder
+  - tuples:     column tuples encoded by serializers.encode_incidents
+  - tuples+hit: the same with every fragment already in the FragmentCache
+then times GET /api/incidents end to end (ETag bypassed) with the fragment
+cache warm and cold.
+
+    python benchmarks/bench_serialization.py --incidents 5000 --limit 200
+"""
+import argparse
+
+from common import load_app, percentile, seed, timed
+
+
+def report(label, samples):
+    print(f"  {label:<28} p50={percentile(samples, 50):7.2f}ms p95={percentile(samples, 95):7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help='database URI (default: a temporary SQLite file)')
+    parser.add_argument('--incidents', type=int, default=2000, help='incidents per organization')
+    parser.add_argument('--updates', type=int, default=3, help='updates per incident')
+    parser.add_argument('--limit', type=int, default=200, help='page size')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app_module = load_app(args.uri)
+    import serializers
+    from models import Incident, Organization, User
+    from sqlalchemy.orm import selectinload
+
+    app = app_module.app
+    with app.app_context():
+        app_module.db.create_all()
+        slug = seed(app_module.db, orgs=1, services=20, incidents=args.incidents, updates=args.updates, changes=100)[0]
+        organization = Organization.query.filter_by(slug=slug).one()
+        admin = User.query.filter_by(organization_id=organization.id).first()
+        token = app_module.create_user_token(admin, organization)
+    print(f"JSON backend: {'orjson' if serializers.orjson else 'json'}  page: {args.limit} incidents "
+          f"with {args.updates} updates each")
+
+    def ordered(query):
+        return query.filter(Incident.organization_id == organization.id).order_by(
+            Incident.created_at.desc(), Incident.id.desc()
+        ).limit(args.limit)
+
+    def before():
+        incidents = ordered(Incident.query.options(selectinload(Incident.updates))).all()
+        return app.json.dumps([incident.to_dict() for incident in incidents]).encode('utf-8')
+
+    def tuples(fragments=None):
+        return serializers.encode_incidents(ordered(serializers.incident_query()).all(), fragments)
+
+    fragments = serializers.FragmentCache()
+    with app.test_request_context():
+        print("Serialization (query included):")
+        report('before (ORM + to_dict)', timed(lambda: (before(), app_module.db.session.expire_all()), args.repeat))
+        report('column tuples', timed(tuples, args.repeat))
+        tuples(fragments)
+        report('column tuples + fragment hit', timed(lambda: tuples(fragments), args.repeat))
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    url = f'/api/incidents?limit={args.limit}'
+
+    def request():
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        return response.data
+
+    print("GET /api/incidents:")
+    report('fragment cache cold', timed(lambda: (app_module.fragments.clear(), request()), args.repeat))
+    report('fragment cache warm', timed(request, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
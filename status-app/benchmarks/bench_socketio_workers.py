@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Load test for Socket.IO broadcast delivery across several backend workers.
+
+Starts N worker processes (backend/wsgi.py) sharing a message queue, connects
+subscribers to the public room spread over all workers, flips service status
+through one worker at a time and reports how many subscribers on each worker
+received every update and how long delivery took.
+
+    python benchmarks/bench_socketio_workers.py --workers 3 --clients 60
+    python benchmarks/bench_socketio_workers.py --queue redis://localhost:6379/0
+
+Requires the requests and websocket-client packages.
+"""
+import argparse
+import os
+import threading
+import time
+
+import requests
+import socketio
+
+from common import load_app, percentile, scratch_path, start_workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--clients', type=int, default=30)
+    parser.add_argument('--updates', type=int, default=20)
+    parser.add_argument('--base-port', type=int, default=5100)
+    parser.add_argument('--queue', default='filesystem://', help='SOCKETIO_MESSAGE_QUEUE for the workers')
+    args = parser.parse_args()
+
+    app_module = load_app()
+    with app_module.app.app_context():
+        app_module.db.create_all()
+    urls = [f'http://127.0.0.1:{args.base_port + index}' for index in range(args.workers)]
+    env = dict(
+        os.environ,
+        CORS_ORIGINS=','.join(urls),
+        SOCKETIO_MESSAGE_QUEUE=args.queue,
+        SOCKETIO_QUEUE_FOLDER=scratch_path('queue'),
+        BROADCAST_WINDOW_MS='0',
+    )
+    workers = start_workers(args.workers, args.base_port, env)
+
+    clients = []
+    try:
+        data = requests.post(f'{urls[0]}/api/auth/register', json={
+            'email': 'bench@example.com', 'password': 'bench', 'name': 'Bench', 'organization_name': 'Bench Org'
+        }).json()
+        headers = {'Authorization': f"Bearer {data['access_token']}"}
+        slug = data['organization']['slug']
+        service = requests.post(f'{urls[0]}/api/services', json={'name': 'API'}, headers=headers).json()
+
+        received = {}
+        lock = threading.Lock()
+        for index in range(args.clients):
+            client = socketio.Client()
+            worker = index % args.workers
+
+            # Events carry their room and sequence number as a second argument
+            def on_update(payload, event_id=None, *, worker=worker, index=index):
+                with lock:
+                    received.setdefault(payload['status'], []).append((worker, index, time.perf_counter()))
+
+            client.on('public_status_update', on_update)
+            client.connect(urls[worker], transports=['websocket'])
+            client.emit('join_public', {'org_slug': slug})
+            clients.append(client)
+        time.sleep(1)
+
+        statuses = ['degraded', 'major_outage']
+        latencies = []
+        delivered_per_worker = [0] * args.workers
+        stale_reads = 0
+        for update in range(args.updates):
+            status = f'{statuses[update % 2]}'
+            received.clear()
+            sent_at = time.perf_counter()
+            requests.put(f'{urls[update % args.workers]}/api/services/{service["id"]}',
+                         json={'status': status}, headers=headers)
+            deadline = time.time() + 5
+            while time.time() < deadline and len(received.get(status, [])) < args.clients:
+                time.sleep(0.01)
+            for worker, _, at in received.get(status, []):
+                delivered_per_worker[worker] += 1
+                latencies.append((at - sent_at) * 1000)
+            # Every worker's cached public snapshot must reflect the change
+            for url in urls:
+                services = requests.get(f'{url}/api/public/{slug}/status').json()['services']
+                stale_reads += services[0]['status'] != status
+
+        expected = args.updates * args.clients
+        print(f"Workers: {args.workers}  subscribers: {args.clients}  updates: {args.updates}  queue: {args.queue}")
+        print(f"Delivered {len(latencies)}/{expected} messages")
+        for worker, count in enumerate(delivered_per_worker):
+            subscribers = len(range(worker, args.clients, args.workers))
+            print(f"  worker {worker}: {count}/{subscribers * args.updates}")
+        print(f"Stale public status reads after delivery: {stale_reads}")
+        print(f"Latency p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms "
+              f"p99={percentile(latencies, 99):.1f}ms")
+    finally:
+        for client in clients:
+            client.disconnect()
+        for worker in workers:
+            worker.terminate()
+
+
+if __name__ == '__main__':
+    main()
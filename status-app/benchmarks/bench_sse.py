@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Compare public viewers on server-sent events with viewers on Socket.IO.
+
+For each transport, starts a fresh worker (backend/wsgi.py by default),
+connects --viewers clients to one organization's public room and flips a
+service status --updates times. It reports, per transport:
+
+  - how many viewers connected and how long connecting all of them took
+  - the worker's resident memory per connected viewer
+  - broadcast delivery to every viewer (p50/p99 from the PUT) and the
+    worker CPU time spent per update
+
+SSE viewers are plain asyncio sockets reading the stream and Socket.IO
+viewers are bare websocket connections speaking the Engine.IO protocol, so
+both sides of the comparison are equally cheap to run on the client.
+
+    python benchmarks/bench_sse.py --viewers 5000 --updates 10
+    python benchmarks/bench_sse.py --script asgi.py
+
+Memory and CPU figures read /proc and are only shown on Linux.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+import requests
+
+from common import load_app, percentile, start_workers
+
+UPDATE_MARKER = b'\nevent: public_status_update\n'
+
+
+def process_stats(pid):
+    """(resident MB, CPU seconds) of a process, or (None, None) without /proc"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        return rss, cpu
+    except (OSError, ValueError, AttributeError):
+        return None, None
+
+
+class SSEViewer:
+    """Reads an event stream over a raw socket and timestamps each update"""
+
+    def __init__(self):
+        self.arrivals = []
+        self.writer = None
+        self.task = None
+
+    async def connect(self, port, slug):
+        reader, self.writer = await asyncio.open_connection('127.0.0.1', port)
+        self.writer.write(f'GET /api/public/{slug}/events HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                          f'Accept: text/event-stream\r\n\r\n'.encode())
+        head = await reader.readuntil(b'\r\n\r\n')
+        if b' 200 ' not in head.split(b'\r\n', 1)[0]:
+            raise ConnectionError(head.split(b'\r\n', 1)[0].decode())
+        # The snapshot comes first
+        buffer = b''
+        while b'event: snapshot' not in buffer:
+            data = await reader.read(65536)
+            if not data:
+                raise ConnectionError('stream closed')
+            buffer += data
+        self.task = asyncio.create_task(self._read(reader))
+
+    async def _read(self, reader):
+        carry = b''
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            buffer = carry + data
+            now = time.perf_counter()
+            self.arrivals.extend([now] * buffer.count(UPDATE_MARKER))
+            carry = buffer[-(len(UPDATE_MARKER) - 1):]
+
+    async def close(self):
+        self.writer.close()
+
+
+class SocketIOViewer:
+    """A Socket.IO client joined to the public room, speaking the Engine.IO
+    websocket protocol directly over an aiohttp websocket (one shared client
+    session, so thousands of viewers stay cheap on the client side)"""
+
+    session = None
+
+    def __init__(self):
+        self.arrivals = []
+        self.ws = None
+        self.task = None
+
+    async def connect(self, port, slug):
+        self.ws = await self.session.ws_connect(f'http://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket')
+        await self._expect('0')  # Engine.IO open
+        await self.ws.send_str('40')  # Socket.IO connect
+        await self._expect('40')
+        await self.ws.send_str('42' + json.dumps(['join_public', {'org_slug': slug}]))
+        await self._expect('42["joined"')
+        self.task = asyncio.create_task(self._read())
+
+    async def _expect(self, prefix):
+        while True:
+            message = await asyncio.wait_for(self.ws.receive_str(), 30)
+            if message == '2':
+                await self.ws.send_str('3')
+            elif message.startswith(prefix):
+                return message
+
+    async def _read(self):
+        async for message in self.ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            if message.data == '2':
+                await self.ws.send_str('3')
+            elif message.data.startswith('42["public_status_update"'):
+                self.arrivals.append(time.perf_counter())
+
+    async def close(self):
+        await self.ws.close()
+
+
+async def connect_viewers(viewer_class, count, port, slug, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    viewers = []
+    failures = []
+
+    async def connect():
+        viewer = viewer_class()
+        async with semaphore:
+            try:
+                await viewer.connect(port, slug)
+            except Exception as e:
+                failures.append(str(e) or type(e).__name__)
+                return
+        viewers.append(viewer)
+
+    await asyncio.gather(*(connect() for _ in range(count)))
+    return viewers, failures
+
+
+async def measure(name, viewer_class, args, port, pid, env_url, headers, slug, service_id):
+    SocketIOViewer.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+    rss_before, _ = process_stats(pid)
+    start = time.perf_counter()
+    viewers, failures = await connect_viewers(viewer_class, args.viewers, port, slug, args.connect_concurrency)
+    connect_seconds = time.perf_counter() - start
+    await asyncio.sleep(1)
+    rss_after, cpu_before = process_stats(pid)
+
+    statuses = ['degraded', 'major_outage']
+    delivery = []
+    delivered = 0
+    for update in range(args.updates):
+        expected = update + 1
+        sent_at = time.perf_counter()
+        await asyncio.to_thread(requests.put, f'{env_url}/api/services/{service_id}',
+                                json={'status': statuses[update % 2]}, headers=headers)
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline and any(len(viewer.arrivals) < expected for viewer in viewers):
+            await asyncio.sleep(0.01)
+        arrived = [viewer.arrivals[update] for viewer in viewers if len(viewer.arrivals) >= expected]
+        delivered += len(arrived)
+        delivery.extend((at - sent_at) * 1000 for at in arrived)
+    _, cpu_after = process_stats(pid)
+
+    print(f"{name}")
+    print(f"  connected  {len(viewers)}/{args.viewers} in {connect_seconds:.1f}s"
+          + (f" ({len(failures)} failed, e.g. {failures[0]})" if failures else ''))
+    if rss_before is not None and viewers:
+        print(f"  memory     {rss_after - rss_before:.1f} MB for {len(viewers)} viewers "
+              f"({(rss_after - rss_before) * 1024 / len(viewers):.1f} KB each)")
+    print(f"  delivery   {delivered}/{len(viewers) * args.updates}  p50={percentile(delivery, 50):.1f}ms "
+          f"p99={percentile(delivery, 99):.1f}ms max={max(delivery, default=0):.1f}ms")
+    if cpu_before is not None and args.updates:
+        print(f"  worker CPU {(cpu_after - cpu_before) / args.updates * 1000:.1f}ms per update")
+    await asyncio.gather(*(viewer.close() for viewer in viewers), return_exceptions=True)
+    await SocketIOViewer.session.close()
+
+
+def run(name, viewer_class, args, port):
+    url = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        CORS_ORIGINS=url,
+        BROADCAST_WINDOW_MS='0',
+        BCRYPT_LOG_ROUNDS='4',
+        WSGI_MAX_CONNECTIONS=str(args.viewers + 100),
+        SSE_MAX_LISTENERS=str(args.viewers + 100),
+    )
+    process = start_workers(1, port, env, script=args.script)[0]
+    try:
+        data = requests.post(f'{url}/api/auth/register', json={
+            'email': f'bench-{port}@example.com', 'password': 'bench', 'name': 'Bench',
+            'organization_name': f'Bench {port}'
+        }).json()
+        headers = {'Authorization': f"Bearer {data['access_token']}"}
+        service = requests.post(f'{url}/api/services', json={'name': 'API'}, headers=headers).json()
+        asyncio.run(measure(name, viewer_class, args, port, process.pid, url, headers,
+                            data['organization']['slug'], service['id']))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--viewers', type=int, default=2000)
+    parser.add_argument('--updates', type=int, default=10)
+    parser.add_argument('--script', default='wsgi.py', help='worker entry point, wsgi.py or asgi.py')
+    parser.add_argument('--connect-concurrency', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for each update to reach everyone')
+    parser.add_argument('--base-port', type=int, default=5400)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    with app_module.app.app_context():
+        app_module.db.create_all()
+
+    run('server-sent events', SSEViewer, args, args.base_port)
+    run('socket.io', SocketIOViewer, args, args.base_port + 1)
+
+
+if __name__ == '__main__':
+    main()
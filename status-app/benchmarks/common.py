@@ -0,0 +1,161 @@
+"""
+Shared helpers for the backend benchmark scripts
+"""
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+SERVICE_STATUSES = ['operational', 'degraded', 'partial_outage', 'major_outage']
+INCIDENT_STATUSES = ['investigating', 'identified', 'monitoring', 'resolved']
+IMPACTS = ['minor', 'major', 'critical']
+
+
+# Holds the default database and static pages; removed when the script exits
+scratch = tempfile.TemporaryDirectory(prefix='status_bench_', ignore_cleanup_errors=True)
+
+
+def scratch_path(name):
+    """A path in the benchmark's temporary directory"""
+    return os.path.join(scratch.name, name)
+
+
+def load_app(database_uri=None):
+    """Import the Flask app against database_uri (a temporary SQLite file by default)"""
+    if database_uri is None:
+        database_uri = f"sqlite:///{scratch_path('status.db')}"
+    os.environ['MYSQL_URI'] = database_uri
+    os.environ.setdefault('STATIC_PAGES_DIR', scratch_path('pages'))
+    # Every benchmark request comes from one address
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    sys.path.insert(0, BACKEND_DIR)
+    import app as app_module
+    return app_module
+
+
+def seed(db, orgs=10, services=20, incidents=2000, updates=3, changes=5000, seed_value=42):
+    """Bulk insert a synthetic dataset and return the organization slugs.
+
+    Counts other than orgs are per organization (updates is per incident).
+    """
+    from models import Organization, User, Service, Incident, IncidentUpdate, StatusChange
+
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    history = timedelta(days=365)
+
+    def timestamp():
+        return now - history * rng.random()
+
+    slugs = []
+    for org_index in range(orgs):
+        slug = f'bench-org-{org_index}'
+        org = Organization(name=f'Bench Org {org_index}', slug=slug)
+        db.session.add(org)
+        db.session.flush()
+        user = User(email=f'admin@{slug}.test', name='Bench Admin', role='admin', organization_id=org.id)
+        user.password_hash = 'x'
+        db.session.add(user)
+        db.session.flush()
+        slugs.append(slug)
+
+        db.session.execute(Service.__table__.insert(), [{
+            'name': f'Service {i}',
+            'description': '',
+            'status': rng.choice(SERVICE_STATUSES),
+            'organization_id': org.id,
+            'created_at': now,
+            'updated_at': now,
+        } for i in range(services)])
+        service_ids = [row[0] for row in db.session.query(Service.id).filter_by(organization_id=org.id)]
+
+        db.session.execute(Incident.__table__.insert(), [{
+            'title': f'Incident {i}',
+            'description': 'Synthetic incident used for benchmarking',
+            'status': rng.choice(INCIDENT_STATUSES),
+            'impact': rng.choice(IMPACTS),
+            'incident_type': 'incident',
+            'service_id': rng.choice(service_ids),
+            'organization_id': org.id,
+            'created_by': user.id,
+            'created_at': timestamp(),
+        } for i in range(incidents)])
+        incident_ids = [row[0] for row in db.session.query(Incident.id).filter_by(organization_id=org.id)]
+
+        if updates:
+            db.session.execute(IncidentUpdate.__table__.insert(), [{
+                'message': 'Synthetic update',
+                'status': rng.choice(INCIDENT_STATUSES),
+                'incident_id': incident_id,
+                'created_by': user.id,
+                'created_at': timestamp(),
+            } for incident_id in incident_ids for _ in range(updates)])
+
+        db.session.execute(StatusChange.__table__.insert(), [{
+            'service_id': rng.choice(service_ids),
+            'old_status': rng.choice(SERVICE_STATUSES),
+            'new_status': rng.choice(SERVICE_STATUSES),
+            'changed_by': user.id,
+            'created_at': timestamp(),
+        } for _ in range(changes)])
+        db.session.commit()
+
+    return slugs
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def current_rss_mb():
+    """Resident memory of this process in MB (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def timed(fn, repeat):
+    """Run fn repeat times and return the latencies in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def start_workers(count, base_port, env, script='wsgi.py'):
+    """Start count backend worker processes (wsgi.py or asgi.py) on consecutive
+    ports and wait until they answer"""
+    import requests
+
+    workers = []
+    for index in range(count):
+        worker_env = dict(env, PORT=str(base_port + index), HOST='127.0.0.1')
+        workers.append(subprocess.Popen(
+            [sys.executable, script], cwd=BACKEND_DIR, env=worker_env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+    for index in range(count):
+        url = f'http://127.0.0.1:{base_port + index}/api/public/none/status'
+        for _ in range(100):
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+    return workers
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Reproducible load test for the backend, run in-process.
+
+Boots the Flask app against a temporary SQLite database (or --uri, e.g. a
+local MySQL), seeds a deterministic dataset and drives these scenarios with
+Flask and Flask-SocketIO test clients, without a live server:
+
+  status-storm  public status reads across organizations, half of them
+                conditional (If-None-Match), as a status page under load sees
+  status-flips  bursts of single and bulk service status changes by org admins
+  subscribers   Socket.IO subscribers in every public and org room while
+                statuses flip; reports fan-out deliveries
+  mixed         reads, incident list pages and status flips interleaved
+
+For each scenario it reports throughput, p50/p95/p99 latency, errors and the
+process RSS. Results can be saved with --output and compared against a saved
+baseline with --baseline, which exits non-zero on a regression so the suite
+can gate a deploy:
+
+    python benchmarks/loadtest.py --output baseline.json
+    python benchmarks/loadtest.py --baseline baseline.json --tolerance 0.25
+    python benchmarks/loadtest.py --scenarios status-storm --operations 5000 --concurrency 16
+    python benchmarks/loadtest.py --uri mysql+pymysql://root:pw@localhost/status_bench
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import SERVICE_STATUSES, current_rss_mb, load_app, percentile, seed
+
+SCENARIOS = ['status-storm', 'status-flips', 'subscribers', 'mixed']
+
+
+class Context:
+    """The loaded app and the seeded organizations the scenarios act on"""
+
+    def __init__(self, app_module, slugs):
+        from models import Organization, Service, User
+
+        self.app_module = app_module
+        self.app = app_module.app
+        self.slugs = slugs
+        self.orgs = []
+        with self.app.app_context():
+            for slug in slugs:
+                organization = Organization.query.filter_by(slug=slug).one()
+                admin = User.query.filter_by(organization_id=organization.id).first()
+                self.orgs.append({
+                    'id': organization.id,
+                    'slug': slug,
+                    'headers': {'Authorization': f'Bearer {app_module.create_user_token(admin, organization)}'},
+                    'service_ids': [row[0] for row in app_module.db.session.query(Service.id).filter_by(
+                        organization_id=organization.id
+                    )],
+                })
+        self.etags = {}
+
+
+def drive(ctx, operation, count, concurrency):
+    """Run operation(client, rng) count times over concurrency threads.
+
+    Each thread has its own test client; each operation gets a random
+    generator seeded from its index, so a run is reproducible. operation
+    returns False to count an error. Returns latencies in ms, the error count
+    and the elapsed seconds.
+    """
+    local = threading.local()
+    errors = []
+
+    def run(index):
+        if not hasattr(local, 'client'):
+            local.client = ctx.app.test_client()
+        rng = random.Random(index)
+        start = time.perf_counter()
+        ok = operation(local.client, rng)
+        elapsed = (time.perf_counter() - start) * 1000
+        if ok is False:
+            errors.append(index)
+        return elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(run, range(count)))
+    return samples, len(errors), time.perf_counter() - started
+
+
+def read_status(ctx, client, rng):
+    org = rng.choice(ctx.orgs)
+    headers = {}
+    etag = ctx.etags.get(org['slug'])
+    if etag and rng.random() < 0.5:
+        headers['If-None-Match'] = etag
+    response = client.get(f"/api/public/{org['slug']}/status", headers=headers)
+    if response.status_code == 200:
+        ctx.etags[org['slug']] = response.headers.get('ETag')
+    return response.status_code in (200, 304)
+
+
+def flip_status(ctx, client, rng, bulk_every=10):
+    org = rng.choice(ctx.orgs)
+    if rng.randrange(bulk_every) == 0:
+        services = [{'id': service_id, 'status': rng.choice(SERVICE_STATUSES)}
+                    for service_id in rng.sample(org['service_ids'], min(10, len(org['service_ids'])))]
+        response = client.patch('/api/services/bulk', json={'services': services}, headers=org['headers'])
+    else:
+        response = client.put(f"/api/services/{rng.choice(org['service_ids'])}",
+                              json={'status': rng.choice(SERVICE_STATUSES)}, headers=org['headers'])
+    return response.status_code == 200
+
+
+def list_incidents(ctx, client, rng):
+    org = rng.choice(ctx.orgs)
+    response = client.get('/api/incidents?limit=50', headers=org['headers'])
+    response.get_data()
+    return response.status_code == 200
+
+
+def status_storm(ctx, args):
+    return drive(ctx, lambda client, rng: read_status(ctx, client, rng), args.operations, args.concurrency)
+
+
+def status_flips(ctx, args):
+    return drive(ctx, lambda client, rng: flip_status(ctx, client, rng), args.operations // 4, args.concurrency)
+
+
+def mixed(ctx, args):
+    def operation(client, rng):
+        roll = rng.random()
+        if roll < 0.85:
+            return read_status(ctx, client, rng)
+        if roll < 0.95:
+            return list_incidents(ctx, client, rng)
+        return flip_status(ctx, client, rng)
+
+    return drive(ctx, operation, args.operations, args.concurrency)
+
+
+def subscribers(ctx, args):
+    """Flip statuses while args.subscribers Socket.IO clients listen.
+
+    Half of the subscribers join public rooms and half org rooms, spread over
+    the organizations. Broadcasts are flushed after every flip so each
+    latency sample includes the fan-out.
+    """
+    app_module = ctx.app_module
+    clients = []
+    for index in range(args.subscribers):
+        org = ctx.orgs[index % len(ctx.orgs)]
+        client = app_module.socketio.test_client(ctx.app)
+        if index % 2:
+            client.emit('join_organization', {'organization_id': org['id'], 'token': org['headers']['Authorization'][7:]})
+        else:
+            client.emit('join_public', {'org_slug': org['slug']})
+        client.get_received()
+        clients.append(client)
+
+    def operation(client, rng):
+        ok = flip_status(ctx, client, rng, bulk_every=5)
+        app_module.broadcaster.flush()
+        return ok
+
+    # Flips run one at a time so deliveries can be attributed to them
+    samples, errors, elapsed = drive(ctx, operation, args.operations // 10, 1)
+    delivered = sum(len(client.get_received()) for client in clients)
+    for client in clients:
+        client.disconnect()
+    print(f"  {args.subscribers} subscribers received {delivered} events "
+          f"({delivered / elapsed:.0f} deliveries/s)")
+    return samples, errors, elapsed
+
+
+RUNNERS = {
+    'status-storm': status_storm,
+    'status-flips': status_flips,
+    'subscribers': subscribers,
+    'mixed': mixed,
+}
+
+
+def compare(results, baseline, tolerance):
+    """Return descriptions of scenarios that got slower than baseline allows"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']:.1f}/s -> {result['throughput']:.1f}/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help='database URI (default: a temporary SQLite file)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--orgs', type=int, default=5)
+    parser.add_argument('--services', type=int, default=20, help='services per organization')
+    parser.add_argument('--incidents', type=int, default=500, help='incidents per organization')
+    parser.add_argument('--updates', type=int, default=3, help='updates per incident')
+    parser.add_argument('--changes', type=int, default=2000, help='status changes per organization')
+    parser.add_argument('--operations', type=int, default=2000, help='requests per read scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--subscribers', type=int, default=200)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(RUNNERS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Deterministic, in-process settings: broadcasts are flushed explicitly
+    # and the Socket.IO test clients need no async framework
+    os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'threading')
+    os.environ['BROADCAST_WINDOW_MS'] = '0'
+    os.environ.pop('SOCKETIO_MESSAGE_QUEUE', None)
+    app_module = load_app(args.uri)
+    with app_module.app.app_context():
+        app_module.db.create_all()
+        started = time.perf_counter()
+        slugs = seed(app_module.db, orgs=args.orgs, services=args.services, incidents=args.incidents,
+                     updates=args.updates, changes=args.changes)
+        print(f"Seeded {args.orgs} orgs in {time.perf_counter() - started:.1f}s "
+              f"({app_module.app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]})")
+    ctx = Context(app_module, slugs)
+
+    results = {}
+    print(f"{'scenario':<14}{'ops':>7}{'ops/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'errors':>8}{'rss MB':>9}")
+    for name in scenarios:
+        samples, errors, elapsed = RUNNERS[name](ctx, args)
+        results[name] = {
+            'operations': len(samples),
+            'throughput': len(samples) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(samples, 50),
+            'p95_ms': percentile(samples, 95),
+            'p99_ms': percentile(samples, 99),
+            'errors': errors,
+            'rss_mb': current_rss_mb(),
+        }
+        result = results[name]
+        print(f"{name:<14}{result['operations']:>7}{result['throughput']:>10.1f}{result['p50_ms']:>8.1f}ms"
+              f"{result['p95_ms']:>7.1f}ms{result['p99_ms']:>7.1f}ms{errors:>8}{result['rss_mb']:>9.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions or any(result['errors'] for result in results.values()):
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -13,9 +13,12 @@ import { Badge } from '../components/ui/badge'
 import { Plus, Settings, LogOut } from 'lucide-react'
 
 export function Dashboard() {
-  const { user, organization, logout } = useAuth()
+  const { user, organization, token, logout } = useAuth()
   const [services, setServices] = useState([])
   const [incidents, setIncidents] = useState([])
+  // Cursor of the next page of older incidents, null on the last page
+  const [incidentCursor, setIncidentCursor] = useState(null)
+  const [loadMoreLoading, setLoadMoreLoading] = useState(false)
   const [loading, setLoading] = useState(true)
   const [newService, setNewService] = useState({ name: '', description: '' })
   const [newIncident, setNewIncident] = useState({
@@ -31,7 +34,6 @@ export function Dashboard() {
   const [createIncidentLoading, setCreateIncidentLoading] = useState(false)
 
   useEffect(() => {
-    fetchData()
     setupRealtime()
     
     return () => {
@@ -40,25 +42,52 @@ export function Dashboard() {
     }
   }, [])
 
+  // Update events only carry the fields that changed, merge them by id
   const setupRealtime = () => {
     socketService.connect()
-    socketService.joinOrganization(organization.id)
+    
+    // Joining returns a snapshot of services and incidents; missed events are
+    // replayed on reconnect instead of re-fetching
+    socketService.on('joined', (info) => {
+      if (info.snapshot) {
+        setServices(info.snapshot.services)
+        setIncidents(info.snapshot.incidents)
+        setIncidentCursor(info.snapshot.next_incident_cursor || null)
+      }
+      setLoading(false)
+    })
+    
+    socketService.on('join_error', () => {
+      fetchData()
+    })
     
     socketService.on('service_created', (service) => {
-      setServices(prev => [...prev, service])
+      setServices(prev => prev.some(s => s.id === service.id) ? prev : [...prev, service])
     })
     
     socketService.on('service_updated', (service) => {
-      setServices(prev => prev.map(s => s.id === service.id ? service : s))
+      setServices(prev => prev.map(s => s.id === service.id ? { ...s, ...service } : s))
+    })
+    
+    socketService.on('services_updated', (updated) => {
+      const byId = new Map(updated.map(s => [s.id, s]))
+      setServices(prev => prev.map(s => byId.has(s.id) ? { ...s, ...byId.get(s.id) } : s))
     })
     
     socketService.on('incident_created', (incident) => {
-      setIncidents(prev => [incident, ...prev])
+      setIncidents(prev => prev.some(i => i.id === incident.id) ? prev : [incident, ...prev])
     })
     
     socketService.on('incident_updated', (incident) => {
-      setIncidents(prev => prev.map(i => i.id === incident.id ? incident : i))
+      setIncidents(prev => prev.map(i => i.id === incident.id ? { ...i, ...incident } : i))
+    })
+    
+    socketService.on('incidents_updated', (updated) => {
+      const byId = new Map(updated.map(i => [i.id, i]))
+      setIncidents(prev => prev.map(i => byId.has(i.id) ? { ...i, ...byId.get(i.id) } : i))
     })
+    
+    socketService.joinOrganization(organization.id, token)
   }
 
   const fetchData = async () => {
@@ -70,6 +99,7 @@ export function Dashboard() {
       
       setServices(servicesRes.data)
       setIncidents(incidentsRes.data)
+      setIncidentCursor(incidentsRes.headers['x-next-cursor'] || null)
     } catch (error) {
       console.error('Error fetching data:', error)
     } finally {
@@ -77,6 +107,27 @@ export function Dashboard() {
     }
   }
 
+  // Older incidents are only fetched when asked for, one page at a time
+  const handleLoadMoreIncidents = async () => {
+    if (!incidentCursor || loadMoreLoading) return
+    
+    setLoadMoreLoading(true)
+    try {
+      const response = await axios.get('http://localhost:5000/api/incidents', {
+        params: { cursor: incidentCursor }
+      })
+      setIncidents(prev => {
+        const shown = new Set(prev.map(i => i.id))
+        return [...prev, ...response.data.filter(i => !shown.has(i.id))]
+      })
+      setIncidentCursor(response.headers['x-next-cursor'] || null)
+    } catch (error) {
+      console.error('Error loading incidents:', error)
+    } finally {
+      setLoadMoreLoading(false)
+    }
+  }
+
   const handleCreateService = async (e) => {
     e.preventDefault()
     
@@ -345,6 +396,14 @@ export function Dashboard() {
             ))}
           </div>
 
+          {incidentCursor && (
+            <div className="mt-4 text-center">
+              <Button variant="outline" onClick={handleLoadMoreIncidents} disabled={loadMoreLoading}>
+                {loadMoreLoading ? 'Loading...' : 'Load more incidents'}
+              </Button>
+            </div>
+          )}
+
           {incidents.length === 0 && (
             <Card>
               <CardContent className="py-12 text-center">
@@ -15,7 +15,6 @@ export function PublicStatus() {
   const [error, setError] = useState(null)
 
   useEffect(() => {
-    fetchStatusData()
     setupRealtime()
     
     return () => {
@@ -26,22 +25,67 @@ export function PublicStatus() {
 
   const setupRealtime = () => {
     socketService.connect()
-    socketService.joinPublic(orgSlug)
     
+    // Joining returns the status snapshot; missed events are replayed on
+    // reconnect instead of re-fetching
+    socketService.on('joined', (info) => {
+      if (info.snapshot === null) {
+        setError('Failed to load status page')
+      } else if (info.snapshot) {
+        setData(info.snapshot)
+      }
+      setLoading(false)
+    })
+    
+    // Fall back to a single HTTP fetch if the socket cannot connect
+    let fallbackFetched = false
+    socketService.on('connect_error', () => {
+      if (!fallbackFetched) {
+        fallbackFetched = true
+        fetchStatusData()
+      }
+    })
+    
+    // Update events only carry the fields that changed, merge them by id
     socketService.on('public_status_update', (service) => {
       setData(prev => ({
         ...prev,
-        services: prev.services.map(s => s.id === service.id ? service : s)
+        services: prev.services.map(s => s.id === service.id ? { ...s, ...service } : s)
       }))
     })
     
-    socketService.on('public_incident_update', (incident) => {
+    socketService.on('public_status_bulk_update', (updated) => {
+      const byId = new Map(updated.map(s => [s.id, s]))
       setData(prev => ({
         ...prev,
-        active_incidents: prev.active_incidents.map(i => i.id === incident.id ? incident : i),
-        recent_incidents: [incident, ...prev.recent_incidents.filter(i => i.id !== incident.id)].slice(0, 10)
+        services: prev.services.map(s => byId.has(s.id) ? { ...s, ...byId.get(s.id) } : s)
       }))
     })
+    
+    socketService.on('public_incident_update', (incident) => {
+      setData(prev => mergeIncidents(prev, [incident]))
+    })
+    
+    socketService.on('public_incident_bulk_update', (updated) => {
+      setData(prev => mergeIncidents(prev, updated))
+    })
+    
+    socketService.joinPublic(orgSlug)
+  }
+
+  const mergeIncidents = (prev, updated) => {
+    const byId = new Map(updated.map(i => [i.id, i]))
+    const known = new Map(prev.recent_incidents.map(i => [i.id, i]))
+    // Changed incidents move to the top; partial updates for incidents this
+    // page never loaded cannot be rendered and are skipped
+    const changed = updated
+      .map(i => known.has(i.id) ? { ...known.get(i.id), ...i } : i)
+      .filter(i => i.title !== undefined)
+    return {
+      ...prev,
+      active_incidents: prev.active_incidents.map(i => byId.has(i.id) ? { ...i, ...byId.get(i.id) } : i),
+      recent_incidents: [...changed, ...prev.recent_incidents.filter(i => !byId.has(i.id))].slice(0, 10)
+    }
   }
 
   const fetchStatusData = async () => {
@@ -4,6 +4,8 @@ class SocketService {
   constructor() {
     this.socket = null
     this.listeners = new Map()
+    // room -> { event, data, stream, seq } for every joined room
+    this.rooms = new Map()
   }
 
   connect() {
@@ -14,11 +16,42 @@ class SocketService {
 
       this.socket.on('connect', () => {
         console.log('Connected to server')
+        // (Re)join every room, resuming from the last event we saw
+        this.rooms.forEach((state) => this.sendJoin(state))
       })
 
       this.socket.on('disconnect', () => {
         console.log('Disconnected from server')
       })
+
+      // Broadcasts carry { room, seq, stream } as their last argument. Runs
+      // before the event listeners; events that arrive while a join is in
+      // flight are held back until the snapshot has been applied.
+      this.socket.onAny((event, payload, meta) => {
+        const state = meta && this.rooms.get(meta.room)
+        if (!state) return
+        if (state.joining) {
+          state.pending.push([event, payload, meta.seq, meta.stream])
+          meta.accepted = false
+        } else {
+          meta.accepted = this.advance(state, meta.seq, meta.stream)
+        }
+      })
+
+      this.socket.on('joined', (info) => {
+        const state = this.rooms.get(info.room)
+        if (!state) return
+        state.stream = info.stream
+        if (info.snapshot !== undefined) {
+          state.seq = info.seq
+        }
+        // Resumed joins list the events we missed instead of a snapshot
+        const missed = [...(info.events || []), ...state.pending]
+        state.joining = false
+        state.pending = []
+        // Replay after the page's own 'joined' listener applied the snapshot
+        queueMicrotask(() => this.replay(state, missed))
+      })
     }
     return this.socket
   }
@@ -28,41 +61,77 @@ class SocketService {
       this.socket.disconnect()
       this.socket = null
     }
+    this.rooms.clear()
   }
 
-  joinOrganization(organizationId) {
-    if (this.socket) {
-      this.socket.emit('join_organization', { organization_id: organizationId })
+  advance(state, seq, stream) {
+    // Every worker numbers its own events; with a message queue a room gets
+    // events from several workers, and only those from the worker we joined
+    // through can be ordered against our position
+    if (stream !== state.stream) return true
+    if (state.seq !== undefined && seq <= state.seq) return false
+    state.seq = seq
+    return true
+  }
+
+  replay(state, events) {
+    // Missed events listed by a resumed join come from the stream we joined
+    events.forEach(([event, payload, seq, stream = state.stream]) => {
+      const meta = { room: state.room, seq, stream, accepted: this.advance(state, seq, stream) }
+      const callbacks = this.listeners.get(event) || []
+      callbacks.forEach(callback => callback(payload, meta))
+    })
+  }
+
+  join(room, event, data) {
+    const state = { room, event, data, pending: [] }
+    this.rooms.set(room, state)
+    if (this.socket && this.socket.connected) {
+      this.sendJoin(state)
     }
   }
 
+  sendJoin(state) {
+    state.joining = true
+    state.pending = []
+    const resume = state.stream ? { stream: state.stream, last_seq: state.seq } : {}
+    this.socket.emit(state.event, { ...state.data, ...resume })
+  }
+
+  joinOrganization(organizationId, token) {
+    this.join(`org_${organizationId}`, 'join_organization', { organization_id: organizationId, token })
+  }
+
   joinPublic(orgSlug) {
-    if (this.socket) {
-      this.socket.emit('join_public', { org_slug: orgSlug })
-    }
+    this.join(`public_${orgSlug}`, 'join_public', { org_slug: orgSlug })
   }
 
   on(event, callback) {
     if (this.socket) {
-      this.socket.on(event, callback)
-      
+      // Skip broadcasts that are already reflected in the joined snapshot
+      const wrapped = (payload, meta) => {
+        if (meta && meta.accepted === false) return
+        callback(payload, meta)
+      }
+      this.socket.on(event, wrapped)
+
       // Store the listener for cleanup
       if (!this.listeners.has(event)) {
         this.listeners.set(event, [])
       }
-      this.listeners.get(event).push(callback)
+      this.listeners.get(event).push(wrapped)
+      wrapped.original = callback
     }
   }
 
   off(event, callback) {
     if (this.socket) {
-      this.socket.off(event, callback)
-      
       // Remove from stored listeners
       const eventListeners = this.listeners.get(event)
       if (eventListeners) {
-        const index = eventListeners.indexOf(callback)
+        const index = eventListeners.findIndex(wrapped => wrapped.original === callback)
         if (index > -1) {
+          this.socket.off(event, eventListeners[index])
           eventListeners.splice(index, 1)
         }
       }